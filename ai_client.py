@@ -0,0 +1,287 @@
+"""
+Shared OpenAI client with per-operation deadlines, bounded retries and a
+circuit breaker.
+
+One client per worker process is reused by every call site, so HTTP
+connections are pooled instead of re-established per call. Each operation
+gets its own timeout and retry budget (``OPENAI_TIMEOUT_<OP>`` seconds and
+``OPENAI_RETRIES_<OP>``, e.g. OPENAI_TIMEOUT_CHAT=30):
+
+    with openai_request('moderations') as client:
+        result = client.moderations.create(...)
+
+The circuit breaker opens after OPENAI_BREAKER_FAILURES consecutive provider
+failures (timeouts, connection errors, 429 and 5xx responses). While it is
+open `openai_request` raises `AIUnavailable` immediately, so callers drop to
+their existing fallbacks without waiting on a degraded provider. After
+OPENAI_BREAKER_RESET_SECONDS one probe call is let through (half-open); its
+outcome closes or re-opens the breaker. State and counters are per worker and
+shown on the admin page and in /metrics.
+
+`submit_ai_call` runs an independent call (e.g. moderation) on a small
+bounded thread pool (AI_POOL_SIZE, default 4; 0 disables it) so it can
+overlap with work in the request thread. When the pool is busy the call runs
+inline instead of queueing behind other requests.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from metrics import record_circuit_event, track_outbound
+
+# Optional AI provider (OpenAI)
+try:
+    from openai import OpenAI  # type: ignore
+except Exception:  # pragma: no cover
+    OpenAI = None
+
+# operation -> (timeout seconds, retries)
+OPERATION_DEFAULTS = {
+    'embeddings': (10.0, 2),
+    'moderations': (5.0, 1),
+    # Retrying a slow completion doubles the wait; fail over to the fallback instead
+    'chat': (30.0, 0),
+}
+
+
+class AIUnavailable(RuntimeError):
+    """No OpenAI client is configured, or the circuit breaker is open."""
+
+
+def _operation_settings(operation: str):
+    timeout, retries = OPERATION_DEFAULTS.get(operation, (10.0, 1))
+    key = operation.upper()
+    return (
+        float(os.getenv(f'OPENAI_TIMEOUT_{key}', timeout)),
+        int(os.getenv(f'OPENAI_RETRIES_{key}', retries)),
+    )
+
+
+def _is_provider_failure(exc: Exception) -> bool:
+    """Whether an error says the provider is degraded (vs. a bad request of ours)."""
+    status = getattr(exc, 'status_code', None)
+    if status is None:
+        # Timeouts, connection errors and anything without an HTTP status
+        return True
+    return status == 429 or status >= 500
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probing = False
+        self.counts = {
+            'success': 0, 'failure': 0, 'client_error': 0, 'rejected': 0,
+            'opened': 0, 'half_opened': 0, 'closed': 0,
+        }
+
+    def _transition(self, state):
+        self.state = state
+        event = {self.OPEN: 'opened', self.HALF_OPEN: 'half_opened', self.CLOSED: 'closed'}[state]
+        self.counts[event] += 1
+        record_circuit_event(self.name, event, state)
+
+    def allow(self) -> bool:
+        """Reserve a call; False means fail fast."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.counts['rejected'] += 1
+        record_circuit_event(self.name, 'rejected')
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self.counts['success'] += 1
+            self.consecutive_failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+        record_circuit_event(self.name, 'success')
+
+    def record_failure(self, exc: Exception):
+        if not _is_provider_failure(exc):
+            # The provider answered; our request was at fault
+            with self._lock:
+                self.counts['client_error'] += 1
+                self.consecutive_failures = 0
+                self._probing = False
+                if self.state == self.HALF_OPEN:
+                    self._transition(self.CLOSED)
+            record_circuit_event(self.name, 'client_error')
+            return
+        with self._lock:
+            self.counts['failure'] += 1
+            self.consecutive_failures += 1
+            self.last_error = type(exc).__name__
+            self._probing = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                self._transition(self.OPEN)
+        record_circuit_event(self.name, 'failure')
+
+    def release(self):
+        """Give back a reservation that ended without a verdict (e.g. an abandoned stream)."""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'open_for_s': round(time.monotonic() - self.opened_at, 1) if self.state == self.OPEN else None,
+                'last_error': self.last_error,
+                **self.counts,
+            }
+
+
+breaker = CircuitBreaker(
+    'openai',
+    failure_threshold=int(os.getenv('OPENAI_BREAKER_FAILURES', '5')),
+    reset_seconds=float(os.getenv('OPENAI_BREAKER_RESET_SECONDS', '30')),
+)
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+_override = None
+_operation_clients = {}
+
+
+def get_openai_client():
+    """This process's shared OpenAI client, or None when OpenAI isn't configured."""
+    global _client, _client_pid
+    if _override is not None:
+        return _override
+    if not (OpenAI and os.getenv('OPENAI_API_KEY')):
+        return None
+    # Connection pools don't survive fork; build one client per worker process
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _operation_clients.clear()
+                _client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=1, timeout=10.0)
+                _client_pid = os.getpid()
+    return _client
+
+
+def set_openai_client(client):
+    """Override the client (tests, benchmarks); None restores the default."""
+    global _override
+    with _lock:
+        _override = client
+        _operation_clients.clear()
+
+
+def ai_enabled() -> bool:
+    return get_openai_client() is not None
+
+
+def _client_for(operation: str):
+    client = get_openai_client()
+    if client is None:
+        return None
+    cached = _operation_clients.get(operation)
+    if cached is None or cached[0] is not client:
+        timeout, retries = _operation_settings(operation)
+        # with_options() copies the client but shares its HTTP connection pool
+        configured = client.with_options(timeout=timeout, max_retries=retries) if hasattr(client, 'with_options') else client
+        cached = (client, configured)
+        _operation_clients[operation] = cached
+    return cached[1]
+
+
+@contextmanager
+def openai_request(operation: str):
+    """Yield a client configured for `operation`, guarded by the circuit breaker.
+
+    Raises AIUnavailable without calling out when OpenAI isn't configured or
+    the breaker is open.
+    """
+    client = _client_for(operation)
+    if client is None:
+        raise AIUnavailable('OpenAI is not configured')
+    if not breaker.allow():
+        raise AIUnavailable('OpenAI circuit breaker is open')
+    try:
+        with track_outbound('openai', operation):
+            yield client
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    except BaseException:
+        # GeneratorExit from a client disconnecting mid-stream says nothing about the provider
+        breaker.release()
+        raise
+    breaker.record_success()
+
+
+def ai_client_stats() -> dict:
+    """Circuit breaker state and counters for this worker plus the active timeouts."""
+    stats = breaker.snapshot()
+    stats['configured'] = ai_enabled()
+    stats['operations'] = {op: _operation_settings(op) for op in OPERATION_DEFAULTS}
+    return stats
+
+
+_pool = None
+_pool_slots = None
+
+
+def configure_ai_pool(size: int):
+    """(Re)create the AI call pool with `size` threads; 0 runs every call inline."""
+    global _pool, _pool_slots
+    old = _pool
+    # Threads start lazily on first submit, so creating the pool before fork is safe
+    _pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix='ai-call') if size > 0 else None
+    _pool_slots = threading.BoundedSemaphore(max(size, 1))
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+configure_ai_pool(int(os.getenv('AI_POOL_SIZE', '4')))
+
+
+def submit_ai_call(fn, *args, **kwargs) -> Future:
+    """Start fn on the AI pool and return its Future; runs inline when the pool is full.
+
+    fn runs without the Flask app/request context, so it must not touch the DB.
+    """
+    pool, slots = _pool, _pool_slots
+    if pool is not None and slots.acquire(blocking=False):
+        try:
+            future = pool.submit(fn, *args, **kwargs)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
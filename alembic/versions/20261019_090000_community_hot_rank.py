@@ -0,0 +1,58 @@
+"""Precomputed hot_rank for community posts
+
+Revision ID: 20261019_090000
+Revises: 20250925_130300
+Create Date: 2026-10-19 09:00:00
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261019_090000'
+down_revision = '20250925_130300'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('community_post') as batch_op:
+        batch_op.add_column(sa.Column('hot_rank', sa.Float(), nullable=False, server_default='0'))
+    op.create_index('ix_community_post_status_hot_rank', 'community_post', ['status', 'hot_rank'])
+    op.create_index('ix_community_post_tags_tag_id', 'community_post_tags', ['tag_id', 'post_id'])
+
+    # Backfill existing rows with one set-based UPDATE. The formula is frozen here
+    # as of this revision (models.compute_hot_rank may change later):
+    #   sign(e) * log10(max(|e|, 1)) + (created_at - 2025-01-01) / 45000s, e = score + 0.5 * comments
+    bind = op.get_bind()
+    posts = sa.table(
+        'community_post',
+        sa.column('score', sa.Integer), sa.column('comment_count', sa.Integer),
+        sa.column('created_at', sa.DateTime), sa.column('hot_rank', sa.Float),
+    )
+    engagement = sa.func.coalesce(posts.c.score, 0) + 0.5 * sa.func.coalesce(posts.c.comment_count, 0)
+    created_at = sa.func.coalesce(posts.c.created_at, sa.literal(datetime.utcnow(), sa.DateTime))
+    dialect = bind.dialect.name
+    if dialect in ('postgresql', 'postgres'):
+        log10 = sa.func.log  # base 10 in PostgreSQL
+        seconds = sa.extract('epoch', created_at) - 1735689600
+    elif dialect == 'mysql':
+        log10 = sa.func.log10
+        seconds = sa.func.timestampdiff(sa.text('SECOND'), '2025-01-01 00:00:00', created_at)
+    else:
+        log10 = sa.func.log10
+        seconds = (sa.func.julianday(created_at) - 2460676.5) * 86400
+    order = log10(sa.case((sa.func.abs(engagement) > 1, sa.func.abs(engagement)), else_=1))
+    signed_order = sa.case((engagement > 0, order), (engagement < 0, -order), else_=0)
+    bind.execute(posts.update().values(
+        hot_rank=sa.func.round(sa.cast(signed_order + seconds / 45000.0, sa.Numeric), 7)
+    ))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_community_post_tags_tag_id', table_name='community_post_tags')
+    op.drop_index('ix_community_post_status_hot_rank', table_name='community_post')
+    with op.batch_alter_table('community_post') as batch_op:
+        batch_op.drop_column('hot_rank')
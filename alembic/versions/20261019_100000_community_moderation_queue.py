@@ -0,0 +1,34 @@
+"""Queued moderation state for community posts and comments
+
+Revision ID: 20261019_100000
+Revises: 20261019_090000
+Create Date: 2026-10-19 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261019_100000'
+down_revision = '20261019_090000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('community_post') as batch_op:
+        batch_op.add_column(sa.Column('moderated_at', sa.DateTime(), nullable=True))
+    with op.batch_alter_table('community_comment') as batch_op:
+        # Existing comments were moderated synchronously before they were saved
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=False, server_default='published'))
+        batch_op.add_column(sa.Column('moderated_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_community_comment_status', 'community_comment', ['status', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_community_comment_status', table_name='community_comment')
+    with op.batch_alter_table('community_comment') as batch_op:
+        batch_op.drop_column('moderated_at')
+        batch_op.drop_column('status')
+    with op.batch_alter_table('community_post') as batch_op:
+        batch_op.drop_column('moderated_at')
@@ -0,0 +1,32 @@
+"""Server-side session store
+
+Revision ID: 20261019_110000
+Revises: 20261019_100000
+Create Date: 2026-10-19 11:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261019_110000'
+down_revision = '20261019_100000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'server_session',
+        sa.Column('id', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_server_session_expires_at', 'server_session', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_server_session_expires_at', table_name='server_session')
+    op.drop_table('server_session')
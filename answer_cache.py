@@ -0,0 +1,208 @@
+"""
+Semantic answer cache for the AI assistant.
+
+Questions are embedded with the configured embedding provider (see
+embeddings.py) and compared by cosine similarity with previously answered
+ones. A cached answer is reused when the same question was asked before
+(compared after lower-casing and collapsing whitespace) or the best match
+scores at least ASSISTANT_CACHE_THRESHOLD (default 0.95), and it is younger
+than ASSISTANT_CACHE_TTL seconds (default 6h). A hit skips retrieval and the
+chat completion; the new question is still moderated. The embedding is of
+the question as asked, and is reused for retrieval on a miss.
+
+Each entry remembers the ``updated_at`` of every product and post in its
+context; a hit re-reads those timestamps (one small query per kind) and is
+discarded if anything changed or disappeared, so edits to prices, copy or
+publish status are never answered from stale context.
+
+Only answers produced by the chat model are cached, never the offline
+fallback. The cache is per worker process, bounded to
+ASSISTANT_CACHE_MAX_ENTRIES (least recently used evicted), and disabled with
+ASSISTANT_CACHE_ENABLED=false or when no embedding provider is configured.
+Hit ratio and latency saved are shown on the admin page.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from embeddings import get_embedding_provider
+from models import db, Post, Product
+
+# Optional: vectorised similarity scan (installed alongside pgvector)
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None
+
+
+def normalise_question(text: str) -> str:
+    """Exact-match cache key: case and whitespace differences don't count."""
+    return ' '.join(text.lower().split())
+
+
+def _normalise(vec):
+    norm = math.sqrt(sum(v * v for v in vec))
+    return [v / norm for v in vec] if norm else list(vec)
+
+
+class _Entry:
+    __slots__ = ('question', 'answer', 'context', 'refs', 'vector', 'created', 'cost_ms')
+
+    def __init__(self, question, answer, context, refs, vector, cost_ms):
+        self.question = question
+        self.answer = answer
+        self.context = context
+        self.refs = refs
+        self.vector = vector
+        self.created = time.monotonic()
+        self.cost_ms = cost_ms
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = 0.95, ttl: float = 21600.0, max_entries: int = 512):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_question = {}  # normalise_question(text) -> key
+        self._next_key = 0
+        # numpy rows for _matrix_keys; rebuilt lazily after inserts/evictions
+        self._matrix = None
+        self._matrix_keys = None
+        self.counts = {'lookups': 0, 'hits': 0, 'misses': 0, 'stale': 0, 'expired': 0, 'stores': 0}
+        self.saved_ms = 0.0
+        self.lookup_ms = 0.0
+
+    # -- similarity ----------------------------------------------------
+
+    def _best_match(self, vector):
+        """(key, score) of the most similar live entry; call with the lock held."""
+        if not self._entries:
+            return None, 0.0
+        if np is not None:
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.array([self._entries[k].vector for k in self._matrix_keys], dtype=np.float32)
+            scores = self._matrix @ np.asarray(vector, dtype=np.float32)
+            i = int(scores.argmax())
+            return self._matrix_keys[i], float(scores[i])
+        best_key, best = None, -1.0
+        for key, entry in self._entries.items():
+            score = sum(a * b for a, b in zip(entry.vector, vector))
+            if score > best:
+                best_key, best = key, score
+        return best_key, best
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            question = normalise_question(entry.question)
+            if self._by_question.get(question) == key:
+                del self._by_question[question]
+        self._matrix = None
+
+    # -- public API ----------------------------------------------------
+
+    def lookup(self, vector, question: str | None = None):
+        """A fresh cached _Entry for this question (text and/or embedding), or None."""
+        started = time.perf_counter()
+        with self._lock:
+            self.counts['lookups'] += 1
+            key = self._by_question.get(normalise_question(question)) if question else None
+            if key is None and vector is not None:
+                key, score = self._best_match(_normalise(vector))
+                if score < self.threshold:
+                    key = None
+            entry = self._entries.get(key) if key is not None else None
+            if entry is not None and time.monotonic() - entry.created > self.ttl:
+                self._drop(key)
+                self.counts['expired'] += 1
+                entry = None
+        if entry is not None and not _refs_current(entry.refs):
+            with self._lock:
+                self._drop(key)
+                self.counts['stale'] += 1
+            entry = None
+        with self._lock:
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            self.lookup_ms += elapsed_ms
+            if entry is None:
+                self.counts['misses'] += 1
+                return None
+            self.counts['hits'] += 1
+            self.saved_ms += max(0.0, entry.cost_ms - elapsed_ms)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return entry
+
+    def store(self, vector, question, answer, context, products, posts, cost_ms):
+        refs = {
+            'product': {p.id: p.updated_at for p in products},
+            'post': {post.id: post.updated_at for post in posts},
+        }
+        entry = _Entry(question, answer, context, refs, _normalise(vector), cost_ms)
+        with self._lock:
+            self._next_key += 1
+            self._entries[self._next_key] = entry
+            self._by_question[normalise_question(question)] = self._next_key
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            self._matrix = None
+            self.counts['stores'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_question.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counts['lookups']
+            hits = self.counts['hits']
+            return {
+                **self.counts,
+                'entries': len(self._entries),
+                'hit_ratio': hits / lookups if lookups else None,
+                'saved_ms_total': self.saved_ms,
+                'saved_ms_avg': self.saved_ms / hits if hits else None,
+                'lookup_ms_avg': self.lookup_ms / lookups if lookups else None,
+                'threshold': self.threshold,
+                'ttl': self.ttl,
+            }
+
+
+def _refs_current(refs) -> bool:
+    """Whether every product/post behind a cached answer is unchanged."""
+    for model, ids in ((Product, refs['product']), (Post, refs['post'])):
+        if not ids:
+            continue
+        current = dict(db.session.query(model.id, model.updated_at).filter(model.id.in_(list(ids))).all())
+        if current != ids:
+            return False
+    return True
+
+
+answer_cache = AnswerCache(
+    threshold=float(os.getenv('ASSISTANT_CACHE_THRESHOLD', '0.95')),
+    ttl=float(os.getenv('ASSISTANT_CACHE_TTL', '21600')),
+    max_entries=int(os.getenv('ASSISTANT_CACHE_MAX_ENTRIES', '512')),
+)
+
+
+def embed_question(text: str):
+    """Embedding for a question, or None when the cache can't be used."""
+    if os.getenv('ASSISTANT_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+    provider = get_embedding_provider()
+    if provider is None:
+        return None
+    try:
+        # As asked: the same vector drives retrieval, where case can matter (e.g. product names)
+        return provider.embed_one(text.strip())
+    except Exception:
+        return None
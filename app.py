@@ -1,32 +1,39 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, session
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, session, g, Response, stream_with_context, abort, send_file, after_this_request
 from flask_login import login_required, current_user, login_user, logout_user, LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect, generate_csrf
+from werkzeug.local import LocalProxy
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from auth import google_auth, login_manager, create_or_update_user
 from models import (
     db, Post, Product, Category, CartItem, Order, OrderItem, Payment, User,
     PeptideCycle, DosageLog, ProgressEntry,
     CommunityPost, CommunityComment, CommunityVote, CommunityTag,
     FavoriteProduct, StockAlert, NewsletterSubscriber,
-    SearchDocument
+    SearchDocument, community_post_tags, compute_hot_rank
 )
+from summary_cache import get_cart_count, get_favorite_product_ids, refresh_user_summary
+from view_counter import view_counter
+from pagination import keyset_paginate, SortKey
+from embeddings import get_embedding_provider
+from ai_client import ai_client_stats, ai_enabled, openai_request, submit_ai_call
+from answer_cache import answer_cache, embed_question
 from dotenv import load_dotenv
 import re
 import os
+import json
+import time
+import click
+from contextlib import contextmanager
 import io
 import csv
-import requests
 import secrets
 import uuid
 import pymysql
 from datetime import datetime
 from sqlalchemy import or_, func, text, event
-
-# Optional AI provider (OpenAI)
-try:
-    from openai import OpenAI  # type: ignore
-except Exception:  # pragma: no cover
-    OpenAI = None
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, defer, joinedload, selectinload
 
 # Load environment variables
 load_dotenv()
@@ -50,6 +57,18 @@ app.config['WTF_CSRF_TIME_LIMIT'] = 3600  # 1 hour
 from models import db
 db.init_app(app)
 
+# Per-request SQL counts/timing, slow-query log and @query_budget checks (registered first so it runs last)
+from query_stats import init_query_stats, query_budget, db_stats
+init_query_stats(app)
+
+# Prometheus request/outbound/pool metrics and the token-protected /metrics endpoint
+from metrics import init_metrics, observe_stages
+init_metrics(app)
+
+# Opt-in sampling profiler (PROFILER_ENABLED); profiles are listed under /admin/profiles
+from profiling import init_profiling, get_profiler
+init_profiling(app)
+
 # Enable CSRF protection
 csrf = CSRFProtect(app)
 
@@ -65,23 +84,51 @@ app.jinja_env.filters['excerpt'] = excerpt_filter
 app.jinja_env.filters['reading_time'] = reading_time_filter
 app.jinja_env.filters['truncate'] = truncate_filter
 
+# Fingerprinted/precompressed static assets (static_url() helper + /assets route)
+from static_assets import init_static_assets
+init_static_assets(app)
+
+# Negotiated gzip/brotli compression for dynamic responses
+from compression import init_compression, compression_stats
+init_compression(app)
+
+# Transactional outbox for outbound API calls/emails, drained by `flask outbox-worker`
+from outbox import init_outbox, enqueue, outbox_stats
+init_outbox(app)
+
+# Back-in-stock emails: restocks enqueue a dispatch in the outbox (also `flask notify-stock`)
+from stock_alerts import init_stock_alerts
+init_stock_alerts(app)
+
+# Optional server-side session store (SESSION_BACKEND=database|memory); the cookie then holds only an id
+from server_sessions import init_server_sessions
+init_server_sessions(app)
+
 login_manager.init_app(app)
 
-# Global template context (inject cart count into all templates)
+# Global template context (cart count + favorites). These are LocalProxy objects so each
+# value is only fetched if a template actually reads it, and at most once per request.
+# Both come from summary_cache (one cached summary when Redis is configured, otherwise
+# a separate small query each, so the cart badge alone never loads favorites).
+def _request_memo(key, loader, default):
+    if key not in g:
+        try:
+            setattr(g, key, loader() if current_user.is_authenticated else default)
+        except Exception:
+            # Be resilient if DB/cache not reachable
+            setattr(g, key, default)
+    return getattr(g, key)
+
+def _load_cart_count():
+    return _request_memo('_cart_count', lambda: get_cart_count(current_user.id), 0)
+
+def _load_favorite_product_ids():
+    # Memoized as a set: templates test membership once per product in a loop
+    return _request_memo('_favorite_product_ids', lambda: set(get_favorite_product_ids(current_user.id)), set())
+
 @app.context_processor
 def inject_cart_count():
-    try:
-        if current_user.is_authenticated:
-            # Sum of quantities in the cart for the current user
-            count = db.session.query(func.coalesce(db.func.sum(CartItem.quantity), 0)).filter(
-                CartItem.user_id == current_user.id
-            ).scalar() or 0
-            return {"cart_count": int(count)}
-    except Exception:
-        # Be resilient if DB not reachable
-        pass
-
-    return {"cart_count": 0}
+    return {"cart_count": LocalProxy(_load_cart_count)}
 
 # Marketing config into templates
 @app.context_processor
@@ -94,17 +141,14 @@ def inject_marketing_config():
 # Favorites context for templates
 @app.context_processor
 def inject_favorites():
-    try:
-        if current_user.is_authenticated:
-            fav_ids = [fp.product_id for fp in FavoriteProduct.query.filter_by(user_id=current_user.id).all()]
-            return {"favorite_product_ids": set(fav_ids)}
-    except Exception:
-        pass
-    return {"favorite_product_ids": set()}
+    return {"favorite_product_ids": LocalProxy(_load_favorite_product_ids)}
 
 # Capture UTM parameters and referrer on first session hit
 @app.before_request
 def capture_utm_referrer():
+    # Static assets must stay cookie-free so browsers/CDNs can cache them
+    if request.endpoint in ('static', 'assets.asset'):
+        return
     try:
         if 'utm_captured' not in session:
             utm = {}
@@ -114,11 +158,18 @@ def capture_utm_referrer():
                     utm[key] = val
             if utm:
                 session['utm'] = utm
-            # Capture initial referrer
+            # Capture initial referrer; internal navigation isn't an acquisition source
             ref = request.headers.get('Referer') or request.headers.get('Referrer')
-            if ref:
+            if ref and not ref.startswith(request.host_url):
                 session['referrer'] = ref
-            session['utm_captured'] = True
+
+            @after_this_request
+            def mark_first_touch(response):
+                # First touch wins. Mark it when the session is being saved anyway, so a
+                # view that stores nothing still gets no cookie or session-store write.
+                if session.modified and session:
+                    session['utm_captured'] = True
+                return response
     except Exception:
         pass
 
@@ -142,6 +193,9 @@ def generate_order_number():
     """Generate unique order number"""
     return f"ORD-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
 
+# Buffered view counts for post/community detail pages
+view_counter.init_app(app)
+
 # Optionally auto-create tables in dev to avoid migration steps locally
 if os.getenv('AUTO_CREATE_TABLES', 'false').lower() == 'true':
     with app.app_context():
@@ -164,6 +218,7 @@ def init_pgvector():
 init_pgvector()
 
 @app.route('/')
+@query_budget(4)
 def index():
     # Fetch latest published posts for homepage blog section
     latest_posts = Post.query.filter_by(status='published').order_by(Post.created_at.desc()).limit(3).all()
@@ -191,8 +246,8 @@ def authorize():
             flash('Failed to get access token', 'error')
             return redirect(url_for('login'))
 
-        # Get user info
-        user_info = google_auth.get_user_info(token_response['access_token'])
+        # Profile from the verified ID token (userinfo API only as a fallback)
+        user_info = google_auth.user_info_from_token(token_response)
 
         # Create or update user
         user = create_or_update_user(user_info)
@@ -223,16 +278,20 @@ def logout():
 
 # Blog Posts Routes
 @app.route('/posts')
+@query_budget(4)
 def posts():
-    page = request.args.get('page', 1, type=int)
-    posts = Post.query.filter_by(status='published').order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=10, error_out=False
+    posts = keyset_paginate(
+        Post.query.filter_by(status='published').options(joinedload(Post.author)),
+        [SortKey(Post.created_at, desc=True), SortKey(Post.id, desc=True)],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=10, cursor_tag='posts',
     )
     return render_template('posts/index.html', posts=posts)
 
 @app.route('/posts/<slug>')
+@query_budget(8)
 def post_detail(slug):
-    post = Post.query.filter_by(slug=slug, status='published').first_or_404()
+    post = Post.query.options(joinedload(Post.author)).filter_by(slug=slug, status='published').first_or_404()
 
     # Get related posts based on content similarity and tags
     related_posts = get_related_posts(post, limit=3)
@@ -248,12 +307,8 @@ def post_detail(slug):
         Post.created_at > post.created_at
     ).order_by(Post.created_at.asc()).first()
 
-    # Increment view count (best-effort)
-    try:
-        post.view_count = (post.view_count or 0) + 1
-        db.session.commit()
-    except Exception:
-        db.session.rollback()
+    # Count the view; flushed to the DB in batches by view_counter
+    view_counter.incr('post', post.id)
 
     return render_template(
         'posts/detail.html',
@@ -263,23 +318,32 @@ def post_detail(slug):
         next_post=next_post
     )
 
+def _vector_provider():
+    """Embedding provider when vector search is usable (pgvector on Postgres), else None."""
+    if db.engine.dialect.name not in ('postgresql', 'postgres'):
+        return None
+    return get_embedding_provider()
+
+# Texts per embedding request when (re)indexing
+EMBED_BATCH_SIZE = 64
+
 def get_related_posts(current_post, limit=3):
     """Get related posts using pgvector if available, else keyword similarity."""
     # Try vector-based retrieval from SearchDocument when using Postgres + pgvector
-    if OpenAI and os.getenv('OPENAI_API_KEY') and db.engine.dialect.name in ('postgresql', 'postgres'):
+    provider = _vector_provider()
+    if provider is not None:
         try:
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            embed_model = os.getenv('OPENAI_EMBED_MODEL', 'text-embedding-3-small')
             seed = f"{current_post.title}\n{current_post.excerpt or ''}\n{current_post.content or ''}"
-            emb = client.embeddings.create(model=embed_model, input=seed).data[0].embedding
+            emb = provider.embed_one(seed)
             docs = (SearchDocument.query
                     .filter(SearchDocument.kind == 'post', SearchDocument.ref_id != current_post.id)
                     .order_by(SearchDocument.embedding.cosine_distance(emb))  # type: ignore
                     .limit(limit * 3)
                     .all())
+            refs = _load_search_refs(docs)
             related = []
             for d in docs:
-                p = Post.query.filter_by(id=d.ref_id, status='published').first()
+                p = refs.get(('post', d.ref_id))
                 if p and p.id != current_post.id and p not in related:
                     related.append(p)
                 if len(related) >= limit:
@@ -303,27 +367,29 @@ def get_related_posts(current_post, limit=3):
     scored_posts.sort(key=lambda x: x[1], reverse=True)
     return [post for post, score in scored_posts[:limit]]
 
-def get_relevant_content(query_text: str, top_n: int = 3):
-    """Return top_n relevant products and posts. Prefer vector search (pgvector) if available, else fallback to keyword similarity."""
-    use_vector = OpenAI and os.getenv('OPENAI_API_KEY') and db.engine.dialect.name in ('postgresql', 'postgres')
+def get_relevant_content(query_text: str, top_n: int = 3, embedding=None):
+    """Return top_n relevant products and posts. Prefer vector search (pgvector) if available, else fallback to keyword similarity.
 
-    if use_vector:
+    Pass `embedding` when the query has already been embedded with the configured provider.
+    """
+    provider = _vector_provider()
+
+    if provider is not None:
         try:
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            embed_model = os.getenv('OPENAI_EMBED_MODEL', 'text-embedding-3-small')
-            emb = client.embeddings.create(model=embed_model, input=query_text).data[0].embedding
+            emb = embedding if embedding is not None else provider.embed_one(query_text)
 
             # Order by cosine distance ascending (most similar first)
             docs = SearchDocument.query.order_by(SearchDocument.embedding.cosine_distance(emb)).limit(top_n * 4).all()  # type: ignore
 
+            refs = _load_search_refs(docs)
             prods, posts = [], []
             for d in docs:
                 if d.kind == 'product' and len(prods) < top_n:
-                    p = Product.query.filter_by(id=d.ref_id, status='active').first()
+                    p = refs.get(('product', d.ref_id))
                     if p:
                         prods.append(p)
                 elif d.kind == 'post' and len(posts) < top_n:
-                    post = Post.query.filter_by(id=d.ref_id, status='published').first()
+                    post = refs.get(('post', d.ref_id))
                     if post:
                         posts.append(post)
                 if len(prods) >= top_n and len(posts) >= top_n:
@@ -356,28 +422,10 @@ def get_relevant_content(query_text: str, top_n: int = 3):
 
 def upsert_search_documents(limit: int | None = None):
     """Ensure SearchDocument rows exist with embeddings for active products, published posts, and community posts."""
-    if not (OpenAI and os.getenv('OPENAI_API_KEY') and db.engine.dialect.name in ('postgresql', 'postgres')):
+    provider = _vector_provider()
+    if provider is None:
         return 0
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    embed_model = os.getenv('OPENAI_EMBED_MODEL', 'text-embedding-3-small')
-
-    def ensure(kind: str, ref_id: int, title: str, slug: str, text_body: str):
-        doc = SearchDocument.query.filter_by(kind=kind, ref_id=ref_id).first()
-        if not doc:
-            doc = SearchDocument(kind=kind, ref_id=ref_id, title=title, slug=slug)
-            db.session.add(doc)
-        else:
-            doc.title = title
-            doc.slug = slug
-        emb = client.embeddings.create(model=embed_model, input=text_body).data[0].embedding
-        # Assign embedding vector
-        try:
-            doc.embedding = emb  # type: ignore
-        except Exception:
-            pass
-        return doc
 
-    count = 0
     products = Product.query.filter_by(status='active').all()
     posts = Post.query.filter_by(status='published').all()
     cposts = CommunityPost.query.filter_by(status='published').all()
@@ -386,27 +434,42 @@ def upsert_search_documents(limit: int | None = None):
         posts = posts[:limit]
         cposts = cposts[:limit]
 
+    items = []  # (kind, ref_id, title, slug, text to embed)
     for p in products:
-        body = f"{p.name}\n{p.short_description or ''}\n{p.description or ''}"
-        ensure('product', p.id, p.name, p.slug, body)
-        count += 1
+        items.append(('product', p.id, p.name, p.slug, f"{p.name}\n{p.short_description or ''}\n{p.description or ''}"))
     for post in posts:
-        body = f"{post.title}\n{post.excerpt or ''}\n{post.content or ''}"
-        ensure('post', post.id, post.title, post.slug, body)
-        count += 1
+        items.append(('post', post.id, post.title, post.slug, f"{post.title}\n{post.excerpt or ''}\n{post.content or ''}"))
     for cp in cposts:
-        body = f"{cp.title}\n{cp.content or ''}"
-        ensure('community', cp.id, cp.title, cp.slug, body)
-        count += 1
+        items.append(('community', cp.id, cp.title, cp.slug, f"{cp.title}\n{cp.content or ''}"))
+
+    existing = {
+        (d.kind, d.ref_id): d
+        for d in SearchDocument.query.options(defer(SearchDocument.embedding)).all()
+    }
+    for start in range(0, len(items), EMBED_BATCH_SIZE):
+        batch = items[start:start + EMBED_BATCH_SIZE]
+        vectors = provider.embed([body for *_, body in batch])
+        for (kind, ref_id, title, slug, _), emb in zip(batch, vectors):
+            doc = existing.get((kind, ref_id))
+            if not doc:
+                doc = SearchDocument(kind=kind, ref_id=ref_id, title=title, slug=slug)
+                db.session.add(doc)
+            else:
+                doc.title = title
+                doc.slug = slug
+            # Assign embedding vector
+            try:
+                doc.embedding = emb  # type: ignore
+            except Exception:
+                pass
     db.session.commit()
-    return count
+    return len(items)
 
 def upsert_single_document(kind: str, ref_id: int):
     """Upsert a single SearchDocument row + embedding for a given kind/id."""
-    if not (OpenAI and os.getenv('OPENAI_API_KEY') and db.engine.dialect.name in ('postgresql', 'postgres')):
+    provider = _vector_provider()
+    if provider is None:
         return False
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    embed_model = os.getenv('OPENAI_EMBED_MODEL', 'text-embedding-3-small')
 
     if kind == 'product':
         p = Product.query.get(ref_id)
@@ -436,7 +499,7 @@ def upsert_single_document(kind: str, ref_id: int):
     else:
         doc.title = title
         doc.slug = slug
-    emb = client.embeddings.create(model=embed_model, input=body).data[0].embedding
+    emb = provider.embed_one(body)
     try:
         doc.embedding = emb  # type: ignore
     except Exception:
@@ -477,6 +540,9 @@ def newsletter_subscribe():
     sub.unsubscribed_at = None
     if not getattr(sub, 'unsubscribe_token', None):
         sub.unsubscribe_token = secrets.token_hex(16)
+    # Add to the Mailgun list via the outbox: committed with the subscriber, sent by `flask outbox-worker`
+    if os.getenv('MAILGUN_API_KEY') and os.getenv('MAILGUN_LIST_ADDRESS'):
+        enqueue('mailgun.list_member', {'address': email, 'name': name})
     try:
         db.session.commit()
     except Exception:
@@ -486,26 +552,6 @@ def newsletter_subscribe():
         flash('Subscription failed. Please try again later.', 'error')
         return redirect(request.referrer or url_for('posts'))
 
-    # Optional: add to Mailgun list if configured
-    try:
-        mg_key = os.getenv('MAILGUN_API_KEY')
-        mg_list = os.getenv('MAILGUN_LIST_ADDRESS')
-        if mg_key and mg_list:
-            requests.post(
-                f"https://api.mailgun.net/v3/lists/{mg_list}/members",
-                auth=("api", mg_key),
-                data={
-                    'address': email,
-                    'name': name,
-                    'subscribed': 'yes',
-                    'upsert': 'yes'
-                },
-                timeout=8
-            )
-    except Exception:
-        # Ignore provider errors silently in app flow
-        pass
-
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({'success': True})
     flash('Subscribed! Please check your inbox for updates.', 'success')
@@ -595,7 +641,8 @@ def robots_txt():
     return Response("\n".join(lines), mimetype='text/plain')
 
 # Auto-embed on changes to Product/Post using session events
-if os.getenv('AUTO_EMBED', 'true').lower() == 'true':
+AUTO_EMBED = os.getenv('AUTO_EMBED', 'true').lower() == 'true'
+if AUTO_EMBED:
     @event.listens_for(db.session, 'after_flush')
     def _collect_changed_objects(session, flush_context):
         ids = session.info.setdefault('auto_embed_ids', {
@@ -662,19 +709,39 @@ if os.getenv('AUTO_EMBED', 'true').lower() == 'true':
 
 def _vector_search_documents(query_text: str, limit: int = 30):
     """Return SearchDocument rows ordered by vector similarity if available, else empty list."""
-    if not (OpenAI and os.getenv('OPENAI_API_KEY') and db.engine.dialect.name in ('postgresql', 'postgres')):
+    provider = _vector_provider()
+    if provider is None:
         return []
     try:
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        embed_model = os.getenv('OPENAI_EMBED_MODEL', 'text-embedding-3-small')
-        emb = client.embeddings.create(model=embed_model, input=query_text).data[0].embedding
+        emb = provider.embed_one(query_text)
         return SearchDocument.query.order_by(
             SearchDocument.embedding.cosine_distance(emb)  # type: ignore
         ).limit(limit).all()
     except Exception:
         return []
 
+def _load_search_refs(docs):
+    """Fetch the live rows behind SearchDocument hits with one query per kind, keyed by (kind, id)."""
+    ids_by_kind = {}
+    for d in docs:
+        ids_by_kind.setdefault(d.kind, set()).add(d.ref_id)
+    sources = {
+        'product': Product.query.options(joinedload(Product.category)).filter(Product.status == 'active'),
+        'post': Post.query.filter(Post.status == 'published'),
+        'community': CommunityPost.query.filter(CommunityPost.status == 'published'),
+    }
+    refs = {}
+    for kind, ids in ids_by_kind.items():
+        query = sources.get(kind)
+        if query is None:
+            continue
+        model = query.column_descriptions[0]['entity']
+        for obj in query.filter(model.id.in_(ids)):
+            refs[(kind, obj.id)] = obj
+    return refs
+
 @app.route('/search')
+@query_budget(10)
 def search():
     q = request.args.get('q', '', type=str).strip()
     type_filter = request.args.get('type', 'all')  # all | product | post | community
@@ -714,7 +781,7 @@ def search():
             # Fallback keyword search
             kw = extract_keywords(q)
             # rank products
-            for p in Product.query.filter_by(status='active').all():
+            for p in Product.query.options(joinedload(Product.category)).filter_by(status='active').all():
                 txt = f"{p.name} {p.short_description or ''} {p.description or ''} {p.sku} {(p.category.name if p.category else '')}"
                 score = calculate_similarity(kw, extract_keywords(txt))
                 if score > 0 and (type_filter in ('all', 'product')) and product_passes_filters(p):
@@ -770,9 +837,10 @@ def search():
             results.sort(key=lambda r: r.get('score') or 0, reverse=True)
         else:
             # Build results from vector docs, preserving order initially
+            refs = _load_search_refs(docs)
             for d in docs:
                 if d.kind == 'product' and type_filter in ('all', 'product'):
-                    p = Product.query.filter_by(id=d.ref_id, status='active').first()
+                    p = refs.get(('product', d.ref_id))
                     if p and product_passes_filters(p):
                         results.append({
                             'kind': 'product',
@@ -789,7 +857,7 @@ def search():
                         })
                         counts['product'] += 1
                 elif d.kind == 'post' and type_filter in ('all', 'post'):
-                    post = Post.query.filter_by(id=d.ref_id, status='published').first()
+                    post = refs.get(('post', d.ref_id))
                     if post:
                         results.append({
                             'kind': 'post',
@@ -802,7 +870,7 @@ def search():
                         })
                         counts['post'] += 1
                 elif d.kind == 'community' and type_filter in ('all', 'community'):
-                    cp = CommunityPost.query.filter_by(id=d.ref_id, status='published').first()
+                    cp = refs.get(('community', d.ref_id))
                     if cp:
                         results.append({
                             'kind': 'community',
@@ -857,7 +925,10 @@ def admin_index():
         'search_documents': SearchDocument.query.count(),
         'subscribers': NewsletterSubscriber.query.count(),
     }
-    return render_template('admin/index.html', stats=stats)
+    return render_template('admin/index.html', stats=stats, compression=compression_stats(), db_costs=db_stats(),
+                           ai=ai_client_stats(), answer_cache=answer_cache.stats(),
+                           moderation=moderation_queue_stats(),
+                           outbox=outbox_stats())
 
 @app.route('/admin/clear_index', methods=['POST'])
 @login_required
@@ -896,6 +967,26 @@ def admin_export_subscribers():
         headers={'Content-Disposition': 'attachment; filename="newsletter_subscribers.csv"'}
     )
 
+@app.route('/admin/profiles')
+@login_required
+def admin_profiles():
+    if getattr(current_user, 'role', '') != 'admin':
+        return render_template('errors/403.html'), 403
+    profiler = get_profiler()
+    profiles = profiler.list_profiles() if profiler else []
+    return render_template('admin/profiles.html', profiler=profiler, profiles=profiles)
+
+@app.route('/admin/profiles/<profile_id>')
+@login_required
+def admin_profile_download(profile_id):
+    if getattr(current_user, 'role', '') != 'admin':
+        return render_template('errors/403.html'), 403
+    profiler = get_profiler()
+    path = profiler.profile_path(profile_id) if profiler else None
+    if not path:
+        return render_template('errors/404.html'), 404
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=f"{profile_id}.collapsed")
+
 def extract_keywords(text):
     """Extract keywords from text"""
     if not text:
@@ -951,29 +1042,297 @@ def has_similar_theme(content1, content2):
 # Community Routes
 # ----------------------
 
+def _insert_ignore(table, values: dict) -> bool:
+    """INSERT a row unless it would violate a unique constraint; True if a row was inserted."""
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'postgres'):
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table).values(**values).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).values(**values).on_conflict_do_nothing()
+    elif dialect == 'mysql':
+        stmt = table.insert().values(**values).prefix_with('IGNORE')
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(**values))
+            return True
+        except IntegrityError:
+            return False
+    return db.session.execute(stmt).rowcount == 1
+
+def _bump_community_post(post_id: int, score: int = 0, comment_count: int = 0):
+    """Atomically shift a community post's counters (score = score + delta, ...) and
+    recompute its hot_rank. Returns the updated (score, comment_count) row."""
+    posts = CommunityPost.__table__
+    values = {}
+    if score:
+        values['score'] = func.coalesce(posts.c.score, 0) + score
+    if comment_count:
+        values['comment_count'] = func.coalesce(posts.c.comment_count, 0) + comment_count
+    if values:
+        # Counter changes are not content edits: keep updated_at (and the embedding hooks) out of it
+        values['updated_at'] = posts.c.updated_at
+        db.session.execute(posts.update().where(posts.c.id == post_id).values(**values))
+
+    # The UPDATE above holds the row lock, so this read sees every committed delta
+    row = db.session.execute(
+        db.select(posts.c.score, posts.c.comment_count, posts.c.created_at).where(posts.c.id == post_id)
+    ).first()
+    if row is not None and values:
+        db.session.execute(posts.update().where(posts.c.id == post_id).values(
+            hot_rank=compute_hot_rank(row.score, row.comment_count, row.created_at),
+            updated_at=posts.c.updated_at,
+        ))
+    return row
+
+def apply_community_vote(post_id: int, user_id: int, value: int) -> int:
+    """Add, flip or toggle off a user's vote and apply the score delta atomically.
+
+    Never aggregates over the votes table; the caller commits. Returns the new score.
+    """
+    votes = CommunityVote.__table__
+    existing_q = (db.select(votes.c.id, votes.c.value)
+                  .where(votes.c.post_id == post_id, votes.c.user_id == user_id)
+                  .with_for_update())
+    # The writes are conditional on what was read (compare-and-set), so a concurrent
+    # request from the same user can't make both apply a delta for the same vote even
+    # where FOR UPDATE is a no-op (SQLite); on a lost race, read again and retry.
+    for _ in range(3):
+        existing = db.session.execute(existing_q).first()
+        if existing is None:
+            if _insert_ignore(votes, {
+                'post_id': post_id, 'user_id': user_id, 'value': value, 'created_at': datetime.utcnow(),
+            }):
+                delta = value
+                break
+            continue  # a concurrent request from the same user inserted first; apply on top of it
+        same_vote = votes.c.id == existing.id, votes.c.value == existing.value
+        if existing.value == value:
+            # Same vote again toggles it off
+            stmt, new_delta = votes.delete().where(*same_vote), -value
+        else:
+            stmt, new_delta = votes.update().where(*same_vote).values(value=value), value - existing.value
+        if db.session.execute(stmt).rowcount == 1:
+            delta = new_delta
+            break
+    else:
+        raise RuntimeError(f'vote on community post {post_id} kept changing concurrently')
+
+    row = _bump_community_post(post_id, score=delta)
+    return int(row.score or 0) if row is not None else 0
+
+def recompute_hot_ranks(batch_size: int = 500) -> int:
+    """Recompute hot_rank for every community post (backfill / formula changes)."""
+    posts = CommunityPost.__table__
+    last_id, updated = 0, 0
+    while True:
+        rows = db.session.execute(
+            db.select(posts.c.id, posts.c.score, posts.c.comment_count, posts.c.created_at)
+            .where(posts.c.id > last_id).order_by(posts.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for r in rows:
+            db.session.execute(posts.update().where(posts.c.id == r.id).values(
+                hot_rank=compute_hot_rank(r.score, r.comment_count, r.created_at),
+                updated_at=posts.c.updated_at,
+            ))
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
+    return updated
+
+@app.cli.command('recompute-hot-ranks')
+def recompute_hot_ranks_command():
+    """Recompute CommunityPost.hot_rank for all posts."""
+    print(f"Recomputed hot_rank for {recompute_hot_ranks()} community posts")
+
+def _moderation_flags(texts: list) -> list:
+    """One moderation API call for several inputs; a flagged bool per input, in order."""
+    mod_model = os.getenv('OPENAI_MODERATION_MODEL', 'omni-moderation-latest')
+    with openai_request('moderations') as client:
+        mod = client.moderations.create(model=mod_model, input=texts)
+    if len(mod.results) != len(texts):
+        raise RuntimeError(f'moderation returned {len(mod.results)} results for {len(texts)} inputs')
+    return [bool(r.flagged) for r in mod.results]
+
+def moderate_pending(batch_size: int = 16) -> dict:
+    """Moderate one batch of pending community posts and comments, then publish or hide them.
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED (where the database supports it) so
+    several workers can drain the queue. If the moderation API fails the batch is
+    rolled back and stays pending.
+
+    A comment is only claimed once its post is published (or is in this batch), and
+    stays pending if its post is hidden here, so comment_count never counts comments
+    on posts nobody can see.
+    """
+    posts = (CommunityPost.query.filter_by(status='pending').order_by(CommunityPost.id)
+             .limit(batch_size).with_for_update(skip_locked=True).all())
+    post_ids = [p.id for p in posts]
+    comments = (CommunityComment.query.join(CommunityPost, CommunityComment.post_id == CommunityPost.id)
+                .filter(CommunityComment.status == 'pending',
+                        or_(CommunityPost.status == 'published', CommunityPost.id.in_(post_ids)))
+                .order_by(CommunityComment.id).limit(batch_size)
+                .with_for_update(of=CommunityComment, skip_locked=True).all())
+    items = posts + comments
+    counts = {'published': 0, 'hidden': 0}
+    if not items:
+        db.session.rollback()
+        return counts
+
+    if moderation_enabled():
+        texts = [f"{p.title}\n{p.content}" for p in posts] + [c.content for c in comments]
+        started = time.perf_counter()
+        try:
+            flags = _moderation_flags(texts)
+        except Exception:
+            db.session.rollback()
+            raise
+        app.logger.info('Moderated %d items in %.0f ms', len(texts), (time.perf_counter() - started) * 1000.0)
+    else:
+        # Moderation was switched off after these were queued; publish as the synchronous path would
+        flags = [False] * len(items)
+
+    now = datetime.utcnow()
+    published_post_ids = []
+    post_status = {}
+    for item, flagged in zip(items, flags):
+        if isinstance(item, CommunityComment) and post_status.get(item.post_id, 'published') != 'published':
+            # Its post was hidden in this batch; leave the comment pending with it
+            continue
+        item.status = 'hidden' if flagged else 'published'
+        item.moderated_at = now
+        counts[item.status] += 1
+        if not flagged and isinstance(item, CommunityComment):
+            _bump_community_post(item.post_id, comment_count=1)
+        elif isinstance(item, CommunityPost):
+            post_status[item.id] = item.status
+            if not flagged:
+                published_post_ids.append(item.id)
+    db.session.commit()
+
+    # Index newly published posts, as the synchronous path does (AUTO_EMBED does it on commit)
+    if not AUTO_EMBED:
+        for post_id in published_post_ids:
+            try:
+                upsert_single_document('community', post_id)
+            except Exception:
+                db.session.rollback()
+    return counts
+
+@app.cli.command('moderate-pending')
+@click.option('--batch-size', default=16, show_default=True, help='Posts and comments claimed per API call (each).')
+@click.option('--loop', is_flag=True, help='Keep polling for new pending items.')
+@click.option('--interval', default=5.0, show_default=True, help='Seconds between polls when the queue is empty.')
+def moderate_pending_command(batch_size, loop, interval):
+    """Moderate queued community posts/comments (COMMUNITY_MODERATION_MODE=async)."""
+    delay = interval
+    while True:
+        try:
+            counts = moderate_pending(batch_size)
+            delay = interval
+        except Exception as e:
+            # Provider down or breaker open: back off, items stay pending
+            print(f"Moderation failed ({type(e).__name__}: {e}); retrying in {delay:.0f}s")
+            counts = None
+        if counts and (counts['published'] or counts['hidden']):
+            print(f"Published {counts['published']}, hid {counts['hidden']}")
+            continue  # drain the backlog before sleeping
+        if not loop:
+            break
+        time.sleep(delay)
+        if counts is None:
+            delay = min(delay * 2, 60.0)
+
+def moderation_queue_stats(recent: int = 200) -> dict:
+    """Queue depth, age of the oldest pending item and time-to-moderation over the last `recent` items."""
+    pending_posts = CommunityPost.query.filter_by(status='pending').count()
+    pending_comments = CommunityComment.query.filter_by(status='pending').count()
+    oldest = [
+        db.session.query(func.min(CommunityPost.created_at)).filter(CommunityPost.status == 'pending').scalar(),
+        db.session.query(func.min(CommunityComment.created_at)).filter(CommunityComment.status == 'pending').scalar(),
+    ]
+    oldest = min((o for o in oldest if o is not None), default=None)
+
+    done = []
+    for model in (CommunityPost, CommunityComment):
+        done.extend(
+            db.session.query(model.created_at, model.moderated_at, model.status)
+            .filter(model.moderated_at.isnot(None))
+            .order_by(model.moderated_at.desc()).limit(recent).all()
+        )
+    done = sorted(done, key=lambda r: r.moderated_at, reverse=True)[:recent]
+    waits = sorted(max(0.0, (r.moderated_at - r.created_at).total_seconds()) for r in done if r.created_at)
+    return {
+        'mode': 'async' if moderation_queued() else 'sync',
+        'pending_posts': pending_posts,
+        'pending_comments': pending_comments,
+        'oldest_pending_s': (datetime.utcnow() - oldest).total_seconds() if oldest else None,
+        'recent': len(done),
+        'hidden_recent': sum(1 for r in done if r.status == 'hidden'),
+        'wait_avg_s': sum(waits) / len(waits) if waits else None,
+        'wait_p95_s': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+    }
+
 @app.route('/community')
+@query_budget(6)
 def community_index():
-    page = request.args.get('page', 1, type=int)
     tag_slug = request.args.get('tag')
-    sort = request.args.get('sort', 'new')  # new, top
+    sort = request.args.get('sort', 'new')  # new, top, hot
 
-    query = CommunityPost.query.filter_by(status='published')
+    query = CommunityPost.query.filter_by(status='published').options(
+        joinedload(CommunityPost.user), selectinload(CommunityPost.tags)
+    )
     active_tag = None
     if tag_slug:
         active_tag = CommunityTag.query.filter_by(slug=tag_slug).first()
         if active_tag:
-            query = query.join(CommunityPost.tags).filter(CommunityTag.slug == tag_slug)
+            # Filter through the association table only (indexed on tag_id); no join to community_tag
+            query = query.join(community_post_tags, community_post_tags.c.post_id == CommunityPost.id).filter(
+                community_post_tags.c.tag_id == active_tag.id
+            )
 
-    if sort == 'top':
-        query = query.order_by(CommunityPost.score.desc(), CommunityPost.created_at.desc())
+    if sort == 'hot':
+        # Precomputed rank: an index range scan on (status, hot_rank)
+        keys = [SortKey(CommunityPost.hot_rank, desc=True), SortKey(CommunityPost.id, desc=True)]
+    elif sort == 'top':
+        keys = [SortKey(CommunityPost.score, desc=True), SortKey(CommunityPost.created_at, desc=True),
+                SortKey(CommunityPost.id, desc=True)]
     else:
-        query = query.order_by(CommunityPost.created_at.desc())
+        sort = 'new'
+        keys = [SortKey(CommunityPost.created_at, desc=True), SortKey(CommunityPost.id, desc=True)]
 
-    posts = query.paginate(page=page, per_page=10, error_out=False)
+    posts = keyset_paginate(
+        query, keys,
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=10, cursor_tag=f'community:{sort}',
+    )
     tags = CommunityTag.query.order_by(CommunityTag.name.asc()).all()
 
     return render_template('community/index.html', posts=posts, tags=tags, active_tag=active_tag, sort=sort)
 
+def moderation_enabled() -> bool:
+    return ai_enabled() and os.getenv('ENABLE_MODERATION', 'true').lower() == 'true'
+
+def moderation_queued() -> bool:
+    """COMMUNITY_MODERATION_MODE=async: save community content as pending and moderate it in the background."""
+    return os.getenv('COMMUNITY_MODERATION_MODE', 'sync').lower() == 'async' and moderation_enabled()
+
+def is_flagged(text: str) -> bool:
+    """Run text through the moderation API; fails open when it's disabled or unavailable."""
+    if not moderation_enabled():
+        return False
+    try:
+        mod_model = os.getenv('OPENAI_MODERATION_MODEL', 'omni-moderation-latest')
+        with openai_request('moderations') as client:
+            mod = client.moderations.create(model=mod_model, input=text)
+        return bool(mod.results and mod.results[0].flagged)
+    except Exception:
+        return False
+
 @app.route('/community/new', methods=['GET', 'POST'])
 @login_required
 def community_new():
@@ -986,17 +1345,11 @@ def community_new():
             flash('Title and content are required.', 'error')
             return redirect(url_for('community_new'))
 
-        # Moderation
-        if OpenAI and os.getenv('OPENAI_API_KEY') and os.getenv('ENABLE_MODERATION', 'true').lower() == 'true':
-            try:
-                client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-                mod_model = os.getenv('OPENAI_MODERATION_MODEL', 'omni-moderation-latest')
-                mod = client.moderations.create(model=mod_model, input=f"{title}\n{content}")
-                if mod.results and mod.results[0].flagged:
-                    flash('Your post appears to violate our content policy. Please revise.', 'error')
-                    return redirect(url_for('community_new'))
-            except Exception:
-                pass
+        # Moderation (queued: saved as pending and moderated by `flask moderate-pending`)
+        queued = moderation_queued()
+        if not queued and is_flagged(f"{title}\n{content}"):
+            flash('Your post appears to violate our content policy. Please revise.', 'error')
+            return redirect(url_for('community_new'))
 
         slug = unique_slug(title, CommunityPost)
         post = CommunityPost(
@@ -1004,6 +1357,7 @@ def community_new():
             title=title,
             slug=slug,
             content=content,
+            status='pending' if queued else 'published',
         )
 
         # Handle tags
@@ -1019,6 +1373,10 @@ def community_new():
         db.session.add(post)
         db.session.commit()
 
+        if queued:
+            flash('Thanks! Your post is visible to you now and will be published once it passes review.', 'success')
+            return redirect(url_for('community_detail', slug=post.slug))
+
         # Upsert into search documents (best-effort)
         try:
             upsert_search_documents(limit=None)
@@ -1032,25 +1390,30 @@ def community_new():
     return render_template('community/new.html', tags=tags)
 
 @app.route('/community/<slug>')
+@query_budget(6)
 def community_detail(slug):
-    post = CommunityPost.query.filter_by(slug=slug, status='published').first_or_404()
-
-    # Increment view count
-    try:
-        post.view_count = (post.view_count or 0) + 1
-        db.session.commit()
-    except Exception:
-        db.session.rollback()
+    post = CommunityPost.query.options(
+        joinedload(CommunityPost.user),
+        selectinload(CommunityPost.tags),
+        selectinload(CommunityPost.comments).joinedload(CommunityComment.user),
+    ).filter_by(slug=slug).first_or_404()
+
+    viewer_id = current_user.id if current_user.is_authenticated else None
+    if post.status != 'published':
+        # Authors can see their own queued (or hidden) posts; everyone else gets a 404
+        if post.status not in ('pending', 'hidden') or post.user_id != viewer_id:
+            abort(404)
+    else:
+        # Count the view; flushed to the DB in batches by view_counter
+        view_counter.incr('community', post.id)
 
-    # Compute current score if needed (sum of votes)
-    if post.votes:
-        post.score = sum(v.value for v in post.votes)
-        try:
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
+    comments = [
+        c for c in post.comments
+        if c.status == 'published' or (c.user_id == viewer_id and c.status in ('pending', 'hidden'))
+    ]
 
-    return render_template('community/detail.html', post=post)
+    # score/comment_count are maintained incrementally on write; never re-sum votes here
+    return render_template('community/detail.html', post=post, comments=comments)
 
 @app.route('/community/<slug>/comment', methods=['POST'])
 @login_required
@@ -1061,21 +1424,20 @@ def community_comment(slug):
         flash('Comment cannot be empty.', 'error')
         return redirect(url_for('community_detail', slug=slug))
 
-    # Moderation
-    if OpenAI and os.getenv('OPENAI_API_KEY') and os.getenv('ENABLE_MODERATION', 'true').lower() == 'true':
-        try:
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            mod_model = os.getenv('OPENAI_MODERATION_MODEL', 'omni-moderation-latest')
-            mod = client.moderations.create(model=mod_model, input=content)
-            if mod.results and mod.results[0].flagged:
-                flash('Your comment appears to violate our content policy. Please revise.', 'error')
-                return redirect(url_for('community_detail', slug=slug))
-        except Exception:
-            pass
+    # Moderation (queued: saved as pending and moderated by `flask moderate-pending`)
+    if moderation_queued():
+        db.session.add(CommunityComment(post_id=post.id, user_id=current_user.id, content=content, status='pending'))
+        db.session.commit()
+        flash('Comment added! Others will see it once it passes review.', 'success')
+        return redirect(url_for('community_detail', slug=slug))
+
+    if is_flagged(content):
+        flash('Your comment appears to violate our content policy. Please revise.', 'error')
+        return redirect(url_for('community_detail', slug=slug))
 
     comment = CommunityComment(post_id=post.id, user_id=current_user.id, content=content)
     db.session.add(comment)
-    post.comment_count = (post.comment_count or 0) + 1
+    _bump_community_post(post.id, comment_count=1)
     db.session.commit()
 
     flash('Comment added!', 'success')
@@ -1090,27 +1452,18 @@ def community_vote(slug):
         return jsonify({'success': False, 'error': 'Invalid vote value'}), 400
 
     value = 1 if action == 'up' else -1
-    vote = CommunityVote.query.filter_by(post_id=post.id, user_id=current_user.id).first()
-
-    if vote and vote.value == value:
-        # Toggle off
-        db.session.delete(vote)
-    elif vote:
-        vote.value = value
-    else:
-        vote = CommunityVote(post_id=post.id, user_id=current_user.id, value=value)
-        db.session.add(vote)
-
-    # Recompute score
-    db.session.flush()
-    new_score = db.session.query(func.coalesce(db.func.sum(CommunityVote.value), 0)).filter(
-        CommunityVote.post_id == post.id
-    ).scalar() or 0
-    post.score = int(new_score)
-    db.session.commit()
+    try:
+        score = apply_community_vote(post.id, current_user.id, value)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': False, 'error': 'Vote failed, please try again'}), 409
+        flash('Vote failed, please try again.', 'error')
+        return redirect(url_for('community_detail', slug=slug))
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify({'success': True, 'score': post.score})
+        return jsonify({'success': True, 'score': score})
     return redirect(url_for('community_detail', slug=slug))
 
 @app.route('/admin/reindex', methods=['POST'])
@@ -1129,12 +1482,18 @@ def admin_reindex():
 # AI Assistant
 # ----------------------
 
-def ai_generate_answer(message: str, products, posts) -> str:
-    disclaimer = (
-        "Important: I am an AI research assistant for educational purposes only. "
-        "I do not provide medical advice, diagnosis, or treatment. Always consult a qualified healthcare professional."
-    )
+# Signed streamed answers must be saved to history within this many seconds
+ASSISTANT_ANSWER_MAX_AGE = 600
+# Ids of saved streamed answers remembered per session, so a replayed token is not appended twice
+ASSISTANT_SAVED_IDS_KEEP = 50
 
+ASSISTANT_DISCLAIMER = (
+    "Important: I am an AI research assistant for educational purposes only. "
+    "I do not provide medical advice, diagnosis, or treatment. Always consult a qualified healthcare professional."
+)
+
+def _assistant_messages(message: str, products, posts) -> list:
+    """Chat messages for a question plus its retrieved products/posts."""
     # Build a simple context block
     ctx_lines = ["Context summary:"]
     if products:
@@ -1150,28 +1509,20 @@ def ai_generate_answer(message: str, products, posts) -> str:
             ctx_lines.append(f"- [{post.title}]({link}): {post.excerpt or ''}")
     context_text = "\n".join(ctx_lines)
 
-    if OpenAI and os.getenv('OPENAI_API_KEY'):
-        try:
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
-            messages = [
-                {"role": "system", "content": (
-                    "You are a helpful peptide research assistant for an ecommerce site. "
-                    "Follow these rules: \n"
-                    "- Do NOT provide medical advice. Include a disclaimer.\n"
-                    "- Be concise and cite relevant products/posts by name.\n"
-                    "- If unsure, ask a clarifying question."
-                )},
-                {"role": "user", "content": f"{disclaimer}\n\n{context_text}\n\nQuestion: {message}"}
-            ]
-            resp = client.chat.completions.create(model=model, messages=messages, temperature=0.2)
-            content = resp.choices[0].message.content
-            return content
-        except Exception:
-            pass
+    return [
+        {"role": "system", "content": (
+            "You are a helpful peptide research assistant for an ecommerce site. "
+            "Follow these rules: \n"
+            "- Do NOT provide medical advice. Include a disclaimer.\n"
+            "- Be concise and cite relevant products/posts by name.\n"
+            "- If unsure, ask a clarifying question."
+        )},
+        {"role": "user", "content": f"{ASSISTANT_DISCLAIMER}\n\n{context_text}\n\nQuestion: {message}"}
+    ]
 
-    # Fallback heuristic answer
-    parts = [disclaimer, "\nHere are some resources that might help:"]
+def _fallback_answer(products, posts) -> str:
+    """Heuristic answer used when the chat model is unavailable."""
+    parts = [ASSISTANT_DISCLAIMER, "\nHere are some resources that might help:"]
     if products:
         parts.append("Products:")
         for p in products:
@@ -1183,6 +1534,106 @@ def ai_generate_answer(message: str, products, posts) -> str:
     parts.append("\nIf you can share more specifics (goal, timeline, constraints), I can refine suggestions.")
     return "\n".join(parts)
 
+def _chat_answer(message: str, products, posts) -> str | None:
+    """The chat model's answer, or None when it is unavailable."""
+    if ai_enabled():
+        try:
+            model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+            messages = _assistant_messages(message, products, posts)
+            with openai_request('chat') as client:
+                resp = client.chat.completions.create(model=model, messages=messages, temperature=0.2)
+            content = resp.choices[0].message.content
+            return content
+        except Exception:
+            pass
+    return None
+
+def ai_generate_answer(message: str, products, posts) -> str:
+    return _chat_answer(message, products, posts) or _fallback_answer(products, posts)
+
+def _assistant_context(products, posts) -> dict:
+    """JSON-safe summary of the retrieved context (SSE `context` event, cache entries)."""
+    return {
+        'products': [
+            {'name': p.name, 'url': url_for('peptide_detail', slug=p.slug), 'price': float(p.sale_price or p.price)}
+            for p in products
+        ],
+        'posts': [{'title': post.title, 'url': url_for('post_detail', slug=post.slug)} for post in posts],
+    }
+
+def _stream_chat(messages):
+    """Yield answer text chunks from a streaming chat completion."""
+    model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+    with openai_request('chat') as client:
+        stream = client.chat.completions.create(model=model, messages=messages, temperature=0.2, stream=True)
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    # Stop nginx-style proxies from buffering the stream
+    'X-Accel-Buffering': 'no',
+}
+
+def _sse(event: str, data) -> str:
+    """One Server-Sent Events frame; data is JSON so newlines in tokens are safe."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _answer_serializer():
+    return URLSafeTimedSerializer(app.secret_key, salt='assistant-answer')
+
+def _append_assistant_history(user_message: str, answer: str):
+    # Maintain simple session history
+    history = session.get('assistant_history', [])
+    history.append({"role": "user", "content": user_message})
+    history.append({"role": "assistant", "content": answer})
+    session['assistant_history'] = history[-20:]  # cap history
+
+@contextmanager
+def _stage(timings: dict, name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - started
+
+def _timed(timings: dict, name: str, fn, *args):
+    with _stage(timings, name):
+        return fn(*args)
+
+def _assistant_prepare(user_message: str, timings: dict):
+    """Cache lookup, moderation and retrieval for one question.
+
+    Moderation doesn't depend on the other two, so it runs on the AI pool while
+    the lookup and retrieval run in this thread (which owns the DB session); a
+    cached answer is only returned, and the chat call only started, once the
+    verdict is in. Returns (cached_entry, flagged, products, posts, question_vec).
+    """
+    moderation = submit_ai_call(_timed, timings, 'moderation', is_flagged, user_message)
+
+    # Near-identical questions reuse a recent answer (see answer_cache)
+    with _stage(timings, 'embed'):
+        question_vec = embed_question(user_message)
+        cached = answer_cache.lookup(question_vec, user_message) if question_vec is not None else None
+    if cached is not None:
+        # The new question is moderated like any other, whatever the cached one was
+        with _stage(timings, 'moderation_wait'):
+            flagged = moderation.result()
+        return (None if flagged else cached), flagged, [], [], question_vec
+
+    with _stage(timings, 'retrieval'):
+        products, posts = get_relevant_content(user_message, top_n=3, embedding=question_vec)
+    with _stage(timings, 'moderation_wait'):
+        flagged = moderation.result()
+    return None, flagged, products, posts, question_vec
+
+def _record_assistant_timings(timings: dict, request_started: float):
+    timings['total'] = time.perf_counter() - request_started
+    observe_stages(request.endpoint or 'assistant', timings)
+    app.logger.debug('assistant stages %s', ' '.join(f"{k}={v * 1000:.1f}ms" for k, v in list(timings.items())))
+
 @app.route('/assistant', methods=['GET'])
 def assistant():
     history = session.get('assistant_history', [])
@@ -1195,34 +1646,121 @@ def assistant_message():
         flash('Please enter a message.', 'error')
         return redirect(url_for('assistant'))
 
+    timings = {}
+    request_started = time.perf_counter()
+    cached, flagged, products, posts, question_vec = _assistant_prepare(user_message, timings)
+    if cached is not None:
+        _append_assistant_history(user_message, cached.answer)
+        _record_assistant_timings(timings, request_started)
+        return redirect(url_for('assistant'))
+
     # Moderation check
-    if OpenAI and os.getenv('OPENAI_API_KEY') and os.getenv('ENABLE_MODERATION', 'true').lower() == 'true':
-        try:
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            mod_model = os.getenv('OPENAI_MODERATION_MODEL', 'omni-moderation-latest')
-            mod = client.moderations.create(model=mod_model, input=user_message)
-            if mod.results and mod.results[0].flagged:
-                flash('Your message appears to violate our content policy. Please rephrase.', 'error')
-                return redirect(url_for('assistant'))
-        except Exception:
-            pass
+    if flagged:
+        flash('Your message appears to violate our content policy. Please rephrase.', 'error')
+        return redirect(url_for('assistant'))
 
-    # Retrieve context
-    products, posts = get_relevant_content(user_message, top_n=3)
-    answer = ai_generate_answer(user_message, products, posts)
+    with _stage(timings, 'chat'):
+        answer = _chat_answer(user_message, products, posts)
+    if answer is None:
+        answer = _fallback_answer(products, posts)
+    elif question_vec is not None:
+        cost = time.perf_counter() - request_started - timings['embed']
+        answer_cache.store(question_vec, user_message, answer, _assistant_context(products, posts),
+                           products, posts, cost_ms=cost * 1000.0)
+    _append_assistant_history(user_message, answer)
+    _record_assistant_timings(timings, request_started)
 
-    # Maintain simple session history
-    history = session.get('assistant_history', [])
-    history.append({"role": "user", "content": user_message})
-    history.append({"role": "assistant", "content": answer})
-    session['assistant_history'] = history[-20:]  # cap history
+    return redirect(url_for('assistant'))
+
+@app.route('/assistant/stream', methods=['POST'])
+def assistant_stream():
+    """Answer as Server-Sent Events: `context`, then `token`s, then `done`.
+
+    Headers are sent before the answer exists, so the session can't be updated
+    here; `done` carries a signed copy of the exchange that the page posts
+    back to /assistant/history.
+    """
+    user_message = request.form.get('message', '').strip()
+    if not user_message:
+        return jsonify({'success': False, 'error': 'Please enter a message.'}), 400
+
+    def finish(answer):
+        return _sse('done', {
+            'html': str(markdown_filter(answer)),
+            'token': _answer_serializer().dumps({'id': uuid.uuid4().hex, 'q': user_message, 'a': answer}),
+        })
 
+    timings = {}
+    request_started = time.perf_counter()
+    cached, flagged, products, posts, question_vec = _assistant_prepare(user_message, timings)
+    if cached is not None:
+        db.session.close()
+        _record_assistant_timings(timings, request_started)
+        frames = [_sse('context', cached.context), _sse('token', {'text': cached.answer}), finish(cached.answer)]
+        return Response(frames, mimetype='text/event-stream', headers=SSE_HEADERS)
+
+    # Moderation check
+    if flagged:
+        return jsonify({'success': False, 'error': 'Your message appears to violate our content policy. Please rephrase.'}), 400
+
+    # Build the prompt up front, then hand the DB connection back to the pool
+    # for the (slow) completion
+    context = _assistant_context(products, posts)
+    messages = _assistant_messages(user_message, products, posts)
+    fallback = _fallback_answer(products, posts)
+    db.session.close()
+
+    def generate():
+        yield _sse('context', context)
+        chunks = []
+        complete = False
+        if ai_enabled():
+            try:
+                with _stage(timings, 'chat'):
+                    for delta in _stream_chat(messages):
+                        chunks.append(delta)
+                        yield _sse('token', {'text': delta})
+                complete = bool(chunks)
+            except Exception:
+                app.logger.warning('Assistant stream failed after %d chunks', len(chunks), exc_info=True)
+        if not chunks:
+            chunks.append(fallback)
+            yield _sse('token', {'text': fallback})
+        answer = ''.join(chunks)
+        if complete and question_vec is not None:
+            cost = time.perf_counter() - request_started - timings['embed']
+            answer_cache.store(question_vec, user_message, answer, context, products, posts, cost_ms=cost * 1000.0)
+        _record_assistant_timings(timings, request_started)
+        yield finish(answer)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/assistant/history', methods=['POST'])
+def assistant_history():
+    """Append a streamed exchange (signed by /assistant/stream) to the session history."""
+    try:
+        data = _answer_serializer().loads(request.form.get('token', ''), max_age=ASSISTANT_ANSWER_MAX_AGE)
+    except BadSignature:
+        return jsonify({'success': False, 'error': 'Invalid or expired answer'}), 400
+    # Each token carries a one-off id; saving it again (a replay or a retried request) is a no-op
+    if not data.get('id'):
+        return jsonify({'success': False, 'error': 'Invalid or expired answer'}), 400
+    saved = session.get('assistant_saved_ids', [])
+    if data['id'] in saved:
+        return jsonify({'success': True, 'duplicate': True})
+    _append_assistant_history(data['q'], data['a'])
+    session['assistant_saved_ids'] = (saved + [data['id']])[-ASSISTANT_SAVED_IDS_KEEP:]
+    return jsonify({'success': True})
+
+@app.route('/assistant/clear', methods=['POST'])
+def assistant_clear():
+    session.pop('assistant_history', None)
     return redirect(url_for('assistant'))
 
 # Products Routes
 @app.route('/peptides')
+@query_budget(6)
 def peptides():
-    page = request.args.get('page', 1, type=int)
     category_id = request.args.get('category', type=int)
     q = request.args.get('q', type=str, default='')
     sort = request.args.get('sort', type=str, default='new')  # new, price_low, price_high, name_asc, name_desc
@@ -1235,19 +1773,26 @@ def peptides():
         like = f"%{q}%"
         query = query.filter(or_(Product.name.ilike(like), Product.description.ilike(like)))
 
-    # Sorting
+    # Sorting (always ends in id so the keyset is unique)
+    effective_price = func.coalesce(Product.sale_price, Product.price)
+    price_of = lambda p: p.sale_price if p.sale_price is not None else p.price
     if sort == 'price_low':
-        query = query.order_by(func.coalesce(Product.sale_price, Product.price).asc())
+        keys = [SortKey(effective_price, desc=False, value=price_of), SortKey(Product.id, desc=False)]
     elif sort == 'price_high':
-        query = query.order_by(func.coalesce(Product.sale_price, Product.price).desc())
+        keys = [SortKey(effective_price, desc=True, value=price_of), SortKey(Product.id, desc=True)]
     elif sort == 'name_asc':
-        query = query.order_by(Product.name.asc())
+        keys = [SortKey(Product.name, desc=False), SortKey(Product.id, desc=False)]
     elif sort == 'name_desc':
-        query = query.order_by(Product.name.desc())
+        keys = [SortKey(Product.name, desc=True), SortKey(Product.id, desc=True)]
     else:
-        query = query.order_by(Product.created_at.desc())
+        sort = 'new'
+        keys = [SortKey(Product.created_at, desc=True), SortKey(Product.id, desc=True)]
 
-    products = query.paginate(page=page, per_page=12, error_out=False)
+    products = keyset_paginate(
+        query, keys,
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=12, count='estimate', cursor_tag=f'peptides:{sort}',
+    )
     categories = Category.query.all()
 
     return render_template(
@@ -1260,8 +1805,9 @@ def peptides():
     )
 
 @app.route('/peptides/<slug>')
+@query_budget(7)
 def peptide_detail(slug):
-    product = Product.query.filter_by(slug=slug, status='active').first_or_404()
+    product = Product.query.options(joinedload(Product.category)).filter_by(slug=slug, status='active').first_or_404()
     related_products = Product.query.filter(
         Product.category_id == product.category_id,
         Product.id != product.id,
@@ -1296,6 +1842,7 @@ def peptide_detail(slug):
 # ----------------------
 
 @app.route('/favorites')
+@query_budget(5)
 @login_required
 def favorites():
     # List the current user's favorite products
@@ -1333,6 +1880,7 @@ def toggle_favorite():
         db.session.commit()
         favorited = True
         flash('Added to wishlist', 'success')
+    refresh_user_summary(current_user.id)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({'success': True, 'favorited': favorited})
@@ -1389,9 +1937,10 @@ def create_stock_alert():
 
 # Shopping Cart Routes
 @app.route('/cart')
+@query_budget(5)
 @login_required
 def cart():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+    cart_items = CartItem.query.options(joinedload(CartItem.product)).filter_by(user_id=current_user.id).all()
     total = sum(
         ((item.product.sale_price if item.product.sale_price is not None else item.product.price) * item.quantity)
         for item in cart_items
@@ -1447,13 +1996,11 @@ def add_to_cart():
 
     db.session.commit()
 
-    # Compute updated cart count (sum of quantities)
-    cart_count = db.session.query(func.coalesce(db.func.sum(CartItem.quantity), 0)).filter(
-        CartItem.user_id == current_user.id
-    ).scalar() or 0
+    # Refresh the cached cart summary (sum of quantities, total, favorites)
+    summary = refresh_user_summary(current_user.id)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify({'success': True, 'cart_count': int(cart_count)})
+        return jsonify({'success': True, 'cart_count': summary['cart_count']})
 
     flash('Product added to cart', 'success')
     return redirect(url_for('cart'))
@@ -1477,17 +2024,15 @@ def update_cart():
         db.session.commit()
         effective_price = cart_item.product.sale_price if cart_item.product.sale_price is not None else cart_item.product.price
         # Updated cart total
-        cart_total = db.session.query(func.coalesce(db.func.sum((func.coalesce(Product.sale_price, Product.price) * CartItem.quantity)), 0)).join(
-            Product, Product.id == CartItem.product_id
-        ).filter(CartItem.user_id == current_user.id).scalar() or 0
-        return jsonify({'success': True, 'item_total': float(effective_price * cart_item.quantity), 'cart_total': float(cart_total)})
+        summary = refresh_user_summary(current_user.id)
+        return jsonify({'success': True, 'item_total': float(effective_price * cart_item.quantity),
+                        'cart_total': float(summary['cart_total']), 'cart_count': summary['cart_count']})
     else:
         db.session.delete(cart_item)
         db.session.commit()
-        cart_total = db.session.query(func.coalesce(db.func.sum((func.coalesce(Product.sale_price, Product.price) * CartItem.quantity)), 0)).join(
-            Product, Product.id == CartItem.product_id
-        ).filter(CartItem.user_id == current_user.id).scalar() or 0
-        return jsonify({'success': True, 'removed': True, 'cart_total': float(cart_total)})
+        summary = refresh_user_summary(current_user.id)
+        return jsonify({'success': True, 'removed': True,
+                        'cart_total': float(summary['cart_total']), 'cart_count': summary['cart_count']})
 
 @app.route('/cart/remove/<int:item_id>', methods=['POST'])
 @login_required
@@ -1499,29 +2044,37 @@ def remove_from_cart(item_id):
 
     db.session.delete(cart_item)
     db.session.commit()
+    refresh_user_summary(current_user.id)
     flash('Item removed from cart', 'success')
     return redirect(url_for('cart'))
 
 # Orders Routes
 @app.route('/orders')
+@query_budget(6)
 @login_required
 def orders():
-    page = request.args.get('page', 1, type=int)
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).paginate(
-        page=page, per_page=10, error_out=False
+    orders = keyset_paginate(
+        Order.query.filter_by(user_id=current_user.id).options(selectinload(Order.order_items)),
+        [SortKey(Order.created_at, desc=True), SortKey(Order.id, desc=True)],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=10, count='exact', cursor_tag='orders',
     )
     return render_template('orders/index.html', orders=orders)
 
 @app.route('/orders/<order_number>')
+@query_budget(6)
 @login_required
 def order_detail(order_number):
-    order = Order.query.filter_by(order_number=order_number, user_id=current_user.id).first_or_404()
+    order = Order.query.options(
+        selectinload(Order.order_items).joinedload(OrderItem.product),
+        selectinload(Order.payments),
+    ).filter_by(order_number=order_number, user_id=current_user.id).first_or_404()
     return render_template('orders/detail.html', order=order)
 
 @app.route('/checkout', methods=['GET', 'POST'])
 @login_required
 def checkout():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+    cart_items = CartItem.query.options(joinedload(CartItem.product)).filter_by(user_id=current_user.id).all()
 
     if not cart_items:
         flash('Your cart is empty', 'error')
@@ -1569,44 +2122,45 @@ def checkout():
                 flash(f'Insufficient stock for {name}. Available: {available}, In cart: {needed}', 'error')
             return redirect(url_for('cart'))
 
-        # Create order and update stock within a transaction with row locks
+        # Create order and update stock in one transaction, with row locks (rolled back below on failure)
         try:
-            with db.session.begin():
-                order_number = generate_order_number()
-                order = Order(
-                    order_number=order_number,
-                    user_id=current_user.id,
-                    total_amount=total,
-                    shipping_address=shipping_address,
-                    billing_address=billing_address,
-                    notes=request.form.get('notes')
+            order_number = generate_order_number()
+            order = Order(
+                order_number=order_number,
+                user_id=current_user.id,
+                total_amount=total,
+                shipping_address=shipping_address,
+                billing_address=billing_address,
+                notes=request.form.get('notes')
+            )
+            db.session.add(order)
+            db.session.flush()
+
+            for cart_item in cart_items:
+                # Lock the product row for update
+                product = Product.query.filter_by(id=cart_item.product_id).with_for_update().one()
+                effective_price = cart_item.product.sale_price if cart_item.product.sale_price is not None else cart_item.product.price
+
+                if product.stock_quantity < cart_item.quantity:
+                    raise ValueError(f"Insufficient stock for {product.name}")
+
+                order_item = OrderItem(
+                    order_id=order.id,
+                    product_id=cart_item.product_id,
+                    quantity=cart_item.quantity,
+                    price=effective_price,
+                    total=effective_price * cart_item.quantity
                 )
-                db.session.add(order)
-                db.session.flush()
-
-                for cart_item in cart_items:
-                    # Lock the product row for update
-                    product = Product.query.filter_by(id=cart_item.product_id).with_for_update().one()
-                    effective_price = cart_item.product.sale_price if cart_item.product.sale_price is not None else cart_item.product.price
-
-                    if product.stock_quantity < cart_item.quantity:
-                        raise ValueError(f"Insufficient stock for {product.name}")
+                db.session.add(order_item)
 
-                    order_item = OrderItem(
-                        order_id=order.id,
-                        product_id=cart_item.product_id,
-                        quantity=cart_item.quantity,
-                        price=effective_price,
-                        total=effective_price * cart_item.quantity
-                    )
-                    db.session.add(order_item)
+                # Decrement stock safely
+                product.stock_quantity = product.stock_quantity - cart_item.quantity
 
-                    # Decrement stock safely
-                    product.stock_quantity = product.stock_quantity - cart_item.quantity
-
-                # Clear cart for user
-                CartItem.query.filter_by(user_id=current_user.id).delete()
+            # Clear cart for user
+            CartItem.query.filter_by(user_id=current_user.id).delete()
+            db.session.commit()
 
+            refresh_user_summary(current_user.id)
             flash('Order placed successfully!', 'success')
             return redirect(url_for('order_detail', order_number=order_number))
         except Exception as e:
@@ -1618,18 +2172,24 @@ def checkout():
 
 # Payments Routes
 @app.route('/payments')
+@query_budget(5)
 @login_required
 def payments():
-    page = request.args.get('page', 1, type=int)
-    payments = Payment.query.join(Order).filter(Order.user_id == current_user.id).order_by(Payment.created_at.desc()).paginate(
-        page=page, per_page=10, error_out=False
+    payments = keyset_paginate(
+        Payment.query.join(Order).options(contains_eager(Payment.order)).filter(Order.user_id == current_user.id),
+        [SortKey(Payment.created_at, desc=True), SortKey(Payment.id, desc=True)],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=10, count='exact', cursor_tag='payments',
     )
     return render_template('payments/index.html', payments=payments)
 
 @app.route('/payments/<int:payment_id>')
+@query_budget(5)
 @login_required
 def payment_detail(payment_id):
-    payment = Payment.query.join(Order).filter(
+    payment = Payment.query.join(Order).options(
+        contains_eager(Payment.order).selectinload(Order.order_items).joinedload(OrderItem.product)
+    ).filter(
         Payment.id == payment_id,
         Order.user_id == current_user.id
     ).first_or_404()
@@ -1655,6 +2215,7 @@ def shipping():
 
 # Tracker Routes
 @app.route('/tracker')
+@query_budget(9)
 @login_required
 def tracker():
     # Get user's active cycles
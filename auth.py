@@ -1,13 +1,152 @@
+import base64
+import json
 import os
+import re
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlencode
 from flask import redirect, url_for, session, request, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 from models import db, User
+from metrics import track_outbound
 from datetime import datetime
 
+# Optional in principle, but a declared dependency: verifies Google ID tokens locally
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+except Exception:  # pragma: no cover
+    rsa = None
+
 login_manager = LoginManager()
 
+# (connect, read) seconds for calls to Google
+GOOGLE_HTTP_TIMEOUT = (float(os.getenv('GOOGLE_CONNECT_TIMEOUT', '3.05')), float(os.getenv('GOOGLE_READ_TIMEOUT', '10')))
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+# Allowed clock difference when checking exp/iat
+ID_TOKEN_LEEWAY_SECONDS = 60
+
+_http = None
+_http_pid = None
+_http_lock = threading.Lock()
+
+
+def google_http():
+    """This worker's pooled requests.Session for Google endpoints."""
+    global _http, _http_pid
+    if _http is None or _http_pid != os.getpid():
+        with _http_lock:
+            if _http is None or _http_pid != os.getpid():
+                http = requests.Session()
+                http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10))
+                _http, _http_pid = http, os.getpid()
+    return _http
+
+
+class IdTokenError(ValueError):
+    """An ID token is malformed, expired, for another client or not signed by Google."""
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def _rsa_key(jwk: dict):
+    return rsa.RSAPublicNumbers(
+        int.from_bytes(_b64decode(jwk['e']), 'big'),
+        int.from_bytes(_b64decode(jwk['n']), 'big'),
+    ).public_key()
+
+
+class GoogleJWKS:
+    """Google's ID-token signing keys, cached until the JWKS response's max-age.
+
+    An unknown ``kid`` (key rotation) triggers a refetch, at most once a minute.
+    GOOGLE_JWKS_URL points at a stand-in key set for tests; `set_keys` installs
+    one without HTTP.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._pinned = False
+
+    def set_keys(self, jwks):
+        """Use this JWKS dict ({'keys': [...]}) instead of fetching; None re-enables fetching."""
+        with self._lock:
+            self._pinned = jwks is not None
+            self._keys = self._parse(jwks) if jwks is not None else {}
+            self._expires_at = 0.0
+
+    def _parse(self, jwks):
+        return {k['kid']: _rsa_key(k) for k in jwks.get('keys', []) if k.get('kty') == 'RSA' and 'kid' in k}
+
+    def _fetch(self):
+        with track_outbound('google', 'jwks'):
+            resp = google_http().get(self.url, timeout=GOOGLE_HTTP_TIMEOUT)
+        resp.raise_for_status()
+        match = re.search(r'max-age=(\d+)', resp.headers.get('Cache-Control', ''))
+        self._keys = self._parse(resp.json())
+        self._fetched_at = time.monotonic()
+        self._expires_at = self._fetched_at + (int(match.group(1)) if match else 3600)
+
+    def get(self, kid: str):
+        with self._lock:
+            if self._pinned:
+                return self._keys.get(kid)
+            now = time.monotonic()
+            if now >= self._expires_at or (kid not in self._keys and now - self._fetched_at >= 60):
+                self._fetch()
+            return self._keys.get(kid)
+
+
+google_jwks = GoogleJWKS(os.getenv('GOOGLE_JWKS_URL', 'https://www.googleapis.com/oauth2/v3/certs'))
+
+
+def verify_id_token(id_token: str, audience: str) -> dict:
+    """Claims of a Google-signed RS256 ID token issued to `audience`; raises IdTokenError."""
+    if rsa is None:
+        raise IdTokenError('cryptography is not installed')
+    try:
+        header_b64, payload_b64, signature_b64 = id_token.split('.')
+        header = json.loads(_b64decode(header_b64))
+        claims = json.loads(_b64decode(payload_b64))
+        signature = _b64decode(signature_b64)
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise ValueError('header and payload must be JSON objects')
+    except (ValueError, AttributeError) as e:
+        raise IdTokenError(f'Malformed ID token: {e}')
+    if header.get('alg') != 'RS256':
+        raise IdTokenError(f"Unexpected ID token algorithm {header.get('alg')!r}")
+    key = google_jwks.get(header.get('kid'))
+    if key is None:
+        raise IdTokenError('ID token signed with an unknown key')
+    try:
+        key.verify(signature, f'{header_b64}.{payload_b64}'.encode(), padding.PKCS1v15(), hashes.SHA256())
+    except InvalidSignature:
+        raise IdTokenError('Bad ID token signature')
+
+    now = time.time()
+    if claims.get('iss') not in GOOGLE_ISSUERS:
+        raise IdTokenError('ID token from an unexpected issuer')
+    aud = claims.get('aud')
+    if not audience or (audience not in aud if isinstance(aud, list) else aud != audience):
+        raise IdTokenError('ID token issued to another client')
+    if float(claims.get('exp', 0)) < now - ID_TOKEN_LEEWAY_SECONDS:
+        raise IdTokenError('ID token expired')
+    if float(claims.get('iat', 0)) > now + ID_TOKEN_LEEWAY_SECONDS:
+        raise IdTokenError('ID token issued in the future')
+    return claims
+
+
 class GoogleAuth:
     def __init__(self):
         self.client_id = os.environ.get('GOOGLE_CLIENT_ID')
@@ -40,19 +179,147 @@ class GoogleAuth:
             'grant_type': 'authorization_code',
             'redirect_uri': self.redirect_uri
         }
-        response = requests.post(self.token_url, data=data)
+        with track_outbound('google', 'token'):
+            response = google_http().post(self.token_url, data=data, timeout=GOOGLE_HTTP_TIMEOUT)
         return response.json()
 
     def get_user_info(self, access_token):
         headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.get(self.user_info_url, headers=headers)
+        with track_outbound('google', 'userinfo'):
+            response = google_http().get(self.user_info_url, headers=headers, timeout=GOOGLE_HTTP_TIMEOUT)
         return response.json()
 
+    def user_info_from_token(self, token_response):
+        """Profile for a token response: from the verified id_token when possible, else the userinfo API."""
+        id_token = token_response.get('id_token')
+        if id_token:
+            try:
+                claims = verify_id_token(id_token, self.client_id)
+                if claims.get('email') and claims.get('email_verified', False) in (True, 'true'):
+                    return {
+                        'id': claims['sub'],
+                        'email': claims['email'],
+                        'name': claims.get('name') or claims['email'],
+                        'picture': claims.get('picture'),
+                    }
+            except Exception:
+                # Bad token or JWKS unreachable: the access token still works for userinfo
+                pass
+        return self.get_user_info(token_response['access_token'])
+
 google_auth = GoogleAuth()
 
+# Columns copied into CachedUser; everything else loads the ORM row on demand
+USER_SNAPSHOT_FIELDS = ('id', 'google_id', 'email', 'name', 'picture', 'role', 'is_active', 'created_at', 'last_login')
+
+
+class CachedUser:
+    """Read-only snapshot of a User row used as ``current_user``.
+
+    Templates and routes mostly read id/name/role, which the snapshot holds.
+    Any other attribute (relationships, updated_at, ...) loads the real row
+    once per request via `db_user`, so code written against the ORM object
+    keeps working; pass `db_user` explicitly when an ORM instance is required.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, snapshot: dict):
+        self.__dict__.update(snapshot)
+        self._db_user = None
+
+    @property
+    def db_user(self):
+        if self._db_user is None:
+            self._db_user = db.session.get(User, self.id)
+        return self._db_user
+
+    def __getattr__(self, name):
+        # Only called for attributes missing from the snapshot
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.db_user, name)
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, (CachedUser, User)) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class UserCache:
+    """Per-process user_id -> snapshot cache with a short TTL.
+
+    Writes through the ORM invalidate the entry when they commit (see the
+    events below); other workers and raw SQL updates are covered by the TTL.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def get(self, user_id: int):
+        if self.ttl <= 0:
+            return _snapshot(db.session.get(User, user_id))
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(user_id)
+        if item is not None and item[0] > now:
+            return item[1]
+        snapshot = _snapshot(db.session.get(User, user_id))
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                self._data.clear()
+            self._data[user_id] = (now + self.ttl, snapshot)
+        return snapshot
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _snapshot(user):
+    if user is None:
+        return None
+    return {field: getattr(user, field) for field in USER_SNAPSHOT_FIELDS}
+
+
+user_cache = UserCache(ttl=float(os.getenv('USER_CACHE_TTL', '30')))
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _mark_user_changed(mapper, connection, target):
+    db_session = object_session(target)
+    if db_session is not None:
+        db_session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_users(db_session):
+    for user_id in db_session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changed_users(db_session):
+    db_session.info.pop('changed_user_ids', None)
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    snapshot = user_cache.get(int(user_id))
+    return CachedUser(snapshot) if snapshot is not None else None
 
 @login_manager.unauthorized_handler
 def unauthorized():
@@ -82,4 +349,5 @@ def create_or_update_user(user_info):
         db.session.add(user)
 
     db.session.commit()
+    user_cache.invalidate(user.id)
     return user
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""
+Benchmarks for the Flask app. Run from the repository root, e.g.::
+
+    python -m benchmarks.seed --scale 1     # synthetic data (uses DATABASE_URL)
+    python -m benchmarks.load               # route latency/throughput
+    python -m benchmarks.pagination         # OFFSET vs keyset page-N latency
+    python -m benchmarks.micro --compare    # text-processing hot functions vs baseline
+    python -m benchmarks.assistant          # sequential vs concurrent assistant pipeline (stub AI)
+    python -m benchmarks.stock_alerts       # back-in-stock dispatch throughput (fake mail transport)
+"""
@@ -0,0 +1,138 @@
+"""
+Assistant pipeline latency: sequential vs concurrent moderation/retrieval.
+
+Drives POST /assistant/message against a scratch database seeded with
+benchmarks.seed, with stub OpenAI and embedding providers that sleep for
+fixed latencies, so only the app's own orchestration is measured:
+
+    python -m benchmarks.assistant --moderation-ms 150 --embed-ms 60 --chat-ms 400
+
+Each mode runs with the answer cache cleared before every question. The
+report shows per-stage p50 (as recorded by the app) and the wall-clock p50,
+and how much the concurrent mode saves. Retrieval uses the keyword fallback
+(SQLite), so its cost is real CPU/DB time on the seeded catalogue.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+STAGES = ('embed', 'moderation', 'retrieval', 'moderation_wait', 'chat', 'total')
+
+
+class StubOpenAI:
+    """Just enough of the OpenAI client for moderation and chat, with fixed latency."""
+
+    def __init__(self, moderation_ms, chat_ms):
+        self.moderations = types.SimpleNamespace(create=self._moderate)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._complete))
+        self.moderation_s = moderation_ms / 1000.0
+        self.chat_s = chat_ms / 1000.0
+
+    def with_options(self, **kwargs):
+        return self
+
+    def _moderate(self, model, input):
+        time.sleep(self.moderation_s)
+        return types.SimpleNamespace(results=[types.SimpleNamespace(flagged=False)])
+
+    def _complete(self, model, messages, temperature=None, stream=False):
+        time.sleep(self.chat_s)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content='Stub answer.'))])
+
+
+def _slow_provider(embed_ms):
+    from embeddings import HashingEmbeddingProvider
+
+    class SlowHashingProvider(HashingEmbeddingProvider):
+        name = 'slow-hashing'
+
+        def embed_one(self, text):
+            time.sleep(embed_ms / 1000.0)
+            return super().embed_one(text)
+
+    return SlowHashingProvider()
+
+
+def run_mode(app, questions, pool_size):
+    import app as app_module
+    from ai_client import configure_ai_pool
+    from answer_cache import answer_cache
+
+    configure_ai_pool(pool_size)
+    recorded = []
+    original = app_module.observe_stages
+    app_module.observe_stages = lambda endpoint, timings: recorded.append(dict(timings))
+    try:
+        client = app.test_client()
+        walls = []
+        for question in questions:
+            answer_cache.clear()
+            started = time.perf_counter()
+            resp = client.post('/assistant/message', data={'message': question})
+            walls.append((time.perf_counter() - started) * 1000.0)
+            assert resp.status_code == 302, resp.status_code
+    finally:
+        app_module.observe_stages = original
+    stages = {
+        stage: statistics.median(t[stage] * 1000.0 for t in recorded if stage in t)
+        for stage in STAGES if any(stage in t for t in recorded)
+    }
+    return stages, statistics.median(walls)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--moderation-ms', type=float, default=150)
+    parser.add_argument('--embed-ms', type=float, default=60)
+    parser.add_argument('--chat-ms', type=float, default=400)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmp_path}'
+    os.environ['AUTO_EMBED'] = 'false'
+    os.environ.setdefault('SESSION_COOKIE_SECURE', 'false')
+    try:
+        from app import app
+        from ai_client import set_openai_client
+        from embeddings import set_embedding_provider
+        from models import db
+        from benchmarks.seed import PEPTIDES, seed
+
+        app.config['WTF_CSRF_ENABLED'] = False
+        with app.app_context():
+            db.create_all()
+            seed(users=5, categories=6, products=args.products, posts=args.posts, community_posts=0)
+        set_openai_client(StubOpenAI(args.moderation_ms, args.chat_ms))
+        set_embedding_provider(_slow_provider(args.embed_ms))
+
+        questions = [f"what is the {PEPTIDES[i % len(PEPTIDES)]} dosage for study {i}" for i in range(args.repeat)]
+        run_mode(app, questions[:2], 4)  # warm up
+        results = {
+            'sequential': run_mode(app, questions, 0),
+            'concurrent': run_mode(app, questions, 4),
+        }
+    finally:
+        os.unlink(tmp_path)
+
+    print(f"stub latencies: moderation {args.moderation_ms:g} ms, embed {args.embed_ms:g} ms, chat {args.chat_ms:g} ms; "
+          f"{args.products} products / {args.posts} posts; {args.repeat} questions per mode")
+    print(f"{'mode':<12}" + ''.join(f"{s:>17}" for s in STAGES) + f"{'wall p50':>11}  (ms, p50)")
+    for mode, (stages, wall) in results.items():
+        cells = ''.join(f"{stages[s]:>17.1f}" if s in stages else f"{'-':>17}" for s in STAGES)
+        print(f"{mode:<12}{cells}{wall:>11.1f}")
+    saved = results['sequential'][1] - results['concurrent'][1]
+    print(f"concurrent saves {saved:.1f} ms per question ({saved / results['sequential'][1] * 100:.1f}%)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
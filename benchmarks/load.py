@@ -0,0 +1,213 @@
+"""
+Load benchmark for the main routes.
+
+Drives either the in-process Flask test client (default) or a running server
+(--url, e.g. a local gunicorn) with --concurrency worker threads over a fixed
+route mix for --duration seconds, then prints per-route and overall
+throughput with p50/p95/p99 latency. Authenticated routes run as the seeded
+bench user (see benchmarks.seed).
+
+    export DATABASE_URL=sqlite:////tmp/bench.db
+    python -m benchmarks.seed --scale 1
+    python -m benchmarks.load --duration 20 --concurrency 4 --json before.json
+
+    # Against gunicorn: same DATABASE_URL, SECRET_KEY and SESSION_BACKEND as the server
+    SECRET_KEY=bench SESSION_COOKIE_SECURE=false gunicorn -w 4 app:app &
+    SECRET_KEY=bench python -m benchmarks.load --url http://127.0.0.1:8000
+
+Set EMBEDDING_PROVIDER=hashing (and seed with --embed) to exercise the
+vector search paths on Postgres without calling the embeddings API.
+
+In-process numbers include no network or WSGI server overhead and are
+GIL-bound, so compare runs of the same mode on the same machine.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import threading
+import time
+
+ROUTES = [
+    ('home', '/'),
+    ('peptides', '/peptides'),
+    ('search', '/search?q=semaglutide+dosage'),
+    ('post_detail', '/posts/{post_slug}'),
+    ('community', '/community'),
+    ('cart', '/cart'),
+    ('checkout', '/checkout'),
+    ('tracker', '/tracker'),
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    """samples: list of (latency_seconds, ok). Latencies in ms."""
+    latencies = sorted(s for s, _ in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, ok in samples if not ok),
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'mean_ms': (sum(latencies) / len(latencies) * 1000.0) if latencies else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000.0,
+        'p95_ms': percentile(latencies, 95) * 1000.0,
+        'p99_ms': percentile(latencies, 99) * 1000.0,
+    }
+
+
+def _bench_context(app):
+    """Bench user id and a published post slug from the seeded database."""
+    from models import Post, User
+    from benchmarks.seed import BENCH_USER_EMAIL
+    with app.app_context():
+        user = User.query.filter_by(email=BENCH_USER_EMAIL).first()
+        if user is None:
+            raise SystemExit(f"No {BENCH_USER_EMAIL} in the database; run `python -m benchmarks.seed` first")
+        post = Post.query.filter_by(status='published').order_by(Post.view_count.desc()).first()
+        return user.id, post.slug if post else 'missing'
+
+
+def _session_cookie(app, user_id):
+    """A session cookie logged in as user_id (the server must share SECRET_KEY).
+
+    With SESSION_BACKEND=database the session row is created in the shared
+    database; the memory backend can't be reached from another process.
+    """
+    data = {'_user_id': str(user_id), '_fresh': True}
+    interface = app.session_interface
+    if hasattr(interface, 'create'):
+        with app.app_context():
+            return app.config['SESSION_COOKIE_NAME'], interface.create(app, data)
+    return app.config['SESSION_COOKIE_NAME'], interface.get_signing_serializer(app).dumps(data)
+
+
+def _make_fetch(app, url, user_id):
+    """Return a per-thread fetch(path) -> status_code callable."""
+    if url:
+        import requests
+        name, value = _session_cookie(app, user_id)
+        http = requests.Session()
+        http.headers['Cookie'] = f'{name}={value}'
+
+        def fetch(path):
+            r = http.get(url.rstrip('/') + path, allow_redirects=False, timeout=30)
+            r.content
+            return r.status_code
+        return fetch
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+    def fetch(path):
+        r = client.get(path)
+        r.get_data()
+        return r.status_code
+    return fetch
+
+
+def run(app, routes, url=None, concurrency=4, duration=20.0, warmup=2.0):
+    user_id, post_slug = _bench_context(app)
+    paths = [(name, path.format(post_slug=post_slug)) for name, path in routes]
+    results = {name: [] for name, _ in paths}
+    statuses = {}
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def worker(index):
+        fetch = _make_fetch(app, url, user_id)
+        local, local_status = [], {}
+        i = index  # stagger workers across the route mix
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            name, path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                status = fetch(path)
+            except Exception:
+                status = None
+            latency = time.perf_counter() - started
+            if started >= start_at:
+                local.append((name, latency, status is not None and status < 400))
+                local_status[(name, status)] = local_status.get((name, status), 0) + 1
+        with lock:
+            for name, latency, ok in local:
+                results[name].append((latency, ok))
+            for key, n in local_status.items():
+                statuses[key] = statuses.get(key, 0) + n
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    report = {name: summarize(samples, duration) for name, samples in results.items()}
+    report['ALL'] = summarize([s for samples in results.values() for s in samples], duration)
+    return report, statuses
+
+
+def print_report(report, statuses):
+    print(f"{'route':<14}{'reqs':>8}{'err':>6}{'req/s':>9}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    for name, row in report.items():
+        print(f"{name:<14}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9.1f}"
+              f"{row['mean_ms']:>9.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}")
+    odd = {k: v for k, v in statuses.items() if k[1] != 200}
+    if odd:
+        print('non-200 responses: ' + ', '.join(f"{name}={status}x{n}" for (name, status), n in sorted(odd.items(), key=str)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='base URL of a running server; default drives the in-process test client')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=20.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds before measuring')
+    parser.add_argument('--routes', help='comma-separated subset of: ' + ', '.join(n for n, _ in ROUTES))
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('AUTO_EMBED', 'false')
+    os.environ.setdefault('SESSION_COOKIE_SECURE', 'false')
+    from app import app
+
+    routes = ROUTES
+    if args.routes:
+        wanted = {r.strip() for r in args.routes.split(',')}
+        routes = [r for r in ROUTES if r[0] in wanted]
+
+    report, statuses = run(app, routes, url=args.url, concurrency=args.concurrency,
+                           duration=args.duration, warmup=args.warmup)
+    print(f"mode={'http ' + args.url if args.url else 'in-process'} concurrency={args.concurrency} "
+          f"duration={args.duration:g}s python={platform.python_version()} cpus={os.cpu_count()}")
+    print_report(report, statuses)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'mode': 'http' if args.url else 'in-process', 'url': args.url,
+                'concurrency': args.concurrency, 'duration': args.duration,
+                'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                'database': app.config['SQLALCHEMY_DATABASE_URI'].split('://', 1)[0],
+                'routes': report,
+            }, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
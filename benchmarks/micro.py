@@ -0,0 +1,177 @@
+"""
+Micro-benchmarks for the text-processing hot paths.
+
+Times extract_keywords, calculate_similarity and has_similar_theme (run over
+the whole corpus by related posts, search and the assistant) and the
+markdown/excerpt/reading_time template filters (run on every render) against
+fixed, deterministically generated corpora.
+
+    python -m benchmarks.micro                       # print results
+    python -m benchmarks.micro --save-baseline       # record this machine's baseline
+    python -m benchmarks.micro --compare             # exit 1 on regression vs the baseline
+
+Each benchmark is auto-calibrated to run for at least --min-time seconds per
+repeat; the best of --repeat runs is reported per call and is what gets
+compared, since it is the least noisy statistic. Baselines are machine
+specific and live in .benchmarks/ (git-ignored) unless --baseline says otherwise.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+DEFAULT_BASELINE = os.path.join('.benchmarks', 'micro-baseline.json')
+CORPUS_SEED = 1234
+
+
+def build_corpus(n_docs=200, seed=CORPUS_SEED):
+    """Deterministic markdown documents shaped like blog/community posts."""
+    from benchmarks.seed import PEPTIDES, WORDS
+
+    rng = random.Random(seed)
+    vocab = WORDS + PEPTIDES + ['the', 'and', 'for', 'with', 'this', 'that', 'from', 'have', 'when']
+
+    def sentence(lo=8, hi=20):
+        return ' '.join(rng.choice(vocab) for _ in range(rng.randint(lo, hi))).capitalize() + '.'
+
+    docs = []
+    for i in range(n_docs):
+        parts = [f"# {sentence(3, 7)[:-1]}", '']
+        for _ in range(rng.randint(3, 8)):
+            kind = rng.random()
+            if kind < 0.55:
+                parts.append(' '.join(sentence() for _ in range(rng.randint(3, 6))))
+            elif kind < 0.7:
+                parts.append(f"## {sentence(2, 5)[:-1]}")
+            elif kind < 0.85:
+                parts.extend(f"- **{rng.choice(PEPTIDES)}**: {sentence(4, 10)}" for _ in range(rng.randint(2, 5)))
+            elif kind < 0.93:
+                parts.append(f"See [{rng.choice(PEPTIDES)} study](https://example.com/study/{i}) and https://example.org/{i}.")
+            else:
+                parts.append(f"```\ndose = {rng.randint(1, 20) / 4}  # mg\n```")
+            parts.append('')
+        docs.append({'title': sentence(4, 9)[:-1], 'excerpt': sentence(15, 30), 'content': '\n'.join(parts)})
+    return docs
+
+
+def _benchmarks(docs):
+    from app import extract_keywords, calculate_similarity, has_similar_theme
+    from template_filters import markdown_filter, excerpt_filter, reading_time_filter
+
+    short_texts = [f"{d['title']} {d['excerpt']}" for d in docs]
+    keyword_sets = [extract_keywords(t) for t in short_texts]
+    query = keyword_sets[0]
+    seed_content = docs[0]['content']
+    markdown_docs = [d['content'] for d in docs[:25]]
+
+    return {
+        # Related-posts style: keywords for every post in the corpus
+        'extract_keywords[corpus]': lambda: [extract_keywords(t) for t in short_texts],
+        'extract_keywords[long]': lambda: [extract_keywords(d['content']) for d in docs[:50]],
+        'calculate_similarity[1xN]': lambda: [calculate_similarity(query, k) for k in keyword_sets],
+        'has_similar_theme[1xN]': lambda: [has_similar_theme(seed_content, d['content']) for d in docs],
+        'markdown_filter[25 docs]': lambda: [markdown_filter(t) for t in markdown_docs],
+        'excerpt_filter[corpus]': lambda: [excerpt_filter(d['content']) for d in docs],
+        'reading_time_filter[corpus]': lambda: [reading_time_filter(d['content']) for d in docs],
+    }
+
+
+def measure(fn, min_time=0.2, repeat=5):
+    """Best and median milliseconds per call of fn()."""
+    def timed(loops):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        return time.perf_counter() - started
+
+    fn()  # warm caches/imports
+    loops = 1
+    elapsed = timed(loops)
+    while elapsed < min_time:
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.1))
+        elapsed = timed(loops)
+    runs = sorted([elapsed / loops] + [timed(loops) / loops for _ in range(repeat - 1)])
+    return {'best_ms': runs[0] * 1000.0, 'median_ms': runs[len(runs) // 2] * 1000.0, 'loops': loops, 'repeat': repeat}
+
+
+def run(selected=None, min_time=0.2, repeat=5):
+    docs = build_corpus()
+    results = {}
+    for name, fn in _benchmarks(docs).items():
+        if selected and not any(s in name for s in selected):
+            continue
+        results[name] = measure(fn, min_time=min_time, repeat=repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Rows of (name, baseline_ms, current_ms, ratio, regressed)."""
+    rows = []
+    for name, row in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            rows.append((name, None, row['best_ms'], None, False))
+            continue
+        ratio = row['best_ms'] / base['best_ms'] if base['best_ms'] else None
+        rows.append((name, base['best_ms'], row['best_ms'], ratio, ratio is not None and ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='select', action='append', help='only run benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help=f'baseline file (default {DEFAULT_BASELINE})')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare with the baseline; exit 1 on regression')
+    parser.add_argument('--threshold', type=float, default=0.15, help='allowed slowdown before failing (default 0.15 = 15%%)')
+    args = parser.parse_args(argv)
+
+    # Importing app must not touch a real database
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ.setdefault('AUTO_EMBED', 'false')
+
+    results = run(args.select, min_time=args.min_time, repeat=args.repeat)
+    payload = {
+        'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results,
+    }
+
+    regressed = False
+    if args.compare:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except OSError:
+            print(f"No baseline at {args.baseline}; run with --save-baseline first", file=sys.stderr)
+            return 2
+        print(f"{'benchmark':<30}{'baseline ms':>13}{'current ms':>12}{'change':>9}")
+        for name, base_ms, cur_ms, ratio, bad in compare(results, baseline, args.threshold):
+            change = f"{(ratio - 1) * 100:+.1f}%" if ratio is not None else 'new'
+            base_txt = f"{base_ms:.3f}" if base_ms is not None else '-'
+            print(f"{name:<30}{base_txt:>13}{cur_ms:>12.3f}{change:>9}{'  REGRESSION' if bad else ''}")
+            regressed = regressed or bad
+    else:
+        print(f"{'benchmark':<30}{'best ms':>10}{'median ms':>11}{'loops':>7}")
+        for name, row in results.items():
+            print(f"{name:<30}{row['best_ms']:>10.3f}{row['median_ms']:>11.3f}{row['loops']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(payload, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(payload, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Page-N latency: OFFSET pagination (Flask-SQLAlchemy paginate()) vs keyset cursors.
+
+Seeds published blog posts into a scratch database (a temporary SQLite file by
+default, or BENCH_DATABASE_URL) and times fetching page N of /posts both ways:
+
+    python -m benchmarks.pagination --rows 50000 --page 100 --repeat 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def _setup_env(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['AUTO_EMBED'] = 'false'
+    os.environ.setdefault('SESSION_COOKIE_SECURE', 'false')
+
+
+def _seed(db, Post, User, rows):
+    user = User(google_id='bench-author', email='bench-author@example.com', name='Bench Author')
+    db.session.add(user)
+    db.session.flush()
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(rows):
+        batch.append({
+            'title': f'Post {i}', 'slug': f'bench-post-{i}', 'content': 'Lorem ipsum ' * 20,
+            # Several posts share a timestamp so the id tie-breaker matters
+            'author_id': user.id, 'status': 'published', 'created_at': start + timedelta(minutes=i // 3),
+            'view_count': 0,
+        })
+        if len(batch) >= 5000:
+            db.session.execute(Post.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Post.__table__.insert(), batch)
+    db.session.commit()
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--page', type=int, default=100)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args(argv)
+
+    tmp_path = None
+    database_url = os.getenv('BENCH_DATABASE_URL')
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = f'sqlite:///{tmp_path}'
+    _setup_env(database_url)
+
+    from app import app
+    from models import db, Post, User
+    from pagination import keyset_paginate, SortKey, encode_cursor
+
+    keys = [SortKey(Post.created_at, desc=True), SortKey(Post.id, desc=True)]
+    try:
+        with app.app_context():
+            db.create_all()
+            if Post.query.count() < args.rows:
+                _seed(db, Post, User, args.rows)
+
+            base = Post.query.filter_by(status='published')
+            offset = (args.page - 1) * args.per_page
+            # Cursor a user would hold after walking to page N-1
+            anchor = base.order_by(Post.created_at.desc(), Post.id.desc()).offset(offset - 1).first()
+            cursor = encode_cursor([anchor.created_at, anchor.id], 'posts')
+
+            def offset_page():
+                page = base.order_by(Post.created_at.desc()).paginate(
+                    page=args.page, per_page=args.per_page, error_out=False
+                )
+                return page.items
+
+            def keyset_page():
+                return keyset_paginate(base, keys, after=cursor, per_page=args.per_page, cursor_tag='posts').items
+
+            assert [p.id for p in keyset_page()] == [
+                p.id for p in base.order_by(Post.created_at.desc(), Post.id.desc())
+                .offset(offset).limit(args.per_page)
+            ], 'keyset and offset pages differ'
+
+            # Warm up caches/connection once each
+            offset_page()
+            keyset_page()
+            results = {
+                'offset+count': _time(offset_page, args.repeat),
+                'keyset': _time(keyset_page, args.repeat),
+            }
+
+        print(f"{args.rows} rows, page {args.page} x {args.per_page}, {args.repeat} runs ({database_url.split(':', 1)[0]})")
+        for name, samples in results.items():
+            samples.sort()
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            print(f"  {name:<14} p50 {statistics.median(samples):7.2f} ms   p95 {p95:7.2f} ms")
+    finally:
+        if tmp_path:
+            os.unlink(tmp_path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Seed a database with synthetic data at realistic volumes for benchmarking.
+
+Creates users (with carts, favorites, orders/payments and tracker cycles),
+categories, products, blog posts, and community posts with tags, votes and
+comments. Output is deterministic for a given --seed. Rows are bulk-inserted
+through Core, so ORM hooks (auto-embedding, view counters) are not involved;
+denormalised columns (score, comment_count, hot_rank) are filled in directly.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.seed --scale 1
+    DATABASE_URL=postgresql://... python -m benchmarks.seed --products 5000 --reset
+    DATABASE_URL=postgresql://... EMBEDDING_PROVIDER=hashing python -m benchmarks.seed --embed
+
+The first user (``bench-user-0@example.com``) always has a full cart, orders
+and active cycles; benchmarks.load logs in as that user.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+BENCH_USER_EMAIL = 'bench-user-0@example.com'
+
+PEPTIDES = [
+    'semaglutide', 'tirzepatide', 'retatrutide', 'liraglutide', 'bpc-157', 'tb-500', 'ipamorelin',
+    'cjc-1295', 'sermorelin', 'tesamorelin', 'ghk-cu', 'epitalon', 'selank', 'semax', 'aod-9604',
+]
+WORDS = [
+    'peptide', 'receptor', 'agonist', 'dosage', 'protocol', 'research', 'study', 'metabolic', 'weight',
+    'recovery', 'injection', 'cycle', 'results', 'purity', 'batch', 'storage', 'reconstitution', 'vial',
+    'bacteriostatic', 'water', 'half-life', 'titration', 'appetite', 'glucose', 'insulin', 'muscle',
+    'sleep', 'inflammation', 'tissue', 'healing', 'clinical', 'trial', 'analysis', 'hplc', 'mass',
+]
+TAGS = ['glp-1', 'healing', 'growth-hormone', 'nootropics', 'longevity', 'dosing', 'reconstitution',
+        'side-effects', 'stacking', 'research', 'beginners', 'results', 'storage', 'sourcing', 'bloodwork']
+SCALES = {
+    # users, categories, products, posts, community posts
+    0.1: (50, 6, 200, 200, 300),
+    1: (500, 12, 2000, 2000, 3000),
+    5: (2500, 20, 10000, 10000, 15000),
+}
+BATCH = 2000
+
+
+def _sentence(rng, n):
+    words = [rng.choice(WORDS + PEPTIDES) for _ in range(n)]
+    return ' '.join(words).capitalize() + '.'
+
+
+def _paragraphs(rng, count, sentences=5):
+    return '\n\n'.join(' '.join(_sentence(rng, rng.randint(8, 18)) for _ in range(sentences)) for _ in range(count))
+
+
+def _pick(rng, population, k):
+    return rng.sample(population, min(len(population), k))
+
+
+def _next_id(conn, table):
+    from sqlalchemy import func, select
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _insert(conn, table, rows):
+    for start in range(0, len(rows), BATCH):
+        conn.execute(table.insert(), rows[start:start + BATCH])
+
+
+def seed(users=500, categories=12, products=2000, posts=2000, community_posts=3000,
+         votes_per_post=8, comments_per_post=4, seed_value=42):
+    """Insert one batch of synthetic data into the app's database; returns row counts."""
+    from models import (
+        db, User, Category, Product, Post, CartItem, FavoriteProduct, Order, OrderItem, Payment,
+        PeptideCycle, DosageLog, ProgressEntry, CommunityPost, CommunityComment, CommunityVote,
+        CommunityTag, community_post_tags, compute_hot_rank,
+    )
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow().replace(microsecond=0)
+    counts = {}
+    t = {m.__name__: m.__table__ for m in (
+        User, Category, Product, Post, CartItem, FavoriteProduct, Order, OrderItem, Payment,
+        PeptideCycle, DosageLog, ProgressEntry, CommunityPost, CommunityComment, CommunityVote, CommunityTag,
+    )}
+
+    with db.engine.begin() as conn:
+        # Names are suffixed with the first new user id so repeated seeding appends instead of colliding
+        run = base = _next_id(conn, t['User'])
+        user_rows = [{
+            'id': base + i, 'google_id': f'bench-{run}-{i}',
+            'email': BENCH_USER_EMAIL if (i == 0 and run == 1) else f'bench-user-{run}-{i}@example.com',
+            'name': f'Bench User {i}', 'role': 'admin' if i == 0 else 'student', 'is_active': True,
+            'created_at': now - timedelta(days=rng.randint(0, 700)),
+        } for i in range(users)]
+        _insert(conn, t['User'], user_rows)
+        user_ids = [r['id'] for r in user_rows]
+        counts['users'] = users
+
+        base = _next_id(conn, t['Category'])
+        cat_rows = [{'id': base + i, 'name': f'Category {run}-{i}', 'slug': f'bench-category-{run}-{i}',
+                     'description': _sentence(rng, 12)} for i in range(categories)]
+        _insert(conn, t['Category'], cat_rows)
+        cat_ids = [r['id'] for r in cat_rows]
+        counts['categories'] = categories
+
+        base = _next_id(conn, t['Product'])
+        product_rows, prices = [], {}
+        for i in range(products):
+            pid = base + i
+            price = Decimal(rng.randint(2000, 30000)) / 100
+            sale = (price * Decimal('0.85')).quantize(Decimal('0.01')) if rng.random() < 0.2 else None
+            prices[pid] = sale if sale is not None else price
+            peptide = rng.choice(PEPTIDES)
+            product_rows.append({
+                'id': pid, 'name': f'{peptide.upper()} {rng.choice([2, 5, 10, 15])}mg #{pid}',
+                'slug': f'bench-product-{pid}', 'description': _paragraphs(rng, 3),
+                'short_description': _sentence(rng, 14), 'price': price, 'sale_price': sale,
+                'sku': f'BENCH-{pid}', 'stock_quantity': rng.choice([0, 3, 10, 25, 100]),
+                'category_id': rng.choice(cat_ids), 'status': 'active' if rng.random() < 0.95 else 'inactive',
+                'created_at': now - timedelta(minutes=rng.randint(0, 500000)),
+            })
+        _insert(conn, t['Product'], product_rows)
+        product_ids = [r['id'] for r in product_rows if r['status'] == 'active']
+        counts['products'] = products
+
+        base = _next_id(conn, t['Post'])
+        post_rows = []
+        for i in range(posts):
+            title = f"{_sentence(rng, 6)[:-1]} ({base + i})"
+            post_rows.append({
+                'id': base + i, 'title': title, 'slug': f'bench-post-{base + i}',
+                'content': _paragraphs(rng, rng.randint(4, 10)), 'excerpt': _sentence(rng, 25),
+                'author_id': rng.choice(user_ids[:10]), 'status': 'published' if rng.random() < 0.9 else 'draft',
+                'view_count': rng.randint(0, 5000), 'created_at': now - timedelta(minutes=rng.randint(0, 500000)),
+            })
+        _insert(conn, t['Post'], post_rows)
+        counts['posts'] = posts
+
+        base = _next_id(conn, t['CommunityTag'])
+        tag_rows = [{'id': base + i, 'name': f'{name}-{run}' if run > 1 else name,
+                     'slug': f'{name}-{run}' if run > 1 else name} for i, name in enumerate(TAGS)]
+        _insert(conn, t['CommunityTag'], tag_rows)
+        tag_ids = [r['id'] for r in tag_rows]
+
+        base = _next_id(conn, t['CommunityPost'])
+        cp_rows, link_rows, vote_rows, comment_rows = [], [], [], []
+        for i in range(community_posts):
+            cp_id = base + i
+            created = now - timedelta(minutes=rng.randint(0, 200000))
+            voters = _pick(rng, user_ids, rng.randint(0, votes_per_post * 2))
+            score = 0
+            for uid in voters:
+                value = 1 if rng.random() < 0.8 else -1
+                score += value
+                vote_rows.append({'post_id': cp_id, 'user_id': uid, 'value': value, 'created_at': created})
+            n_comments = rng.randint(0, comments_per_post * 2)
+            for _ in range(n_comments):
+                comment_rows.append({
+                    'post_id': cp_id, 'user_id': rng.choice(user_ids), 'content': _sentence(rng, rng.randint(6, 30)),
+                    'created_at': created + timedelta(minutes=rng.randint(1, 5000)),
+                })
+            for tag_id in _pick(rng, tag_ids, rng.randint(1, 3)):
+                link_rows.append({'post_id': cp_id, 'tag_id': tag_id})
+            cp_rows.append({
+                'id': cp_id, 'user_id': rng.choice(user_ids), 'title': _sentence(rng, rng.randint(5, 12))[:-1],
+                'slug': f'bench-community-{cp_id}', 'content': _paragraphs(rng, rng.randint(1, 4), 3),
+                'status': 'published', 'view_count': rng.randint(0, 2000), 'score': score,
+                'comment_count': n_comments, 'hot_rank': compute_hot_rank(score, n_comments, created),
+                'created_at': created,
+            })
+        _insert(conn, t['CommunityPost'], cp_rows)
+        _insert(conn, community_post_tags, link_rows)
+        _insert(conn, t['CommunityVote'], vote_rows)
+        _insert(conn, t['CommunityComment'], comment_rows)
+        counts.update(community_posts=community_posts, votes=len(vote_rows), comments=len(comment_rows))
+
+        # Per-user commerce and tracker data; the first user always gets the full set
+        cart_rows, fav_rows, payment_rows = [], [], []
+        order_base, item_rows, order_rows = _next_id(conn, t['Order']), [], []
+        cycle_base, cycle_rows, dose_rows, progress_rows = _next_id(conn, t['PeptideCycle']), [], [], []
+        for n, uid in enumerate(user_ids):
+            heavy = n == 0
+            for pid in _pick(rng, product_ids, 8 if heavy else rng.randint(0, 4)):
+                cart_rows.append({'user_id': uid, 'product_id': pid, 'quantity': rng.randint(1, 3)})
+            for pid in _pick(rng, product_ids, 20 if heavy else rng.randint(0, 6)):
+                fav_rows.append({'user_id': uid, 'product_id': pid})
+            for _ in range(25 if heavy else rng.randint(0, 3)):
+                oid = order_base + len(order_rows)
+                created = now - timedelta(minutes=rng.randint(0, 500000))
+                total = Decimal('0')
+                for pid in _pick(rng, product_ids, rng.randint(1, 5)):
+                    qty = rng.randint(1, 3)
+                    item_rows.append({'order_id': oid, 'product_id': pid, 'quantity': qty,
+                                      'price': prices[pid], 'total': prices[pid] * qty, 'created_at': created})
+                    total += prices[pid] * qty
+                paid = rng.random() < 0.8
+                order_rows.append({
+                    'id': oid, 'order_number': f'BENCH-{oid:08d}', 'user_id': uid, 'total_amount': total,
+                    'status': rng.choice(['pending', 'processing', 'shipped', 'delivered']),
+                    'payment_status': 'paid' if paid else 'pending', 'created_at': created,
+                    'shipping_address': {'name': 'Bench User', 'city': 'Springfield', 'country': 'US'},
+                })
+                payment_rows.append({'order_id': oid, 'amount': total, 'payment_method': 'stripe',
+                                     'status': 'completed' if paid else 'pending', 'created_at': created})
+            for _ in range(3 if heavy else (1 if rng.random() < 0.3 else 0)):
+                cid = cycle_base + len(cycle_rows)
+                start = (now - timedelta(days=rng.randint(10, 120))).date()
+                cycle_rows.append({'id': cid, 'user_id': uid, 'product_id': rng.choice(product_ids),
+                                   'name': f'{rng.choice(PEPTIDES).title()} cycle', 'start_date': start,
+                                   'target_dosage': Decimal('0.25'), 'frequency': 'weekly', 'status': 'active'})
+                for d in range(40 if heavy else 10):
+                    dose_rows.append({'cycle_id': cid, 'dosage_amount': Decimal('0.25'),
+                                      'injection_time': datetime.combine(start, datetime.min.time()) + timedelta(days=d * 2),
+                                      'injection_site': rng.choice(['stomach', 'thigh', 'arm'])})
+                for d in range(20 if heavy else 5):
+                    progress_rows.append({'cycle_id': cid, 'entry_date': start + timedelta(days=d * 3),
+                                          'weight': Decimal(rng.randint(700, 1000)) / 10,
+                                          'energy_level': rng.randint(3, 9)})
+        _insert(conn, t['CartItem'], cart_rows)
+        _insert(conn, t['FavoriteProduct'], fav_rows)
+        _insert(conn, t['Order'], order_rows)
+        _insert(conn, t['OrderItem'], item_rows)
+        _insert(conn, t['Payment'], payment_rows)
+        _insert(conn, t['PeptideCycle'], cycle_rows)
+        _insert(conn, t['DosageLog'], dose_rows)
+        _insert(conn, t['ProgressEntry'], progress_rows)
+        counts.update(cart_items=len(cart_rows), favorites=len(fav_rows), orders=len(order_rows),
+                      order_items=len(item_rows), cycles=len(cycle_rows), dosage_logs=len(dose_rows))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1, choices=sorted(SCALES),
+                        help='preset volume (default 1: 2k products/posts, 3k community posts)')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--posts', type=int)
+    parser.add_argument('--community-posts', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables first')
+    parser.add_argument('--embed', action='store_true',
+                        help='(re)build search embeddings with the configured EMBEDDING_PROVIDER (Postgres + pgvector)')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('AUTO_EMBED', 'false')
+    from app import app, upsert_search_documents
+    from models import db
+
+    users, categories, products, posts, community = SCALES[args.scale]
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        counts = seed(
+            users=args.users or users, categories=categories, products=args.products or products,
+            posts=args.posts or posts, community_posts=args.community_posts or community, seed_value=args.seed,
+        )
+        if args.embed:
+            counts['search documents'] = upsert_search_documents()
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {app.config['SQLALCHEMY_DATABASE_URI'].split('://', 1)[0]} in {elapsed:.1f}s")
+    for name, n in counts.items():
+        print(f"  {name:<16} {n}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Back-in-stock dispatch throughput.
+
+Creates one sold-out product with --alerts active StockAlert rows in a scratch
+SQLite database, restocks it (which enqueues the dispatch through the
+outbox, as in production), then drains the outbox with a fake mail transport
+that sleeps --send-ms per batch call:
+
+    python -m benchmarks.stock_alerts --alerts 20000 --send-ms 150
+
+For each --batch-size it reports batches, wall time and recipients per second,
+showing how per-call provider latency is amortised by larger batches.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+def run_once(app, alerts, batch_size):
+    from models import db, Product, StockAlert, Category
+    from outbox import drain_outbox
+    from stock_alerts import get_mail_transport
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        category = Category(name='Bench', slug='bench')
+        db.session.add(category)
+        db.session.flush()
+        product = Product(name='Bench Peptide', slug='bench-peptide', sku='BENCH-1', price=10,
+                          description='Benchmark product', stock_quantity=0, status='active',
+                          category_id=category.id)
+        db.session.add(product)
+        db.session.flush()
+        db.session.execute(StockAlert.__table__.insert(), [
+            {'product_id': product.id, 'email': f'bench{i}@example.com', 'active': True} for i in range(alerts)
+        ])
+        db.session.commit()
+
+        transport = get_mail_transport()
+        transport.sent.clear()
+        os.environ['STOCK_ALERT_BATCH_SIZE'] = str(batch_size)
+        product.stock_quantity = 25
+        db.session.commit()  # enqueues stock_alert.dispatch
+
+        started = time.perf_counter()
+        counts = drain_outbox()
+        elapsed = time.perf_counter() - started
+        remaining = StockAlert.query.filter_by(active=True).count()
+    assert counts['sent'] == 1 and remaining == 0, (counts, remaining)
+    recipients = sum(len(m['to']) for m in transport.sent)
+    return len(transport.sent), recipients, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=20000)
+    parser.add_argument('--send-ms', type=float, default=150, help='fake provider latency per batch call')
+    parser.add_argument('--batch-size', type=int, action='append', help='repeatable (default 50, 200, 1000)')
+    args = parser.parse_args(argv)
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmp_path}'
+    os.environ['AUTO_EMBED'] = 'false'
+    os.environ['MAIL_TRANSPORT'] = 'fake'
+    os.environ['MAIL_FAKE_LATENCY_MS'] = str(args.send_ms)
+    try:
+        from app import app
+        results = [(size, *run_once(app, args.alerts, size)) for size in (args.batch_size or [50, 200, 1000])]
+    finally:
+        os.unlink(tmp_path)
+
+    print(f"{args.alerts} alerts, fake transport {args.send_ms:g} ms per call")
+    print(f"{'batch size':>10}{'batches':>9}{'recipients':>12}{'seconds':>9}{'per second':>12}")
+    for size, batches, recipients, elapsed in results:
+        print(f"{size:>10}{batches:>9}{recipients:>12}{elapsed:>9.2f}{recipients / elapsed:>12.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
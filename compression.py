@@ -0,0 +1,331 @@
+"""
+WSGI response compression.
+
+`CompressionMiddleware` wraps the Flask WSGI app and negotiates ``br`` (when the
+brotli module is installed) or ``gzip`` from Accept-Encoding. Bodies smaller
+than the threshold, already-encoded responses and binary/precompressed content
+types are passed through untouched. Responses without a Content-Length are
+compressed chunk by chunk so streaming views keep streaming.
+
+Per-endpoint compression ratio and CPU time are collected in-process and
+exposed through `compression_stats()` (shown on the admin page) so the
+thresholds can be tuned from real traffic.
+"""
+
+import os
+import threading
+import time
+import zlib
+from itertools import chain
+
+from flask import request
+
+# Optional: brotli is preferred when available, gzip otherwise
+try:
+    import brotli  # type: ignore
+except Exception:  # pragma: no cover
+    brotli = None
+
+ENDPOINT_ENVIRON_KEY = 'propeptides.endpoint'
+
+# Content types that are already compressed or must not be buffered
+SKIP_CONTENT_TYPE_PREFIXES = (
+    'image/', 'video/', 'audio/', 'font/woff',
+    'application/zip', 'application/gzip', 'application/x-gzip', 'application/pdf',
+    'application/octet-stream', 'text/event-stream',
+)
+SKIP_STATUS_CODES = {204, 206, 304}
+
+
+def parse_accept_encoding(header: str | None) -> list:
+    """Return the encodings from an Accept-Encoding header that have q > 0."""
+    encodings = []
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            encodings.append(token)
+    return encodings
+
+
+class _Stats:
+    """Thread-safe per-endpoint compression counters for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_endpoint = {}
+
+    def _row(self, endpoint):
+        return self._by_endpoint.setdefault(endpoint or '<unknown>', {
+            'compressed': 0, 'skipped': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0,
+        })
+
+    def record_compressed(self, endpoint, bytes_in, bytes_out, cpu_seconds):
+        with self._lock:
+            row = self._row(endpoint)
+            row['compressed'] += 1
+            row['bytes_in'] += bytes_in
+            row['bytes_out'] += bytes_out
+            row['cpu_seconds'] += cpu_seconds
+
+    def record_skipped(self, endpoint):
+        with self._lock:
+            self._row(endpoint)['skipped'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            rows = [dict(endpoint=k, **v) for k, v in self._by_endpoint.items()]
+        for row in rows:
+            row['ratio'] = (row['bytes_out'] / row['bytes_in']) if row['bytes_in'] else None
+            row['cpu_ms_avg'] = (row['cpu_seconds'] * 1000.0 / row['compressed']) if row['compressed'] else 0.0
+        rows.sort(key=lambda r: r['cpu_seconds'], reverse=True)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._by_endpoint.clear()
+
+
+stats = _Stats()
+
+
+def compression_stats() -> list:
+    """Per-endpoint compression stats for this worker, most CPU-expensive first."""
+    return stats.snapshot()
+
+
+class _Encoder:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._c = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 -> gzip container
+            self._c = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        if self.encoding == 'br':
+            out = self._c.process(data)
+            return out + self._c.flush() if flush else out
+        out = self._c.compress(data)
+        return out + self._c.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._c.finish()
+        return self._c.flush(zlib.Z_FINISH)
+
+
+def _header(headers, name):
+    name = name.lower()
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+    return None
+
+
+def _without(headers, *names):
+    names = {n.lower() for n in names}
+    return [(k, v) for k, v in headers if k.lower() not in names]
+
+
+class CompressionMiddleware:
+    """Negotiated gzip/brotli compression for WSGI responses."""
+
+    def __init__(self, app, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _negotiate(self, environ):
+        accepted = parse_accept_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted or '*' in accepted:
+            return 'gzip'
+        return None
+
+    def _should_skip(self, status: str, headers) -> bool:
+        try:
+            code = int(status.split(' ', 1)[0])
+        except ValueError:
+            return True
+        if code in SKIP_STATUS_CODES or code < 200:
+            return True
+        if _header(headers, 'Content-Encoding'):
+            return True
+        if 'no-transform' in (_header(headers, 'Cache-Control') or '').lower():
+            return True
+        content_type = (_header(headers, 'Content-Type') or '').lower()
+        if not content_type or content_type.startswith(SKIP_CONTENT_TYPE_PREFIXES):
+            return True
+        length = _header(headers, 'Content-Length')
+        if length is not None and length.isdigit() and int(length) < self.min_size:
+            return True
+        return False
+
+    def _encoded_headers(self, headers, encoding, length=None):
+        out = _without(headers, 'Content-Length', 'Content-Encoding')
+        out.append(('Content-Encoding', encoding))
+        if length is not None:
+            out.append(('Content-Length', str(length)))
+        vary = _header(out, 'Vary')
+        if vary is None:
+            out.append(('Vary', 'Accept-Encoding'))
+        elif 'accept-encoding' not in vary.lower():
+            out = _without(out, 'Vary') + [('Vary', f'{vary}, Accept-Encoding')]
+        etag = _header(out, 'ETag')
+        if etag and not etag.startswith('W/'):
+            # Encoded bytes differ from the identity representation
+            out = _without(out, 'ETag') + [('ETag', f'W/{etag}')]
+        return out
+
+    def __call__(self, environ, start_response):
+        encoding = self._negotiate(environ)
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        state = {}
+
+        def _capture(status, headers, exc_info=None):
+            state['status'], state['headers'], state['exc_info'] = status, list(headers), exc_info
+            return self._unsupported_write
+
+        app_iter = self.app(environ, _capture)
+        iterator = iter(app_iter)
+        peeked = 'status' not in state
+        if peeked:
+            # The app delays start_response until its first chunk; peek it
+            try:
+                first = next(iterator)
+            except StopIteration:
+                first = b''
+            iterator = chain([first], iterator)
+
+        status, headers, exc_info = state['status'], state['headers'], state['exc_info']
+        endpoint = environ.get(ENDPOINT_ENVIRON_KEY)
+        if self._should_skip(status, headers):
+            stats.record_skipped(endpoint)
+            start_response(status, headers, exc_info)
+            # Hand back the original iterable when possible (keeps wsgi.file_wrapper)
+            return _ClosingIterator(iterator, app_iter) if peeked else app_iter
+
+        length = _header(headers, 'Content-Length')
+        if length is not None:
+            return self._compress_buffered(status, headers, exc_info, iterator, app_iter,
+                                           encoding, endpoint, start_response)
+        return self._compress_streaming(status, headers, exc_info, iterator, app_iter,
+                                        encoding, endpoint, start_response)
+
+    @staticmethod
+    def _unsupported_write(data):  # pragma: no cover
+        raise RuntimeError('CompressionMiddleware does not support the WSGI write() callable')
+
+    def _compress_buffered(self, status, headers, exc_info, iterator, app_iter, encoding, endpoint, start_response):
+        try:
+            body = b''.join(iterator)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        started = time.thread_time()
+        encoder = _Encoder(encoding, self.gzip_level, self.brotli_quality)
+        compressed = encoder.compress(body) + encoder.finish()
+        cpu = time.thread_time() - started
+        if len(compressed) >= len(body):
+            stats.record_skipped(endpoint)
+            start_response(status, headers, exc_info)
+            return [body]
+        stats.record_compressed(endpoint, len(body), len(compressed), cpu)
+        start_response(status, self._encoded_headers(headers, encoding, len(compressed)), exc_info)
+        return [compressed]
+
+    def _compress_streaming(self, status, headers, exc_info, iterator, app_iter, encoding, endpoint, start_response):
+        min_size = self.min_size
+        gzip_level, brotli_quality = self.gzip_level, self.brotli_quality
+        encoded_headers = self._encoded_headers(headers, encoding)
+
+        def generate():
+            pending, pending_size = [], 0
+            encoder = None
+            bytes_in = bytes_out = 0
+            cpu = 0.0
+            try:
+                for chunk in iterator:
+                    if not chunk:
+                        continue
+                    bytes_in += len(chunk)
+                    if encoder is None:
+                        # Hold small prefixes back until we know the body is worth compressing
+                        pending.append(chunk)
+                        pending_size += len(chunk)
+                        if pending_size < min_size:
+                            continue
+                        start_response(status, encoded_headers, exc_info)
+                        encoder = _Encoder(encoding, gzip_level, brotli_quality)
+                        chunk, pending = b''.join(pending), None
+                    started = time.thread_time()
+                    out = encoder.compress(chunk, flush=True)
+                    cpu += time.thread_time() - started
+                    if out:
+                        bytes_out += len(out)
+                        yield out
+                if encoder is None:
+                    body = b''.join(pending)
+                    stats.record_skipped(endpoint)
+                    start_response(status, headers + [('Content-Length', str(len(body)))], exc_info)
+                    yield body
+                    return
+                started = time.thread_time()
+                tail = encoder.finish()
+                cpu += time.thread_time() - started
+                bytes_out += len(tail)
+                stats.record_compressed(endpoint, bytes_in, bytes_out, cpu)
+                if tail:
+                    yield tail
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+
+        return generate()
+
+
+class _ClosingIterator:
+    """Pass-through iterable that still closes the wrapped app iterable."""
+
+    def __init__(self, iterator, app_iter):
+        self._iterator = iterator
+        self._app_iter = app_iter
+
+    def __iter__(self):
+        return self._iterator
+
+    def close(self):
+        if hasattr(self._app_iter, 'close'):
+            self._app_iter.close()
+
+
+def init_compression(app):
+    """Wrap app.wsgi_app with CompressionMiddleware unless COMPRESSION_ENABLED=false."""
+    if os.getenv('COMPRESSION_ENABLED', 'true').lower() != 'true':
+        return
+
+    @app.before_request
+    def _tag_endpoint_for_compression():
+        request.environ[ENDPOINT_ENVIRON_KEY] = request.endpoint
+
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        min_size=int(os.getenv('COMPRESSION_MIN_SIZE', '1024')),
+        gzip_level=int(os.getenv('COMPRESSION_GZIP_LEVEL', '6')),
+        brotli_quality=int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4')),
+    )
@@ -0,0 +1,119 @@
+"""
+Embedding providers for the vector search paths (SearchDocument + pgvector).
+
+EMBEDDING_PROVIDER selects the implementation:
+
+- ``openai``  OPENAI_EMBED_MODEL (default text-embedding-3-small) via the API.
+              This is the default when OPENAI_API_KEY is set.
+- ``hashing`` deterministic feature-hashing vectors computed in-process: no
+              network, no key, microseconds per document. Similarity is
+              lexical (shared words and word pairs), which is enough for
+              offline development, load tests and a zero-latency fallback.
+- ``none``    vector paths disabled; callers use their keyword fallbacks.
+              This is the default without an API key.
+
+Vectors from different providers are not comparable, so switching provider
+requires a reindex (Admin -> Reindex, or ``python -m benchmarks.seed --embed``).
+Vector search itself still needs Postgres with pgvector.
+"""
+
+import hashlib
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+
+from ai_client import ai_enabled, openai_request
+
+# Must match SearchDocument.embedding (Vector(1536))
+EMBEDDING_DIMENSIONS = 1536
+
+_TOKEN_RE = re.compile(r'[a-z0-9][a-z0-9\-]*[a-z0-9]|[a-z0-9]')
+
+
+class EmbeddingProvider(ABC):
+    name = 'base'
+    dimensions = EMBEDDING_DIMENSIONS
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        ...
+
+    def embed_one(self, text: str) -> list[float]:
+        return self.embed([text])[0]
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    name = 'openai'
+
+    def __init__(self, model: str = 'text-embedding-3-small'):
+        self.model = model
+
+    def embed(self, texts):
+        # Shared client; raises ai_client.AIUnavailable while the breaker is open
+        with openai_request('embeddings') as client:
+            resp = client.embeddings.create(model=self.model, input=list(texts))
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Signed feature hashing of word unigrams and bigrams, L2-normalised.
+
+    Uses blake2b rather than hash() so vectors are identical across processes
+    and restarts (PYTHONHASHSEED randomises str hashes).
+    """
+
+    name = 'hashing'
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _features(self, text):
+        tokens = _TOKEN_RE.findall((text or '').lower())
+        feats = Counter(tokens)
+        feats.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        return feats
+
+    def embed_one(self, text):
+        vec = [0.0] * self.dimensions
+        for feature, tf in self._features(text).items():
+            h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+            # Sublinear term frequency; one hash bit picks the sign to reduce collision bias
+            vec[h % self.dimensions] += (1.0 + math.log(tf)) * (1.0 if (h >> 63) & 1 else -1.0)
+        norm = math.sqrt(sum(v * v for v in vec))
+        if norm:
+            vec = [v / norm for v in vec]
+        return vec
+
+    def embed(self, texts):
+        return [self.embed_one(t) for t in texts]
+
+
+_provider = None
+_configured = False
+
+
+def _build_provider():
+    name = os.getenv('EMBEDDING_PROVIDER', 'openai' if os.getenv('OPENAI_API_KEY') else 'none').lower()
+    if name == 'hashing':
+        return HashingEmbeddingProvider()
+    if name == 'openai' and ai_enabled():
+        return OpenAIEmbeddingProvider(model=os.getenv('OPENAI_EMBED_MODEL', 'text-embedding-3-small'))
+    return None
+
+
+def get_embedding_provider():
+    """The configured EmbeddingProvider, or None when embeddings are disabled."""
+    global _provider, _configured
+    if not _configured:
+        _provider = _build_provider()
+        _configured = True
+    return _provider
+
+
+def set_embedding_provider(provider):
+    """Override the provider (tests, benchmarks); None disables vector paths."""
+    global _provider, _configured
+    _provider = provider
+    _configured = True
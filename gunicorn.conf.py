@@ -0,0 +1,32 @@
+"""
+Gunicorn settings (used by the nixpacks start command).
+
+Workers are separate processes, so Prometheus metrics are written to
+PROMETHEUS_MULTIPROC_DIR and aggregated by /metrics. The directory is wiped
+when the master starts, and a worker's live gauges are dropped when it exits.
+"""
+
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '4'))
+timeout = 120
+
+# Must be set before workers import prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'propeptides-metrics'))
+
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except Exception:
+        return
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,177 @@
+"""
+Prometheus metrics.
+
+- ``http_request_duration_seconds`` histogram and ``http_requests_total``
+  counter per Flask endpoint/method (status on the counter), plus
+  ``http_request_exceptions_total`` for unhandled errors.
+- ``outbound_request_duration_seconds`` / ``outbound_request_errors_total``
+  per service and operation, recorded by wrapping call sites in
+  `track_outbound('openai', 'embeddings')`.
+- ``assistant_stage_duration_seconds`` per assistant pipeline stage
+  (embed, moderation, retrieval, moderation_wait, chat, total).
+- ``circuit_breaker_events_total`` (calls, rejections and state changes) and
+  ``circuit_breaker_open`` (workers whose breaker is open) per service.
+- ``db_pool_*`` gauges for the SQLAlchemy connection pool, updated by each
+  worker after every request.
+
+Gunicorn runs several worker processes, so when PROMETHEUS_MULTIPROC_DIR is
+set (gunicorn.conf.py does this) every worker writes its samples there and
+``/metrics`` aggregates all of them. The endpoint is only served when
+METRICS_TOKEN is set, and requires ``Authorization: Bearer <METRICS_TOKEN>``.
+
+prometheus_client is optional; without it everything here is a no-op and
+``/metrics`` returns 503.
+"""
+
+import hmac
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, abort, g, got_request_exception, request
+
+# Optional: metrics are disabled without it
+try:
+    from prometheus_client import (  # type: ignore
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+    )
+except Exception:  # pragma: no cover
+    Counter = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+if Counter is not None:
+    REQUEST_LATENCY = Histogram(
+        'http_request_duration_seconds', 'Flask request latency by endpoint',
+        ['endpoint', 'method'], buckets=LATENCY_BUCKETS,
+    )
+    REQUEST_COUNT = Counter(
+        'http_requests_total', 'Flask requests by endpoint and status', ['endpoint', 'method', 'status'],
+    )
+    REQUEST_EXCEPTIONS = Counter(
+        'http_request_exceptions_total', 'Unhandled exceptions by endpoint', ['endpoint', 'exception'],
+    )
+    OUTBOUND_LATENCY = Histogram(
+        'outbound_request_duration_seconds', 'Latency of calls to external services',
+        ['service', 'operation'], buckets=LATENCY_BUCKETS,
+    )
+    OUTBOUND_ERRORS = Counter(
+        'outbound_request_errors_total', 'Failed calls to external services', ['service', 'operation', 'exception'],
+    )
+    ASSISTANT_STAGE_LATENCY = Histogram(
+        'assistant_stage_duration_seconds', 'AI assistant latency by pipeline stage',
+        ['endpoint', 'stage'], buckets=LATENCY_BUCKETS,
+    )
+    CIRCUIT_EVENTS = Counter(
+        'circuit_breaker_events_total', 'Circuit breaker outcomes and state changes', ['service', 'event'],
+    )
+    CIRCUIT_OPEN = Gauge(
+        'circuit_breaker_open', 'Workers whose circuit breaker is open', ['service'], multiprocess_mode='livesum',
+    )
+    # livesum: add up live workers, drop a worker's value when it exits
+    DB_POOL_SIZE = Gauge('db_pool_size', 'Configured pool size', multiprocess_mode='livesum')
+    DB_POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Connections in use', multiprocess_mode='livesum')
+    DB_POOL_CHECKED_IN = Gauge('db_pool_checked_in', 'Idle connections in the pool', multiprocess_mode='livesum')
+    DB_POOL_OVERFLOW = Gauge('db_pool_overflow', 'Connections open beyond pool_size', multiprocess_mode='livesum')
+
+
+@contextmanager
+def track_outbound(service: str, operation: str):
+    """Time a call to an external service and count failures.
+
+        with track_outbound('openai', 'embeddings'):
+            client.embeddings.create(...)
+    """
+    if Counter is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        OUTBOUND_ERRORS.labels(service, operation, type(e).__name__).inc()
+        raise
+    finally:
+        OUTBOUND_LATENCY.labels(service, operation).observe(time.perf_counter() - started)
+
+
+def observe_stages(endpoint: str, timings: dict):
+    """Record {stage: seconds} from one assistant request."""
+    if Counter is None:
+        return
+    for stage, seconds in timings.items():
+        ASSISTANT_STAGE_LATENCY.labels(endpoint, stage).observe(seconds)
+
+
+def record_circuit_event(service: str, event: str, state: str | None = None):
+    """Count a breaker event; pass the new state on transitions."""
+    if Counter is None:
+        return
+    CIRCUIT_EVENTS.labels(service, event).inc()
+    if state is not None:
+        CIRCUIT_OPEN.labels(service).set(1 if state == 'open' else 0)
+
+
+def _endpoint() -> str:
+    # Unmatched URLs share one label so 404 scans can't blow up cardinality
+    return request.endpoint or '<unmatched>'
+
+
+def _start_timer():
+    g._metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is not None:
+        endpoint = _endpoint()
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        REQUEST_COUNT.labels(endpoint, request.method, str(response.status_code)).inc()
+    _update_pool_gauges()
+    return response
+
+
+def _record_exception(sender, exception, **extra):
+    REQUEST_EXCEPTIONS.labels(_endpoint(), type(exception).__name__).inc()
+
+
+def _update_pool_gauges():
+    try:
+        from models import db
+        pool = db.engine.pool
+        DB_POOL_SIZE.set(pool.size())
+        DB_POOL_CHECKED_OUT.set(pool.checkedout())
+        DB_POOL_CHECKED_IN.set(pool.checkedin())
+        DB_POOL_OVERFLOW.set(max(0, pool.overflow()))
+    except Exception:
+        # Pools without these counters (e.g. StaticPool/NullPool) simply aren't reported
+        pass
+
+
+def metrics_view():
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    auth = request.headers.get('Authorization', '')
+    supplied = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return Response('Unauthorized\n', status=401, headers={'WWW-Authenticate': 'Bearer'})
+    if Counter is None:
+        return Response('prometheus_client is not installed\n', status=503, mimetype='text/plain')
+
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST, headers={'Cache-Control': 'no-store'})
+
+
+def init_metrics(app):
+    """Register request instrumentation and the /metrics endpoint."""
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    if Counter is None or os.getenv('METRICS_ENABLED', 'true').lower() != 'true':
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    got_request_exception.connect(_record_exception, app)
@@ -2,6 +2,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 import enum
+import math
 try:
     # Optional: only available when using Postgres with pgvector
     from pgvector.sqlalchemy import Vector  # type: ignore
@@ -218,32 +219,67 @@ community_post_tags = db.Table(
     db.Column('tag_id', db.Integer, db.ForeignKey('community_tag.id'), primary_key=True)
 )
 
+db.Index('ix_community_post_tags_tag_id', community_post_tags.c.tag_id, community_post_tags.c.post_id)
+
+# "Hot" ranking: log-scaled engagement plus a creation-time term. Because the time term
+# only depends on created_at, ranks stay comparable as posts age and only need to be
+# recomputed when score/comment_count change.
+HOT_RANK_EPOCH = datetime(2025, 1, 1)
+HOT_RANK_DECAY_SECONDS = 45000  # a post this much newer needs 10x less engagement to rank level
+HOT_RANK_COMMENT_WEIGHT = 0.5
+
+def compute_hot_rank(score, comment_count, created_at):
+    engagement = (score or 0) + HOT_RANK_COMMENT_WEIGHT * (comment_count or 0)
+    sign = 1 if engagement > 0 else -1 if engagement < 0 else 0
+    order = math.log10(max(abs(engagement), 1))
+    seconds = ((created_at or datetime.utcnow()) - HOT_RANK_EPOCH).total_seconds()
+    return round(sign * order + seconds / HOT_RANK_DECAY_SECONDS, 7)
+
 class CommunityPost(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     slug = db.Column(db.String(200), unique=True, nullable=False)
     content = db.Column(db.Text, nullable=False)
-    status = db.Column(db.String(20), default='published')  # draft, published, archived
+    # draft, published, archived; pending/hidden while/after queued moderation (COMMUNITY_MODERATION_MODE=async)
+    status = db.Column(db.String(20), default='published')
     view_count = db.Column(db.Integer, default=0)
     comment_count = db.Column(db.Integer, default=0)
     score = db.Column(db.Integer, default=0)  # upvotes - downvotes
+    hot_rank = db.Column(db.Float, nullable=False, default=0.0)  # see compute_hot_rank
+    moderated_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user = db.relationship('User', backref='community_posts')
     tags = db.relationship('CommunityTag', secondary=community_post_tags, backref='posts')
 
+    __table_args__ = (
+        db.Index('ix_community_post_status_hot_rank', 'status', 'hot_rank'),
+    )
+
+@db.event.listens_for(CommunityPost, 'before_insert')
+def _set_initial_hot_rank(mapper, connection, target):
+    if target.created_at is None:
+        target.created_at = datetime.utcnow()
+    target.hot_rank = compute_hot_rank(target.score, target.comment_count, target.created_at)
+
 class CommunityComment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     post_id = db.Column(db.Integer, db.ForeignKey('community_post.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='published')  # pending, published, hidden
+    moderated_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     post = db.relationship('CommunityPost', backref='comments')
     user = db.relationship('User')
 
+    __table_args__ = (
+        db.Index('ix_community_comment_status', 'status', 'id'),
+    )
+
 class CommunityVote(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     post_id = db.Column(db.Integer, db.ForeignKey('community_post.id'), nullable=False)
@@ -281,4 +317,31 @@ class SearchDocument(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('kind', 'ref_id', name='uq_search_document_kind_ref'),
-    )
\ No newline at end of file
+    )
+
+
+class ServerSession(db.Model):
+    """Server-side session data (SESSION_BACKEND=database); the cookie holds only the signed id."""
+    __tablename__ = 'server_session'
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)  # Flask's tagged JSON
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class OutboxMessage(db.Model):
+    """Outbound side effect (API call, email) committed with the change that caused it; see outbox.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # handler name, e.g. 'mailgun.list_member'
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # next attempt
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_outbox_message_status_available', 'status', 'available_at'),
+    )
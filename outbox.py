@@ -0,0 +1,235 @@
+"""
+Transactional outbox for outbound side effects.
+
+Routes don't call third-party APIs inline. They `enqueue()` an OutboxMessage
+in the same session as the business change, so the message is committed
+if and only if the change is:
+
+    sub = NewsletterSubscriber(email=email)
+    db.session.add(sub)
+    enqueue('mailgun.list_member', {'address': email, 'name': name})
+    db.session.commit()
+
+``flask outbox-worker --loop`` drains the table. It claims due messages with
+FOR UPDATE SKIP LOCKED (so several workers can run), groups them by kind and
+hands each group to its handler in one call: the Mailgun handler upserts a
+whole batch of list members with one request over a pooled HTTP session.
+
+The claimed rows stay locked, in an open transaction, until every handler in
+the batch has returned. Each provider call is capped by HTTP_TIMEOUT, so the
+lock is held for at most (provider calls in the batch) x HTTP_TIMEOUT: one
+Mailgun call per 1000 members, but up to batch_size x HTTP_TIMEOUT for a
+handler that calls once per message. Other workers skip locked rows instead
+of waiting, but keep --batch-size small enough that this bound stays under
+the database's idle-in-transaction and statement timeouts.
+
+A failed group is retried with exponential backoff (OUTBOX_BACKOFF_BASE
+seconds doubling up to OUTBOX_BACKOFF_MAX, with jitter). After
+OUTBOX_MAX_ATTEMPTS it is marked failed and left for inspection. Handlers
+must be safe to repeat, because a crash after the provider call but before
+the commit delivers the message again. Sent messages are purged after
+OUTBOX_RETENTION_DAYS. Queue depth and delivery latency are shown on the
+admin page.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import track_outbound
+from models import db, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+BACKOFF_BASE_SECONDS = float(os.getenv('OUTBOX_BACKOFF_BASE', '30'))
+BACKOFF_MAX_SECONDS = float(os.getenv('OUTBOX_BACKOFF_MAX', '3600'))
+RETENTION_DAYS = float(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+# (connect, read) seconds for provider calls; the worker can afford to wait longer than a request could
+HTTP_TIMEOUT = (3.05, float(os.getenv('OUTBOX_HTTP_TIMEOUT', '20')))
+
+# kind -> handler(payloads: list[dict]); raising fails (and later retries) the whole group.
+# Handlers must not commit or roll back db.session: it holds the batch's claim and outcomes.
+HANDLERS = {}
+
+
+def outbox_handler(kind: str):
+    """Register the function that delivers messages of `kind`."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(kind: str, payload: dict, delay: float = 0) -> OutboxMessage:
+    """Add a message to the current session; it is sent only if the caller commits."""
+    msg = OutboxMessage(
+        kind=kind, payload=json.dumps(payload), status='pending', attempts=0,
+        available_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(msg)
+    return msg
+
+
+_http = None
+_http_pid = None
+_http_lock = threading.Lock()
+
+
+def outbox_http():
+    """This process's pooled requests.Session for outbox deliveries."""
+    global _http, _http_pid
+    if _http is None or _http_pid != os.getpid():
+        with _http_lock:
+            if _http is None or _http_pid != os.getpid():
+                http = requests.Session()
+                http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+                _http, _http_pid = http, os.getpid()
+    return _http
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def drain_outbox(batch_size: int = 100) -> dict:
+    """Deliver one batch of due messages; returns counts of sent/retried/failed messages.
+
+    The batch's row locks are held while its handlers run (see the module docstring).
+    """
+    now = datetime.utcnow()
+    messages = (OutboxMessage.query
+                .filter(OutboxMessage.status == 'pending', OutboxMessage.available_at <= now)
+                .order_by(OutboxMessage.id).limit(batch_size)
+                .with_for_update(skip_locked=True).all())
+    counts = {'sent': 0, 'retried': 0, 'failed': 0}
+    if not messages:
+        db.session.rollback()
+        return counts
+
+    groups = {}
+    for msg in messages:
+        groups.setdefault(msg.kind, []).append(msg)
+    for kind, group in groups.items():
+        handler = HANDLERS.get(kind)
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f'no outbox handler for {kind!r}')
+            handler([json.loads(m.payload) for m in group])
+            error = None
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'[:1000]
+        logger.info('outbox kind=%s messages=%d ms=%.0f error=%s',
+                    kind, len(group), (time.perf_counter() - started) * 1000.0, error)
+        done_at = datetime.utcnow()
+        for msg in group:
+            msg.attempts += 1
+            if error is None:
+                msg.status, msg.sent_at, msg.last_error = 'sent', done_at, None
+                counts['sent'] += 1
+            elif msg.attempts >= MAX_ATTEMPTS or handler is None:
+                msg.status, msg.last_error = 'failed', error
+                counts['failed'] += 1
+            else:
+                msg.available_at = done_at + timedelta(seconds=_backoff(msg.attempts))
+                msg.last_error = error
+                counts['retried'] += 1
+    db.session.commit()
+    return counts
+
+
+def purge_sent(days: float = RETENTION_DAYS) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    removed = (OutboxMessage.query.filter(OutboxMessage.status == 'sent', OutboxMessage.sent_at < cutoff)
+               .delete(synchronize_session=False))
+    db.session.commit()
+    return removed
+
+
+def outbox_stats(recent: int = 200) -> dict:
+    """Queue depth, oldest due message and created->sent latency over the last `recent` deliveries."""
+    rows = dict(db.session.query(OutboxMessage.status, db.func.count()).group_by(OutboxMessage.status).all())
+    oldest = (db.session.query(db.func.min(OutboxMessage.available_at))
+              .filter(OutboxMessage.status == 'pending').scalar())
+    sent = (db.session.query(OutboxMessage.created_at, OutboxMessage.sent_at)
+            .filter(OutboxMessage.status == 'sent').order_by(OutboxMessage.sent_at.desc()).limit(recent).all())
+    waits = sorted((r.sent_at - r.created_at).total_seconds() for r in sent if r.created_at)
+    now = datetime.utcnow()
+    return {
+        'pending': rows.get('pending', 0),
+        'sent': rows.get('sent', 0),
+        'failed': rows.get('failed', 0),
+        'oldest_due_s': max(0.0, (now - oldest).total_seconds()) if oldest else None,
+        'recent': len(waits),
+        'latency_avg_s': sum(waits) / len(waits) if waits else None,
+        'latency_p95_s': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+    }
+
+
+# ---------------------------------
+# Handlers
+# ---------------------------------
+
+@outbox_handler('mailgun.list_member')
+def send_mailgun_list_members(payloads):
+    """Upsert newsletter subscribers into MAILGUN_LIST_ADDRESS, up to 1000 per request."""
+    mg_key = os.getenv('MAILGUN_API_KEY')
+    mg_list = os.getenv('MAILGUN_LIST_ADDRESS')
+    if not (mg_key and mg_list):
+        raise RuntimeError('MAILGUN_API_KEY / MAILGUN_LIST_ADDRESS not configured')
+    # Later messages for the same address win (e.g. a name added on re-subscribe)
+    members = {p['address']: {'address': p['address'], 'name': p.get('name') or '', 'subscribed': True}
+               for p in payloads}
+    members = list(members.values())
+    for i in range(0, len(members), 1000):
+        with track_outbound('mailgun', 'list_members_bulk'):
+            resp = outbox_http().post(
+                f"https://api.mailgun.net/v3/lists/{mg_list}/members.json",
+                auth=('api', mg_key),
+                data={'members': json.dumps(members[i:i + 1000]), 'upsert': 'yes'},
+                timeout=HTTP_TIMEOUT,
+            )
+            resp.raise_for_status()
+
+
+def init_outbox(app):
+    """Register the outbox worker command."""
+
+    @app.cli.command('outbox-worker')
+    @click.option('--batch-size', default=100, show_default=True, help='Messages claimed (and locked) per transaction.')
+    @click.option('--loop', is_flag=True, help='Keep polling for new messages.')
+    @click.option('--interval', default=2.0, show_default=True, help='Seconds between polls when nothing is due.')
+    def outbox_worker_command(batch_size, loop, interval):
+        """Deliver queued outbound messages (Mailgun, notifications)."""
+        next_purge = 0.0
+        while True:
+            try:
+                counts = drain_outbox(batch_size)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Outbox batch failed ({type(e).__name__}: {e})")
+                counts = None
+            if counts and any(counts.values()):
+                print(f"Sent {counts['sent']}, retrying {counts['retried']}, failed {counts['failed']}")
+                continue  # drain the backlog before sleeping
+            if time.monotonic() >= next_purge:
+                next_purge = time.monotonic() + 3600
+                try:
+                    removed = purge_sent()
+                    if removed:
+                        print(f"Purged {removed} sent messages older than {RETENTION_DAYS:g} days")
+                except Exception:
+                    db.session.rollback()
+            if not loop:
+                break
+            time.sleep(interval)
@@ -0,0 +1,200 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of ``LIMIT n OFFSET (page-1)*n`` plus a ``COUNT(*)`` (what
+Flask-SQLAlchemy's ``paginate()`` does), pages are addressed by the sort key of
+the last/first row the user saw, so page 100 costs the same index seek as
+page 1. Cursors are opaque URL-safe tokens; totals are optional and can be a
+planner estimate on Postgres.
+
+    page = keyset_paginate(
+        Post.query.filter_by(status='published'),
+        [SortKey(Post.created_at, desc=True), SortKey(Post.id, desc=True)],
+        after=request.args.get('after'), before=request.args.get('before'),
+        per_page=10, cursor_tag='posts:new',
+    )
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class SortKey:
+    """One column/expression of a keyset ordering.
+
+    `value` extracts the same value from a result row; it defaults to reading the
+    column's attribute name, and must be given for computed expressions.
+    """
+
+    def __init__(self, expr, desc: bool = True, value=None):
+        self.expr = expr
+        self.desc = desc
+        if value is None:
+            name = getattr(expr, 'key', None)
+            value = lambda obj: getattr(obj, name)
+        self.value = value
+
+
+class KeysetPage:
+    def __init__(self, items, per_page, has_next, has_prev, next_cursor, prev_cursor,
+                 total=None, total_is_estimate=False):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(v):
+    if isinstance(v, datetime):
+        return {'dt': v.isoformat()}
+    if isinstance(v, date):
+        return {'d': v.isoformat()}
+    if isinstance(v, Decimal):
+        return {'n': str(v)}
+    return v
+
+
+def _decode_value(v):
+    if isinstance(v, dict):
+        if 'dt' in v:
+            return datetime.fromisoformat(v['dt'])
+        if 'd' in v:
+            return date.fromisoformat(v['d'])
+        if 'n' in v:
+            return Decimal(v['n'])
+    return v
+
+
+def encode_cursor(values, tag: str = '') -> str:
+    payload = json.dumps({'t': tag, 'v': [_encode_value(v) for v in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str | None, tag: str = '', size: int | None = None):
+    """Return the cursor's key values, or None for a missing/invalid/foreign cursor."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        if payload.get('t') != tag:
+            return None
+        values = [_decode_value(v) for v in payload['v']]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+    if size is not None and len(values) != size:
+        return None
+    return values
+
+
+def _seek_condition(keys, values, forward: bool):
+    """Lexicographic "(k1, k2, ...) comes after/before (v1, v2, ...)" for mixed directions."""
+    clauses = []
+    for i, key in enumerate(keys):
+        # Moving forward along a DESC key means smaller values
+        go_smaller = key.desc == forward
+        cmp = key.expr < values[i] if go_smaller else key.expr > values[i]
+        equal_prefix = [keys[j].expr == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, cmp) if equal_prefix else cmp)
+    return or_(*clauses)
+
+
+class _Explain(Executable, ClauseElement):
+    """``EXPLAIN (FORMAT JSON) <statement>``, keeping the statement's bound parameters."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+def estimate_count(query) -> int | None:
+    """Planner row estimate for a query on Postgres; None elsewhere."""
+    session = query.session
+    bind = session.get_bind()
+    if bind.dialect.name not in ('postgresql', 'postgres'):
+        return None
+    # User input (search terms, filters) stays in bound parameters, never in the SQL text
+    plan = session.execute(_Explain(query.order_by(None).statement)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def keyset_paginate(query, keys, after=None, before=None, per_page: int = 10,
+                    count: str | None = None, cursor_tag: str = ''):
+    """Fetch one page of `query` ordered by `keys` (a list of SortKey, ending in a unique key).
+
+    `after`/`before` are cursors from a previous page's next_cursor/prev_cursor.
+    `count` is None (no total), 'exact' (COUNT(*)) or 'estimate' (planner estimate on
+    Postgres, exact elsewhere).
+    """
+    total, total_is_estimate = None, False
+    if count == 'estimate':
+        try:
+            total = estimate_count(query)
+            total_is_estimate = total is not None
+        except Exception:
+            total = None
+    if count in ('exact', 'estimate') and total is None:
+        total = query.order_by(None).count()
+
+    after_values = decode_cursor(after, cursor_tag, len(keys))
+    before_values = decode_cursor(before, cursor_tag, len(keys)) if after_values is None else None
+    backwards = before_values is not None
+
+    q = query
+    if after_values is not None:
+        q = q.filter(_seek_condition(keys, after_values, forward=True))
+    elif backwards:
+        q = q.filter(_seek_condition(keys, before_values, forward=False))
+
+    ordering = []
+    for key in keys:
+        # Walking backwards = reversed ordering, then flip the rows back
+        descending = key.desc != backwards
+        ordering.append(key.expr.desc() if descending else key.expr.asc())
+    rows = q.order_by(None).order_by(*ordering).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = after_values is not None, more
+
+    def cursor_for(obj):
+        return encode_cursor([key.value(obj) for key in keys], cursor_tag)
+
+    return KeysetPage(
+        items=rows,
+        per_page=per_page,
+        has_next=has_next and bool(rows),
+        has_prev=has_prev and bool(rows),
+        next_cursor=cursor_for(rows[-1]) if rows else None,
+        prev_cursor=cursor_for(rows[0]) if rows else None,
+        total=total,
+        total_is_estimate=total_is_estimate,
+    )
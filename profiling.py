@@ -0,0 +1,225 @@
+"""
+Opt-in sampling profiler for production requests (PROFILER_ENABLED=true).
+
+While enabled, one background thread samples the Python stack of every
+in-flight request thread every PROFILE_INTERVAL_MS via sys._current_frames().
+When a request finishes its samples are kept if either
+
+- it was picked for profiling up front (PROFILE_SAMPLE_RATE, 0..1), or
+- it took at least PROFILE_SLOW_MS,
+
+and discarded otherwise. Sampling never pauses the request thread, so the
+cost is roughly one stack walk per active request per interval.
+
+Kept profiles are written to PROFILE_DIR (default ``<instance>/profiles``) as
+collapsed stacks (``frame;frame;frame count`` lines, readable by flamegraph.pl
+or speedscope) plus a JSON metadata file. The directory is a ring buffer
+capped at PROFILE_MAX_FILES profiles, oldest removed first.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID_RE = re.compile(r'^\d{13}-[0-9a-f]{8}$')
+MAX_STACK_DEPTH = 200
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Root-first 'a;b;c' key for a thread's current stack."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+class _Capture:
+    def __init__(self, sampled: bool):
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self.samples = Counter()
+
+
+class SamplingProfiler:
+    def __init__(self, directory: str, sample_rate: float = 0.01, slow_ms: float = 1000.0,
+                 interval_ms: float = 5.0, max_files: int = 200):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000.0
+        self.interval_ms = interval_ms
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._active = {}
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    # -- request hooks -------------------------------------------------
+
+    def start_request(self):
+        capture = _Capture(sampled=random.random() < self.sample_rate)
+        g._profile_capture = capture
+        with self._lock:
+            self._active[threading.get_ident()] = capture
+        self._ensure_thread()
+        self._wake.set()
+
+    def finish_request(self, status_code=None):
+        capture = g.pop('_profile_capture', None)
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        if capture is None:
+            return None
+        duration_ms = (time.perf_counter() - capture.started) * 1000.0
+        slow = duration_ms >= self.slow_ms
+        if not (capture.sampled or slow) or not capture.samples:
+            return None
+        meta = {
+            'endpoint': request.endpoint or '<unmatched>',
+            'method': request.method,
+            # Path only; query strings can carry tokens
+            'path': request.path,
+            'status': status_code,
+            'duration_ms': round(duration_ms, 1),
+            'started_at': capture.started_at.isoformat(timespec='seconds'),
+            'reason': 'slow' if slow else 'sampled',
+            'samples': sum(capture.samples.values()),
+            'interval_ms': self.interval_ms,
+        }
+        try:
+            return self._write(capture.samples, meta)
+        except Exception:
+            logger.exception('Failed to write request profile')
+            return None
+
+    # -- sampler thread ------------------------------------------------
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, so track the owning pid
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            for ident, capture in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    capture.samples[collapse_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+    # -- storage -------------------------------------------------------
+
+    def _write(self, samples: Counter, meta: dict) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        meta['id'] = profile_id
+        with open(os.path.join(self.directory, f"{profile_id}.collapsed"), 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, f"{profile_id}.json"), 'w') as f:
+            json.dump(meta, f)
+        self._trim()
+        return profile_id
+
+    def _trim(self):
+        ids = sorted(self._ids())
+        for profile_id in ids[:max(0, len(ids) - self.max_files)]:
+            for ext in ('.json', '.collapsed'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + ext))
+                except OSError:
+                    pass
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [n[:-5] for n in names if n.endswith('.json') and PROFILE_ID_RE.match(n[:-5])]
+
+    def list_profiles(self) -> list:
+        """Metadata for stored profiles, slowest first."""
+        profiles = []
+        for profile_id in self._ids():
+            try:
+                with open(os.path.join(self.directory, f"{profile_id}.json")) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        profiles.sort(key=lambda p: p.get('duration_ms') or 0, reverse=True)
+        return profiles
+
+    def profile_path(self, profile_id: str) -> str | None:
+        """Path of a stored collapsed-stack file, or None for unknown/invalid ids."""
+        if not PROFILE_ID_RE.match(profile_id or ''):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.collapsed")
+        return path if os.path.exists(path) else None
+
+
+def get_profiler():
+    """The app's SamplingProfiler, or None when profiling is disabled."""
+    return current_app.extensions.get('profiler')
+
+
+def init_profiling(app):
+    if os.getenv('PROFILER_ENABLED', 'false').lower() != 'true':
+        return None
+    profiler = SamplingProfiler(
+        directory=os.getenv('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles'),
+        sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0.01')),
+        slow_ms=float(os.getenv('PROFILE_SLOW_MS', '1000')),
+        interval_ms=float(os.getenv('PROFILE_INTERVAL_MS', '5')),
+        max_files=int(os.getenv('PROFILE_MAX_FILES', '200')),
+    )
+    app.extensions['profiler'] = profiler
+
+    @app.before_request
+    def _profile_start():
+        profiler.start_request()
+
+    @app.after_request
+    def _profile_status(response):
+        g._profile_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _profile_finish(exc=None):
+        profiler.finish_request(g.get('_profile_status', 500 if exc else None))
+
+    return profiler
@@ -0,0 +1,226 @@
+"""
+Per-request SQL instrumentation, slow-query log and query budgets.
+
+Cursor execute hooks on every engine record, for the current request, the
+number of statements, the total time spent in the database and the slowest
+few statements. After each request:
+
+- the totals are added to per-endpoint aggregates (`db_stats()`, shown on the
+  admin page) so routes can be ranked by DB cost;
+- in debug mode (or with SQL_STATS_HEADERS=true) they are returned as
+  X-DB-Query-Count / X-DB-Time-ms / X-DB-Slowest-ms response headers;
+- the view's `@query_budget(n)` is checked. A request that goes over raises
+  QueryBudgetExceeded when the app is in TESTING mode or
+  QUERY_BUDGET_ENFORCE=true, and logs a warning otherwise. Budgets are per
+  route and independent of how many rows a page shows, so an N+1 lazy load in
+  a template trips them as soon as the test data has more than a couple of rows.
+  Statements run with the ``query_budget=False`` execution option (the
+  server-side session lookup) count towards the totals but not the budget.
+
+Statements slower than SLOW_QUERY_MS, and requests whose DB time exceeds
+SLOW_REQUEST_DB_MS, are written to the ``query_stats`` logger with the
+endpoint attached; SLOW_QUERY_SAMPLE_RATE (0..1) keeps that log affordable in
+production.
+
+    @app.route('/cart')
+    @query_budget(5)
+    @login_required
+    def cart(): ...
+"""
+
+import heapq
+import logging
+import os
+import random
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Slowest statements kept per request
+SLOWEST_KEEP = 5
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more SQL statements than its declared budget."""
+
+
+def query_budget(max_queries: int):
+    """Declare the maximum number of SQL statements a view may execute per request."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+class _Stats:
+    """Thread-safe per-endpoint DB cost aggregates for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_endpoint = {}
+
+    def record(self, endpoint, queries, db_seconds):
+        with self._lock:
+            row = self._by_endpoint.setdefault(endpoint or '<unknown>', {
+                'requests': 0, 'queries': 0, 'db_seconds': 0.0, 'max_queries': 0, 'max_db_seconds': 0.0,
+            })
+            row['requests'] += 1
+            row['queries'] += queries
+            row['db_seconds'] += db_seconds
+            row['max_queries'] = max(row['max_queries'], queries)
+            row['max_db_seconds'] = max(row['max_db_seconds'], db_seconds)
+
+    def snapshot(self):
+        with self._lock:
+            rows = [dict(endpoint=k, **v) for k, v in self._by_endpoint.items()]
+        for row in rows:
+            row['queries_avg'] = row['queries'] / row['requests']
+            row['db_ms_avg'] = row['db_seconds'] * 1000.0 / row['requests']
+            row['db_ms_max'] = row['max_db_seconds'] * 1000.0
+        rows.sort(key=lambda r: r['db_seconds'], reverse=True)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._by_endpoint.clear()
+
+
+stats = _Stats()
+
+
+def db_stats() -> list:
+    """Per-endpoint DB cost for this worker, most total DB time first."""
+    return stats.snapshot()
+
+
+def query_count() -> int:
+    """Statements executed so far in the current request."""
+    if not has_request_context():
+        return 0
+    return g.get('_query_count', 0)
+
+
+def db_time_ms() -> float:
+    """Milliseconds spent executing statements so far in the current request."""
+    if not has_request_context():
+        return 0.0
+    return g.get('_query_seconds', 0.0) * 1000.0
+
+
+def slowest_queries() -> list:
+    """The current request's slowest statements as (ms, statement), slowest first."""
+    if not has_request_context():
+        return []
+    return [(s * 1000.0, stmt) for s, _, stmt in sorted(g.get('_query_slowest', []), reverse=True)]
+
+
+def _enforcing(app) -> bool:
+    return bool(app.testing or app.config.get('QUERY_BUDGET_ENFORCE'))
+
+
+def _sampled(app) -> bool:
+    rate = app.config['SLOW_QUERY_SAMPLE_RATE']
+    return rate >= 1.0 or random.random() < rate
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_stats_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_stats_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+
+    in_request = has_request_context()
+    if in_request:
+        g._query_count = g.get('_query_count', 0) + 1
+        if context.execution_options.get('query_budget') is False:
+            # Per-request infrastructure (e.g. the session lookup), not the view's own work
+            g._query_unbudgeted = g.get('_query_unbudgeted', 0) + 1
+        g._query_seconds = g.get('_query_seconds', 0.0) + elapsed
+        slowest = g.setdefault('_query_slowest', [])
+        # Sequence number breaks ties so statements are never compared
+        entry = (elapsed, g._query_count, statement)
+        if len(slowest) < SLOWEST_KEEP:
+            heapq.heappush(slowest, entry)
+        elif elapsed > slowest[0][0]:
+            heapq.heapreplace(slowest, entry)
+        if _enforcing(current_app):
+            # Keep the statements so a budget failure shows what ran
+            g.setdefault('_query_log', []).append(statement)
+
+    if not has_app_context() or 'SLOW_QUERY_MS' not in current_app.config:
+        return
+    app = current_app
+    if elapsed * 1000.0 >= app.config['SLOW_QUERY_MS'] and _sampled(app):
+        endpoint = (request.endpoint if in_request else None) or '<background>'
+        logger.warning(
+            'slow query endpoint=%s ms=%.1f statement=%s',
+            endpoint, elapsed * 1000.0, ' '.join(statement.split())[:1000],
+        )
+
+
+def _after_request(response):
+    app = current_app
+    endpoint = request.endpoint
+    count = query_count()
+    db_ms = db_time_ms()
+    stats.record(endpoint, count, db_ms / 1000.0)
+
+    if app.config['SQL_STATS_HEADERS'] or app.debug:
+        slowest = slowest_queries()
+        response.headers['X-DB-Query-Count'] = str(count)
+        response.headers['X-DB-Time-ms'] = f"{db_ms:.1f}"
+        response.headers['X-DB-Slowest-ms'] = f"{slowest[0][0]:.1f}" if slowest else '0.0'
+
+    if db_ms >= app.config['SLOW_REQUEST_DB_MS'] and _sampled(app):
+        top = '; '.join(f"{ms:.1f}ms {' '.join(stmt.split())[:200]}" for ms, stmt in slowest_queries())
+        logger.warning(
+            'slow request endpoint=%s queries=%d db_ms=%.1f slowest=[%s]',
+            endpoint or '<unknown>', count, db_ms, top,
+        )
+
+    return _check_query_budget(response)
+
+
+def _check_query_budget(response):
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        return response
+    count = query_count() - g.get('_query_unbudgeted', 0)
+    if count <= budget:
+        return response
+    message = f"{request.endpoint} ran {count} SQL statements (budget {budget})"
+    if _enforcing(current_app):
+        statements = '\n'.join(f"  {s.strip()[:200]}" for s in g.get('_query_log', []))
+        raise QueryBudgetExceeded(f"{message}:\n{statements}")
+    logger.warning(message)
+    return response
+
+
+def init_query_stats(app):
+    """Instrument every engine and record/check per-request stats after each request.
+
+    Call this before registering other after_request hooks so it runs last and
+    sees their queries too.
+    """
+    app.config.setdefault(
+        'QUERY_BUDGET_ENFORCE', os.getenv('QUERY_BUDGET_ENFORCE', 'false').lower() == 'true'
+    )
+    app.config.setdefault('SQL_STATS_HEADERS', os.getenv('SQL_STATS_HEADERS', 'false').lower() == 'true')
+    app.config.setdefault('SLOW_QUERY_MS', float(os.getenv('SLOW_QUERY_MS', '200')))
+    app.config.setdefault('SLOW_REQUEST_DB_MS', float(os.getenv('SLOW_REQUEST_DB_MS', '500')))
+    app.config.setdefault('SLOW_QUERY_SAMPLE_RATE', float(os.getenv('SLOW_QUERY_SAMPLE_RATE', '0.1')))
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.after_request(_after_request)
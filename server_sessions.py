@@ -0,0 +1,272 @@
+"""
+Server-side sessions: the cookie carries only a signed session id.
+
+Flask's default session stores everything (assistant history, recently viewed
+products, UTM data, the CSRF token, ...) in the cookie itself, so every
+request (including the browser's requests for static files) uploads it and
+every write re-signs it. With a server-side backend the cookie is a ~70 byte
+signed id and the data lives in a backend selected by SESSION_BACKEND:
+
+- ``cookie``   Flask's signed-cookie sessions (the default; nothing changes)
+- ``database`` the ``server_session`` table, shared by all workers
+- ``memory``   a per-process dict, for tests and single-process development
+
+A session is written only when it was modified, or when its expiry needs
+sliding forward (less than half of its lifetime left), so read-only page
+views cost one primary-key lookup and no write. Empty sessions are never
+stored and get no cookie. Sessions expire after SESSION_TTL seconds of
+inactivity (default 7 days; PERMANENT_SESSION_LIFETIME for permanent ones).
+Expired rows are purged by each worker every SESSION_CLEANUP_INTERVAL seconds
+and by ``flask cleanup-sessions``.
+
+The session id is rotated on login so an id planted before authentication
+can't be reused afterwards.
+"""
+
+import logging
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from flask_login import user_logged_in
+from itsdangerous import BadSignature, Signer
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ServerSession
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSideSession(SecureCookieSession):
+    """Session dict that remembers its id and when its stored copy expires."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None, persist=True):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        # False for static files: whatever happens to the session is discarded
+        self.persist = persist
+        self.rotate = False
+
+    def regenerate(self):
+        """Move the data to a fresh id when the session is next saved."""
+        self.rotate = True
+        self.modified = True
+
+
+class MemorySessionBackend:
+    """In-process backend; each gunicorn worker has its own sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def load(self, sid):
+        with self._lock:
+            return self._data.get(sid)
+
+    def save(self, sid, payload, expires_at):
+        with self._lock:
+            self._data[sid] = (payload, expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def cleanup(self, now) -> int:
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._data.items() if expires_at <= now]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+
+class DatabaseSessionBackend:
+    """``server_session`` table; uses its own connection so it never commits the request's ORM session."""
+
+    table = ServerSession.__table__
+
+    def load(self, sid):
+        # Runs for every request before the view; keep it out of per-route query budgets
+        with db.engine.connect().execution_options(query_budget=False) as conn:
+            row = conn.execute(
+                self.table.select().with_only_columns(self.table.c.data, self.table.c.expires_at)
+                .where(self.table.c.id == sid)
+            ).first()
+        return (row.data, row.expires_at) if row else None
+
+    def save(self, sid, payload, expires_at):
+        values = {'data': payload, 'expires_at': expires_at, 'updated_at': datetime.utcnow()}
+        with db.engine.begin() as conn:
+            updated = conn.execute(self.table.update().where(self.table.c.id == sid).values(**values)).rowcount
+            if updated:
+                return
+            try:
+                with conn.begin_nested():
+                    conn.execute(self.table.insert().values(id=sid, **values))
+            except IntegrityError:
+                # Concurrent first write for the same id (parallel requests); last one wins
+                conn.execute(self.table.update().where(self.table.c.id == sid).values(**values))
+
+    def delete(self, sid):
+        with db.engine.begin() as conn:
+            conn.execute(self.table.delete().where(self.table.c.id == sid))
+
+    def cleanup(self, now) -> int:
+        with db.engine.begin() as conn:
+            return conn.execute(self.table.delete().where(self.table.c.expires_at <= now)).rowcount
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSideSession
+
+    def __init__(self, backend, ttl: float = 7 * 86400, cleanup_interval: float = 600):
+        self.backend = backend
+        self.ttl = timedelta(seconds=ttl)
+        self.cleanup_interval = cleanup_interval
+        self._next_cleanup = time.monotonic() + cleanup_interval
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session', key_derivation='hmac')
+
+    def _lifetime(self, app, session):
+        return app.permanent_session_lifetime if session.permanent else self.ttl
+
+    def _cookie_kwargs(self, app):
+        kwargs = {
+            'domain': self.get_cookie_domain(app),
+            'path': self.get_cookie_path(app),
+            'secure': self.get_cookie_secure(app),
+            'samesite': self.get_cookie_samesite(app),
+            'httponly': self.get_cookie_httponly(app),
+        }
+        if hasattr(self, 'get_cookie_partitioned'):  # Flask >= 3.1
+            kwargs['partitioned'] = self.get_cookie_partitioned(app)
+        return kwargs
+
+    def _is_static(self, app, request):
+        path = request.path
+        return path.startswith('/assets/') or (app.static_url_path and path.startswith(app.static_url_path + '/'))
+
+    def open_session(self, app, request):
+        if self._is_static(app, request):
+            return self.session_class(persist=False)
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self.session_class()
+        try:
+            sid = self._signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return self.session_class()
+        try:
+            record = self.backend.load(sid)
+        except Exception:
+            logger.exception('Could not load session')
+            return self.session_class()
+        if record is None:
+            return self.session_class()
+        payload, expires_at = record
+        if expires_at <= datetime.utcnow():
+            return self.session_class()
+        return self.session_class(self.serializer.loads(payload), sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        if not getattr(session, 'persist', False):
+            return
+        name = self.get_cookie_name(app)
+        cookie = self._cookie_kwargs(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and session.sid:
+                self._call('delete', session.sid)
+                response.delete_cookie(name, **cookie)
+                response.vary.add('Cookie')
+            return
+
+        now = datetime.utcnow()
+        lifetime = self._lifetime(app, session)
+        stale = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or stale):
+            return
+
+        sid = session.sid
+        if sid is None or session.rotate:
+            if sid is not None:
+                self._call('delete', sid)
+            sid = secrets.token_urlsafe(32)
+        if not self._call('save', sid, self.serializer.dumps(dict(session)), now + lifetime):
+            return
+        self._maybe_cleanup(now)
+
+        # The id only changes for new/rotated sessions; permanent cookies also carry an expiry to slide
+        if sid != session.sid or session.permanent:
+            response.set_cookie(
+                name, self._signer(app).sign(sid).decode(),
+                expires=self.get_expiration_time(app, session), **cookie,
+            )
+            response.vary.add('Cookie')
+
+    def _call(self, method, *args) -> bool:
+        try:
+            getattr(self.backend, method)(*args)
+            return True
+        except Exception:
+            # A session store outage must not turn every response into a 500
+            logger.exception('Session %s failed', method)
+            return False
+
+    def _maybe_cleanup(self, now):
+        if time.monotonic() < self._next_cleanup:
+            return
+        self._next_cleanup = time.monotonic() + self.cleanup_interval
+        self._call('cleanup', now)
+
+    def create(self, app, data: dict) -> str:
+        """Store a new session holding `data` and return its cookie value (load tests, tooling)."""
+        sid = secrets.token_urlsafe(32)
+        self.backend.save(sid, self.serializer.dumps(dict(data)), datetime.utcnow() + self.ttl)
+        return self._signer(app).sign(sid).decode()
+
+
+def _rotate_session_id(sender, user, **extra):
+    if isinstance(session, ServerSideSession):
+        session.regenerate()
+
+
+def _make_backend(name):
+    if name == 'database':
+        return DatabaseSessionBackend()
+    if name == 'memory':
+        return MemorySessionBackend()
+    return None
+
+
+def init_server_sessions(app):
+    """Install the SESSION_BACKEND session interface and the cleanup command."""
+    backend = _make_backend(os.getenv('SESSION_BACKEND', 'cookie').lower())
+    if backend is None:
+        return None
+    interface = ServerSessionInterface(
+        backend,
+        ttl=float(os.getenv('SESSION_TTL', str(7 * 86400))),
+        cleanup_interval=float(os.getenv('SESSION_CLEANUP_INTERVAL', '600')),
+    )
+    app.session_interface = interface
+
+    user_logged_in.connect(_rotate_session_id, app)
+
+    @app.cli.command('cleanup-sessions')
+    def cleanup_sessions_command():
+        """Delete expired server-side sessions."""
+        removed = backend.cleanup(datetime.utcnow())
+        print(f"Removed {removed} expired sessions")
+
+    return interface
@@ -0,0 +1,161 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`build_static_assets()` copies every file under ``static/`` into ``static/dist/``
+with a content hash in its name and writes ``.gz`` (and ``.br`` when brotli is
+installed) siblings next to it, plus a ``manifest.json`` mapping logical names
+to fingerprinted ones. Templates use ``static_url('theme.css')`` which resolves
+through the manifest, and the ``/assets/<path>`` route serves the best
+precompressed variant with immutable cache headers.
+
+Run the build with ``flask build-assets`` or ``python static_assets.py``.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+
+from compression import parse_accept_encoding
+
+# Optional: brotli variants are only written/served when the module is installed
+try:
+    import brotli  # type: ignore
+except Exception:  # pragma: no cover
+    brotli = None
+
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+# Only text-like assets benefit from precompression
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.xml', '.html', '.map', '.ico'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+assets_bp = Blueprint('assets', __name__)
+
+_manifest_cache = {}
+
+
+def _fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def _hashed_name(rel_path: str, digest: str) -> str:
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}.{digest}{ext}"
+
+
+def build_static_assets(static_dir: str, min_size: int = 256) -> dict:
+    """Fingerprint and precompress every file in static_dir; return the manifest."""
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    os.makedirs(dist_dir, exist_ok=True)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        # Never re-process our own output
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for name in sorted(files):
+            src = os.path.join(root, name)
+            rel_path = os.path.relpath(src, static_dir).replace(os.sep, '/')
+            with open(src, 'rb') as fh:
+                data = fh.read()
+
+            hashed = _hashed_name(rel_path, _fingerprint(data))
+            dest = os.path.join(dist_dir, hashed)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, 'wb') as fh:
+                fh.write(data)
+
+            ext = os.path.splitext(name)[1].lower()
+            if ext in COMPRESSIBLE_EXTENSIONS and len(data) >= min_size:
+                gz = gzip.compress(data, compresslevel=9, mtime=0)
+                if len(gz) < len(data):
+                    with open(dest + '.gz', 'wb') as fh:
+                        fh.write(gz)
+                if brotli is not None:
+                    br = brotli.compress(data, quality=11)
+                    if len(br) < len(data):
+                        with open(dest + '.br', 'wb') as fh:
+                            fh.write(br)
+
+            manifest[rel_path] = hashed
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    _manifest_cache.clear()
+    return manifest
+
+
+def load_manifest(static_dir: str) -> dict:
+    """Return the asset manifest for static_dir (cached per process; empty if not built)."""
+    if static_dir in _manifest_cache:
+        return _manifest_cache[static_dir]
+    path = os.path.join(static_dir, DIST_DIRNAME, MANIFEST_NAME)
+    try:
+        with open(path) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        manifest = {}
+    # Don't pin an empty manifest in debug so a build is picked up without a restart
+    if manifest or not current_app.debug:
+        _manifest_cache[static_dir] = manifest
+    return manifest
+
+
+def static_url(filename: str) -> str:
+    """URL for a static file, fingerprinted when the asset build has been run."""
+    hashed = load_manifest(current_app.static_folder).get(filename)
+    if hashed:
+        return url_for('assets.asset', filename=hashed)
+    return url_for('static', filename=filename)
+
+
+@assets_bp.route('/assets/<path:filename>')
+def asset(filename):
+    dist_dir = os.path.join(current_app.static_folder, DIST_DIRNAME)
+    if filename == MANIFEST_NAME or filename.endswith(('.gz', '.br')):
+        abort(404)
+
+    accepted = parse_accept_encoding(request.headers.get('Accept-Encoding'))
+    served_name, encoding = filename, None
+    for enc, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if (enc in accepted or '*' in accepted) and os.path.isfile(os.path.join(dist_dir, filename + suffix)):
+            served_name, encoding = filename + suffix, enc
+            break
+
+    # Keep the original mimetype even when serving the compressed sibling
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(
+        dist_dir, served_name, mimetype=mimetype, max_age=31536000,
+        download_name=os.path.basename(filename),
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_static_assets(app):
+    """Register the asset route, the static_url() template helper and the build command."""
+    app.register_blueprint(assets_bp)
+    app.jinja_env.globals['static_url'] = static_url
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Fingerprint and precompress files in the static folder."""
+        manifest = build_static_assets(app.static_folder)
+        print(f"Built {len(manifest)} assets into {os.path.join(app.static_folder, DIST_DIRNAME)}"
+              f" (brotli: {'yes' if brotli is not None else 'no'})")
+
+
+if __name__ == '__main__':
+    static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    manifest = build_static_assets(static_dir)
+    print(f"Built {len(manifest)} assets into {os.path.join(static_dir, DIST_DIRNAME)}")
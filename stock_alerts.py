@@ -0,0 +1,224 @@
+"""
+Back-in-stock notifications.
+
+A flush that moves a product's ``stock_quantity`` from 0 (or NULL) to a
+positive number enqueues a ``stock_alert.dispatch`` outbox message in the same
+transaction (see outbox.py), so restocking never waits on email delivery and
+a rolled-back restock notifies nobody.
+
+The outbox worker then runs `dispatch_stock_alerts` for the product. It walks
+the product's active StockAlert rows by id (keyset, never OFFSET), claims
+each batch with FOR UPDATE SKIP LOCKED, sends the batch with one call to the
+mail transport, and marks it ``notified_at``/inactive with one UPDATE before
+committing. The walk uses its own session, so those per-batch commits never
+touch the worker's transaction (its claimed messages and their outcomes).
+A failure leaves the current batch active for the outbox retry, and batches
+already sent are not sent again. The walk stops early if the product sells
+out again; the remaining alerts wait for the next restock.
+
+MAIL_TRANSPORT selects the transport:
+
+- ``mailgun`` Mailgun batch sending (MAILGUN_API_KEY, MAILGUN_DOMAIN, MAIL_FROM):
+              up to 1000 recipients per request, each sees only their own address.
+              This is the default when those are configured.
+- ``fake``    records messages in memory (tests, benchmarks); optional
+              MAIL_FAKE_LATENCY_MS per call.
+
+``flask notify-stock <product_id>`` runs a dispatch by hand and prints its
+throughput.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import click
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from metrics import track_outbound
+from models import db, Product, StockAlert, User
+from outbox import HTTP_TIMEOUT, enqueue, outbox_handler, outbox_http
+
+logger = logging.getLogger(__name__)
+
+# Mailgun's limit for recipients of one batch message
+MAILGUN_MAX_RECIPIENTS = 1000
+
+
+class MailgunTransport:
+    name = 'mailgun'
+    max_batch = MAILGUN_MAX_RECIPIENTS
+
+    def __init__(self, api_key: str, domain: str, sender: str):
+        self.api_key = api_key
+        self.domain = domain
+        self.sender = sender
+
+    def send_batch(self, recipients: list, subject: str, text: str):
+        # recipient-variables turns a multi-recipient message into individual emails
+        with track_outbound('mailgun', 'messages_batch'):
+            resp = outbox_http().post(
+                f"https://api.mailgun.net/v3/{self.domain}/messages",
+                auth=('api', self.api_key),
+                data={
+                    'from': self.sender,
+                    'to': recipients,
+                    'subject': subject,
+                    'text': text,
+                    'recipient-variables': json.dumps({r: {} for r in recipients}),
+                },
+                timeout=HTTP_TIMEOUT,
+            )
+            resp.raise_for_status()
+
+
+class FakeTransport:
+    name = 'fake'
+    max_batch = MAILGUN_MAX_RECIPIENTS
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.sent = []
+
+    def send_batch(self, recipients, subject, text):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        self.sent.append({'to': list(recipients), 'subject': subject, 'text': text})
+
+
+_transport = None
+_configured = False
+
+
+def _build_transport():
+    api_key, domain = os.getenv('MAILGUN_API_KEY'), os.getenv('MAILGUN_DOMAIN')
+    name = os.getenv('MAIL_TRANSPORT', 'mailgun' if api_key and domain else 'none').lower()
+    if name == 'fake':
+        return FakeTransport(float(os.getenv('MAIL_FAKE_LATENCY_MS', '0')))
+    if name == 'mailgun' and api_key and domain:
+        return MailgunTransport(api_key, domain, os.getenv('MAIL_FROM', f'notifications@{domain}'))
+    return None
+
+
+def get_mail_transport():
+    """The configured transport, or None when email isn't configured."""
+    global _transport, _configured
+    if not _configured:
+        _transport = _build_transport()
+        _configured = True
+    return _transport
+
+
+def set_mail_transport(transport):
+    """Override the transport (tests, benchmarks); None disables sending."""
+    global _transport, _configured
+    _transport = transport
+    _configured = True
+
+
+def _message(product):
+    site_url = os.getenv('SITE_URL', 'http://localhost:5000').rstrip('/')
+    subject = f"{product.name} is back in stock"
+    text = (f"Good news: {product.name} is available again.\n\n"
+            f"{site_url}/peptides/{product.slug}\n\n"
+            "You received this because you asked to be notified when it was restocked.")
+    return subject, text
+
+
+def dispatch_stock_alerts(product_id: int, batch_size: int = 500) -> dict:
+    """Notify active alerts for a product in keyset batches; returns counts and throughput.
+
+    Runs in its own session (committing after each batch), never in the caller's.
+    """
+    started = time.perf_counter()
+    stats = {'product_id': product_id, 'sent': 0, 'alerts': 0, 'batches': 0, 'seconds': 0.0, 'per_second': None}
+    transport = get_mail_transport()
+    if transport is None:
+        raise RuntimeError('No mail transport configured (MAIL_TRANSPORT / MAILGUN_API_KEY + MAILGUN_DOMAIN)')
+    batch_size = max(1, min(batch_size, transport.max_batch))
+    alerts = StockAlert.__table__
+    last_id = 0
+    with Session(db.engine) as session:
+        while True:
+            product = session.get(Product, product_id, populate_existing=True)
+            if product is None or product.status != 'active' or (product.stock_quantity or 0) <= 0:
+                session.rollback()
+                break
+            subject, text = _message(product)
+            rows = (session.query(StockAlert.id, StockAlert.email, User.email.label('user_email'))
+                    .outerjoin(User, User.id == StockAlert.user_id)
+                    .filter(StockAlert.product_id == product_id, StockAlert.active.is_(True), StockAlert.id > last_id)
+                    .order_by(StockAlert.id).limit(batch_size)
+                    .with_for_update(skip_locked=True, of=StockAlert).all())
+            if not rows:
+                session.rollback()
+                break
+            ids = [r.id for r in rows]
+            # A user's alert may carry an email too; one message per address
+            recipients = list(dict.fromkeys(
+                (r.user_email or r.email).strip().lower() for r in rows if (r.user_email or r.email)
+            ))
+            try:
+                if recipients:
+                    transport.send_batch(recipients, subject, text)
+            except Exception:
+                session.rollback()
+                raise
+            session.execute(alerts.update().where(alerts.c.id.in_(ids)).values(
+                active=False, notified_at=datetime.utcnow(),
+            ))
+            session.commit()
+            stats['alerts'] += len(ids)
+            stats['sent'] += len(recipients)
+            stats['batches'] += 1
+            last_id = ids[-1]
+
+    stats['seconds'] = time.perf_counter() - started
+    if stats['sent']:
+        stats['per_second'] = stats['sent'] / stats['seconds']
+        logger.info('stock alerts product=%s sent=%d alerts=%d batches=%d seconds=%.2f per_second=%.0f',
+                    product_id, stats['sent'], stats['alerts'], stats['batches'], stats['seconds'], stats['per_second'])
+    return stats
+
+
+@outbox_handler('stock_alert.dispatch')
+def _dispatch_from_outbox(payloads):
+    for product_id in dict.fromkeys(p['product_id'] for p in payloads):
+        dispatch_stock_alerts(product_id, batch_size=int(os.getenv('STOCK_ALERT_BATCH_SIZE', '500')))
+
+
+@event.listens_for(db.session, 'before_flush')
+def _enqueue_restocks(session, flush_context, instances):
+    for obj in list(session.dirty):
+        if not isinstance(obj, Product):
+            continue
+        history = inspect(obj).attrs.stock_quantity.history
+        if not history.added or (history.added[0] or 0) <= 0:
+            continue
+        if history.deleted:
+            previous = history.deleted[0]
+        else:
+            # Assigned while expired (e.g. after a commit): read the stored value
+            with session.no_autoflush:
+                previous = session.execute(
+                    select(Product.stock_quantity).where(Product.id == obj.id)
+                ).scalar()
+        if (previous or 0) <= 0:
+            enqueue('stock_alert.dispatch', {'product_id': obj.id})
+
+
+def init_stock_alerts(app):
+    """Register the manual dispatch command."""
+
+    @app.cli.command('notify-stock')
+    @click.argument('product_id', type=int)
+    @click.option('--batch-size', default=500, show_default=True, help='Alerts per send call and UPDATE.')
+    def notify_stock_command(product_id, batch_size):
+        """Send back-in-stock notifications for PRODUCT_ID now."""
+        stats = dispatch_stock_alerts(product_id, batch_size)
+        rate = f"{stats['per_second']:.0f}/s" if stats['per_second'] else '-'
+        print(f"Notified {stats['sent']} recipients ({stats['alerts']} alerts) in {stats['batches']} batches, "
+              f"{stats['seconds']:.2f}s, {rate}")
@@ -0,0 +1,172 @@
+"""
+Per-user cart/favorites summary cache.
+
+Holds the cart item count, cart total and favorite product ids for a user so
+the base template doesn't have to query CartItem/FavoriteProduct on every page
+view. Routes that change carts or favorites call `refresh_user_summary()` after
+committing; entries also expire after SUMMARY_CACHE_TTL seconds so price
+changes made elsewhere show up eventually.
+
+Backends (SUMMARY_CACHE_BACKEND):
+- ``redis``  shared across gunicorn workers (REDIS_URL / SUMMARY_CACHE_URL)
+- ``memory`` per-process dict, intended for tests and local development
+- ``none``   no caching; every read computes from the database
+
+The default is ``redis`` when a Redis URL is configured, otherwise ``none``.
+"""
+
+import json
+import os
+import threading
+import time
+from decimal import Decimal
+
+from sqlalchemy import func
+
+from models import db, CartItem, FavoriteProduct, Product
+
+# Optional: only needed for the shared backend
+try:
+    import redis  # type: ignore
+except Exception:  # pragma: no cover
+    redis = None
+
+KEY_PREFIX = 'user_summary:'
+
+
+class MemorySummaryBackend:
+    """In-process backend with TTL; each gunicorn worker has its own copy."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisSummaryBackend:
+    """Redis backend shared by all workers; values are stored as JSON."""
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key, value, ttl):
+        self._client.setex(key, ttl, json.dumps(value))
+
+    def delete(self, key):
+        self._client.delete(key)
+
+
+def _make_backend():
+    url = os.getenv('SUMMARY_CACHE_URL') or os.getenv('REDIS_URL')
+    name = os.getenv('SUMMARY_CACHE_BACKEND', 'redis' if url else 'none').lower()
+    if name == 'memory':
+        return MemorySummaryBackend()
+    if name == 'redis' and url and redis is not None:
+        return RedisSummaryBackend(url)
+    return None
+
+
+def _favorite_product_ids(user_id: int) -> list:
+    rows = db.session.query(FavoriteProduct.product_id).filter(FavoriteProduct.user_id == user_id).all()
+    return sorted(pid for (pid,) in rows)
+
+
+def compute_user_summary(user_id: int) -> dict:
+    """Build a summary straight from the database."""
+    count, total = db.session.query(
+        func.coalesce(func.sum(CartItem.quantity), 0),
+        func.coalesce(func.sum(func.coalesce(Product.sale_price, Product.price) * CartItem.quantity), 0),
+    ).join(Product, Product.id == CartItem.product_id).filter(CartItem.user_id == user_id).one()
+    return {
+        'cart_count': int(count or 0),
+        'cart_total': str(Decimal(total or 0).quantize(Decimal('0.01'))),
+        'favorite_product_ids': _favorite_product_ids(user_id),
+    }
+
+
+class UserSummaryCache:
+    def __init__(self, backend=None, ttl: int = 300):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get(self, user_id: int) -> dict:
+        """Cached summary for user_id, computing and storing it on a miss."""
+        if self.backend is not None:
+            try:
+                cached = self.backend.get(f"{KEY_PREFIX}{user_id}")
+                if cached is not None:
+                    return cached
+            except Exception:
+                # Cache outages must not break page rendering
+                return compute_user_summary(user_id)
+        return self.refresh(user_id)
+
+    def refresh(self, user_id: int) -> dict:
+        """Recompute the summary after a cart/favorites change and write it through."""
+        summary = compute_user_summary(user_id)
+        if self.backend is not None:
+            try:
+                self.backend.set(f"{KEY_PREFIX}{user_id}", summary, self.ttl)
+            except Exception:
+                pass
+        return summary
+
+    def invalidate(self, user_id: int):
+        if self.backend is not None:
+            try:
+                self.backend.delete(f"{KEY_PREFIX}{user_id}")
+            except Exception:
+                pass
+
+
+summary_cache = UserSummaryCache(_make_backend(), ttl=int(os.getenv('SUMMARY_CACHE_TTL', '300')))
+
+
+def get_user_summary(user_id: int) -> dict:
+    return summary_cache.get(user_id)
+
+
+def refresh_user_summary(user_id: int) -> dict:
+    return summary_cache.refresh(user_id)
+
+
+def get_cart_count(user_id: int) -> int:
+    """Cart item count; without a cache backend this is one SUM, never the favorites query."""
+    if summary_cache.backend is None:
+        count = (db.session.query(func.coalesce(func.sum(CartItem.quantity), 0))
+                 .filter(CartItem.user_id == user_id).scalar())
+        return int(count or 0)
+    return int(summary_cache.get(user_id)['cart_count'])
+
+
+def get_favorite_product_ids(user_id: int) -> list:
+    """Favorite product ids; without a cache backend this is one product_id-only query."""
+    if summary_cache.backend is None:
+        return _favorite_product_ids(user_id)
+    return summary_cache.get(user_id)['favorite_product_ids']
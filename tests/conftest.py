@@ -0,0 +1,107 @@
+"""
+Shared fixtures. The app is configured from the environment at import time,
+so the scratch database and feature flags are set before `app` is imported.
+Each test gets freshly created tables and cleared per-process caches.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+_tmpdir = tempfile.mkdtemp(prefix='app-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmpdir, 'test.db')}"
+os.environ['AUTO_EMBED'] = 'false'
+os.environ['SESSION_COOKIE_SECURE'] = 'false'
+os.environ['EMBEDDING_PROVIDER'] = 'none'
+os.environ['VIEW_COUNT_FLUSH_INTERVAL'] = '3600'
+os.environ.pop('OPENAI_API_KEY', None)
+os.environ.pop('MAILGUN_API_KEY', None)
+os.environ.pop('SESSION_BACKEND', None)
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import app as app_module
+from ai_client import set_openai_client
+from answer_cache import answer_cache
+from auth import user_cache
+from models import db, Category, Product, User
+from view_counter import view_counter
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app = app_module.app
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return flask_app
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    user_cache.clear()
+    answer_cache.clear()
+    set_openai_client(None)
+    yield db
+    with view_counter._lock:
+        view_counter._pending.clear()
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def app_ctx(app):
+    with app.app_context():
+        yield
+
+
+def make_user(email='user@example.com', role='student', **kwargs):
+    user = User(google_id=kwargs.pop('google_id', email), email=email, name=kwargs.pop('name', 'Test User'),
+                role=role, **kwargs)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def make_product(slug='bpc-157', stock_quantity=10, **kwargs):
+    category = Category.query.first()
+    if category is None:
+        category = Category(name='Peptides', slug='peptides')
+        db.session.add(category)
+        db.session.flush()
+    product = Product(name=kwargs.pop('name', slug.upper()), slug=slug, sku=kwargs.pop('sku', slug),
+                      description=kwargs.pop('description', 'Research peptide'), price=kwargs.pop('price', 10),
+                      stock_quantity=stock_quantity, status=kwargs.pop('status', 'active'),
+                      category_id=category.id, **kwargs)
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+
+@contextmanager
+def capture_sql():
+    """Collect the SQL statements executed inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
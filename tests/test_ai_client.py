@@ -0,0 +1,159 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ai_client
+from ai_client import AIUnavailable, CircuitBreaker, openai_request, set_openai_client
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code=None):
+        super().__init__(f'status {status_code}')
+        self.status_code = status_code
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ai_client, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_seconds=30)
+    monkeypatch.setattr(ai_client, 'breaker', breaker)
+    set_openai_client(object())  # stub client; openai_request only hands it back
+    return breaker
+
+
+def _call(outcome=None):
+    """Run one guarded call that succeeds, or raises `outcome`."""
+    with openai_request('chat') as client:
+        if outcome is not None:
+            raise outcome
+        return client
+
+
+def _fail(n, status_code=None):
+    for _ in range(n):
+        with pytest.raises(ProviderError):
+            _call(ProviderError(status_code))
+
+
+def _open(breaker, clock):
+    _fail(breaker.failure_threshold)
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += breaker.reset_seconds
+
+
+def test_opens_after_failure_threshold(breaker):
+    _fail(2)
+    assert breaker.state == CircuitBreaker.CLOSED
+    _fail(1, status_code=503)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()['last_error'] == 'ProviderError'
+    assert (breaker.counts['failure'], breaker.counts['opened']) == (3, 1)
+
+
+def test_success_resets_consecutive_failures(breaker):
+    _fail(2)
+    _call()
+    _fail(2)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.counts['success'] == 1
+
+
+def test_open_breaker_fails_fast(breaker, clock):
+    _fail(3)
+    clock.now += breaker.reset_seconds - 1
+    with pytest.raises(AIUnavailable):
+        _call()
+    with pytest.raises(AIUnavailable):
+        _call()
+    assert breaker.counts['rejected'] == 2
+    assert breaker.counts['failure'] == 3
+
+
+def test_half_open_lets_one_probe_through(breaker, clock):
+    _open(breaker, clock)
+    assert breaker.allow() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # A second caller while the probe is in flight is rejected
+    assert breaker.allow() is False
+    assert (breaker.counts['half_opened'], breaker.counts['rejected']) == (1, 1)
+
+
+def test_successful_probe_closes(breaker, clock):
+    _open(breaker, clock)
+    _call()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.counts['closed'] == 1
+    _call()
+
+
+def test_failed_probe_reopens(breaker, clock):
+    _open(breaker, clock)
+    _fail(1)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.counts['opened'] == 2
+    with pytest.raises(AIUnavailable):
+        _call()
+    # The reset window restarts from the failed probe
+    clock.now += breaker.reset_seconds
+    _call()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.parametrize('status_code', [400, 401, 404, 422])
+def test_client_errors_do_not_open(breaker, status_code):
+    _fail(5, status_code=status_code)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_failures == 0
+    assert (breaker.counts['client_error'], breaker.counts['failure']) == (5, 0)
+
+
+def test_rate_limits_count_as_failures(breaker):
+    _fail(3, status_code=429)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_client_error_on_probe_closes(breaker, clock):
+    _open(breaker, clock)
+    _fail(1, status_code=400)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_abandoned_stream_releases_probe(breaker, clock):
+    def stream():
+        with openai_request('chat'):
+            yield 'chunk'
+            yield 'never reached'
+
+    _open(breaker, clock)
+    gen = stream()
+    assert next(gen) == 'chunk'
+    assert breaker._probing is True
+    gen.close()  # GeneratorExit, as when the client disconnects
+
+    # No verdict was recorded and the next caller can probe
+    assert breaker._probing is False
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert (breaker.counts['success'], breaker.counts['failure']) == (0, breaker.failure_threshold)
+    _call()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_unconfigured_client_raises_without_touching_breaker(breaker):
+    set_openai_client(None)
+    with pytest.raises(AIUnavailable):
+        _call()
+    assert breaker.counts['rejected'] == 0
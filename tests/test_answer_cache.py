@@ -0,0 +1,72 @@
+import pytest
+
+import app as app_module
+from answer_cache import AnswerCache, answer_cache, embed_question
+from embeddings import HashingEmbeddingProvider, set_embedding_provider
+from tests.conftest import make_product
+
+
+class RecordingProvider(HashingEmbeddingProvider):
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def embed_one(self, text):
+        self.texts.append(text)
+        return super().embed_one(text)
+
+
+@pytest.fixture
+def provider():
+    provider = RecordingProvider()
+    set_embedding_provider(provider)
+    yield provider
+    set_embedding_provider(None)
+
+
+def test_question_is_embedded_as_asked(provider):
+    embed_question('  What is BPC-157?  ')
+    assert provider.texts == ['What is BPC-157?']
+
+
+def test_same_question_hits_regardless_of_case_and_spacing(app_ctx):
+    cache = AnswerCache(threshold=0.99)
+    cache.store([1.0, 0.0], 'What is  BPC-157?', 'answer', {}, [], [], cost_ms=100)
+    # The embedding alone would miss; the normalised text is the key
+    assert cache.lookup([0.0, 1.0], 'what is bpc-157?').answer == 'answer'
+    assert cache.lookup([0.0, 1.0], 'what is tb-500?') is None
+
+
+def test_evicted_entries_leave_no_question_key(app_ctx):
+    cache = AnswerCache(max_entries=1)
+    cache.store([1.0, 0.0], 'first', 'a1', {}, [], [], cost_ms=1)
+    cache.store([0.0, 1.0], 'second', 'a2', {}, [], [], cost_ms=1)
+    assert cache.lookup([-1.0, 0.0], 'first') is None
+    assert cache.lookup([0.0, 1.0], 'SECOND').answer == 'a2'
+
+
+def test_cache_hit_is_still_moderated(client, app_ctx, provider, monkeypatch):
+    make_product()
+    question = 'how should bpc-157 be stored'
+    answer_cache.store(embed_question(question), question, 'Keep it cold.', {}, [], [], cost_ms=100)
+    moderated = []
+    monkeypatch.setattr(app_module, 'is_flagged', lambda text: moderated.append(text) or True)
+
+    client.post('/assistant/message', data={'message': question.upper()})
+    assert moderated == [question.upper()]
+    with client.session_transaction() as sess:
+        assert 'assistant_history' not in sess
+
+    resp = client.post('/assistant/stream', data={'message': question})
+    assert resp.status_code == 400
+    assert b'Keep it cold.' not in resp.data
+
+
+def test_cache_hit_answers_clean_question(client, app_ctx, provider, monkeypatch):
+    question = 'how should bpc-157 be stored'
+    answer_cache.store(embed_question(question), question, 'Keep it cold.', {}, [], [], cost_ms=100)
+    monkeypatch.setattr(app_module, 'is_flagged', lambda text: False)
+
+    client.post('/assistant/message', data={'message': 'How should BPC-157 be stored'})
+    with client.session_transaction() as sess:
+        assert sess['assistant_history'][-1]['content'] == 'Keep it cold.'
@@ -0,0 +1,55 @@
+import json
+
+from app import ASSISTANT_SAVED_IDS_KEEP, _answer_serializer
+from tests.conftest import make_product
+
+
+def _stream_token(client, message):
+    resp = client.post('/assistant/stream', data={'message': message})
+    assert resp.status_code == 200
+    frames = resp.get_data(as_text=True).split('\n\n')
+    done = next(f for f in frames if f.startswith('event: done'))
+    return json.loads(done.split('data: ', 1)[1])['token']
+
+
+def _history(client):
+    with client.session_transaction() as sess:
+        return sess.get('assistant_history', [])
+
+
+def test_streamed_answer_is_saved_once(client, app_ctx):
+    make_product()
+    token = _stream_token(client, 'what is bpc-157')
+
+    assert client.post('/assistant/history', data={'token': token}).get_json() == {'success': True}
+    # Replaying the same signed token doesn't append the exchange again
+    assert client.post('/assistant/history', data={'token': token}).get_json() == {'success': True, 'duplicate': True}
+    history = _history(client)
+    assert [m['role'] for m in history] == ['user', 'assistant']
+    assert history[0]['content'] == 'what is bpc-157'
+
+
+def test_each_stream_gets_its_own_id(client, app_ctx):
+    first = _stream_token(client, 'same question')
+    second = _stream_token(client, 'same question')
+    assert _answer_serializer().loads(first)['id'] != _answer_serializer().loads(second)['id']
+    client.post('/assistant/history', data={'token': first})
+    client.post('/assistant/history', data={'token': second})
+    assert len(_history(client)) == 4
+
+
+def test_tokens_without_id_or_signature_are_rejected(client):
+    unsigned = _answer_serializer().dumps({'q': 'q', 'a': 'a'})
+    assert client.post('/assistant/history', data={'token': unsigned}).status_code == 400
+    assert client.post('/assistant/history', data={'token': 'forged'}).status_code == 400
+    assert _history(client) == []
+
+
+def test_saved_ids_are_capped(client):
+    for i in range(ASSISTANT_SAVED_IDS_KEEP + 5):
+        token = _answer_serializer().dumps({'id': f'id-{i}', 'q': 'q', 'a': 'a'})
+        client.post('/assistant/history', data={'token': token})
+    with client.session_transaction() as sess:
+        saved = sess['assistant_saved_ids']
+    assert len(saved) == ASSISTANT_SAVED_IDS_KEEP
+    assert saved[-1] == f'id-{ASSISTANT_SAVED_IDS_KEEP + 4}'
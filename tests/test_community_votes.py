@@ -0,0 +1,74 @@
+import random
+import threading
+
+from sqlalchemy import func
+
+from models import db, CommunityPost, CommunityVote
+from tests.conftest import login, make_user
+
+
+def _vote(client, slug, value):
+    return client.post(f'/community/{slug}/vote', data={'value': value},
+                       headers={'X-Requested-With': 'XMLHttpRequest'})
+
+
+def _assert_consistent(post_id):
+    db.session.expire_all()
+    post = db.session.get(CommunityPost, post_id)
+    total = db.session.query(func.coalesce(func.sum(CommunityVote.value), 0)).filter_by(post_id=post_id).scalar()
+    assert post.score == total
+    rows = (db.session.query(CommunityVote.user_id, func.count())
+            .filter_by(post_id=post_id).group_by(CommunityVote.user_id).all())
+    assert all(n == 1 for _, n in rows)
+    assert all(v in (-1, 1) for (v,) in db.session.query(CommunityVote.value).filter_by(post_id=post_id))
+    return post.score
+
+
+def test_vote_flip_and_toggle(app, client, app_ctx):
+    user = make_user()
+    post = CommunityPost(title='Hello', slug='hello', content='hi', user_id=user.id, score=0)
+    db.session.add(post)
+    db.session.commit()
+    login(client, user.id)
+
+    assert _vote(client, 'hello', 'up').get_json() == {'success': True, 'score': 1}
+    assert _vote(client, 'hello', 'down').get_json() == {'success': True, 'score': -1}
+    assert _vote(client, 'hello', 'down').get_json() == {'success': True, 'score': 0}
+    assert _assert_consistent(post.id) == 0
+    assert CommunityVote.query.count() == 0
+
+
+def test_concurrent_votes_keep_score_and_rows_consistent(app, app_ctx):
+    users = [make_user(email=f'voter{i}@example.com') for i in range(6)]
+    post = CommunityPost(title='Busy', slug='busy', content='hi', user_id=users[0].id, score=0)
+    db.session.add(post)
+    db.session.commit()
+    post_id, user_ids = post.id, [u.id for u in users]
+    db.session.remove()
+
+    # Two threads per user, so the same user's votes also race each other
+    statuses, errors = [], []
+    start = threading.Barrier(len(user_ids) * 2)
+
+    def worker(user_id, seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        login(client, user_id)
+        try:
+            start.wait()
+            for _ in range(15):
+                statuses.append(_vote(client, 'busy', rng.choice(['up', 'down'])).status_code)
+        except Exception as e:  # surfaced below; a thread can't fail the test itself
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(uid, n)) for n, uid in enumerate(user_ids * 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    # A vote that loses a lock race is rolled back and reported as 409, never half-applied
+    assert set(statuses) <= {200, 409}
+    assert statuses.count(200) > 0
+    _assert_consistent(post_id)
@@ -0,0 +1,106 @@
+import gzip
+
+import pytest
+from werkzeug.test import Client
+
+import compression
+from compression import CompressionMiddleware, parse_accept_encoding
+
+BODY = b'peptide research ' * 200  # ~3.4 KB, compresses well
+
+
+def _app(body=BODY, content_type='text/html; charset=utf-8', extra_headers=(), chunks=None):
+    def wsgi(environ, start_response):
+        headers = [('Content-Type', content_type), *extra_headers]
+        if chunks is None:
+            headers.append(('Content-Length', str(len(body))))
+        start_response('200 OK', headers)
+        return chunks if chunks is not None else [body]
+    return wsgi
+
+
+def _get(app, accept='gzip', min_size=1024):
+    headers = {'Accept-Encoding': accept} if accept is not None else {}
+    return Client(CompressionMiddleware(app, min_size=min_size)).get('/', headers=headers)
+
+
+@pytest.fixture(autouse=True)
+def gzip_only(monkeypatch):
+    # Tests negotiate gzip whether or not brotli is installed
+    monkeypatch.setattr(compression, 'brotli', None)
+
+
+def test_large_body_is_gzipped_with_vary():
+    resp = _get(_app())
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.headers['Vary'] == 'Accept-Encoding'
+    assert int(resp.headers['Content-Length']) == len(resp.data) < len(BODY)
+    assert gzip.decompress(resp.data) == BODY
+
+
+def test_existing_vary_is_extended():
+    resp = _get(_app(extra_headers=[('Vary', 'Cookie')]))
+    assert resp.headers['Vary'] == 'Cookie, Accept-Encoding'
+
+
+def test_body_under_threshold_is_untouched():
+    resp = _get(_app(body=b'small'))
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.data == b'small'
+
+
+@pytest.mark.parametrize('accept', [None, '', 'identity', 'gzip;q=0', 'br;q=1, gzip; q=0', 'deflate'])
+def test_no_acceptable_encoding(accept):
+    resp = _get(_app(), accept=accept)
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.data == BODY
+
+
+@pytest.mark.parametrize('accept', ['gzip', 'GZIP;q=0.5', 'deflate, gzip;q=0.1', '*'])
+def test_gzip_negotiated(accept):
+    assert _get(_app(), accept=accept).headers['Content-Encoding'] == 'gzip'
+
+
+def test_parse_accept_encoding_drops_q_zero():
+    assert parse_accept_encoding('br;q=0, gzip;q=0.8, identity;q=bad') == ['gzip']
+
+
+def test_event_stream_is_not_compressed_or_buffered():
+    chunks = [b'event: token\ndata: {}\n\n'] * 100
+    resp = _get(_app(content_type='text/event-stream', chunks=chunks))
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.data == b''.join(chunks)
+
+
+def test_already_encoded_response_is_left_alone():
+    body = gzip.compress(BODY)
+    resp = _get(_app(body=body, extra_headers=[('Content-Encoding', 'gzip')]))
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.data == body
+
+
+def test_streamed_body_is_compressed_chunk_by_chunk():
+    chunks = [BODY[i:i + 512] for i in range(0, len(BODY), 512)]
+    resp = _get(_app(chunks=chunks))
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in resp.headers
+    assert gzip.decompress(resp.data) == BODY
+
+
+def test_short_stream_gets_length_and_no_encoding():
+    resp = _get(_app(chunks=[b'a', b'b']))
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.headers['Content-Length'] == '2'
+    assert resp.data == b'ab'
+
+
+def test_head_requests_pass_through():
+    resp = Client(CompressionMiddleware(_app())).head('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in resp.headers
+
+
+def test_assistant_stream_is_sent_uncompressed(client):
+    resp = client.post('/assistant/stream', data={'message': 'hello'}, headers={'Accept-Encoding': 'gzip'})
+    assert resp.mimetype == 'text/event-stream'
+    assert 'Content-Encoding' not in resp.headers
+    assert b'event: done' in resp.data
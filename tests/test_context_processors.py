@@ -0,0 +1,85 @@
+from flask import render_template_string
+from flask_login import login_user
+
+from app import _load_favorite_product_ids
+from models import db, CartItem, FavoriteProduct
+from tests.conftest import capture_sql, login, make_product, make_user
+
+
+def _summary_queries(statements):
+    return [s for s in statements if 'cart_item' in s or 'favorite_product' in s]
+
+
+def test_anonymous_page_runs_no_cart_or_favorites_queries(client):
+    with capture_sql() as statements:
+        resp = client.get('/definitely-missing')
+    assert resp.status_code == 404
+    assert _summary_queries(statements) == []
+
+
+def test_template_that_ignores_them_runs_no_queries(app, app_ctx):
+    user = make_user()
+    with app.test_request_context('/'):
+        login_user(user)
+        with capture_sql() as statements:
+            html = render_template_string('<p>{{ 1 + 1 }}</p>')
+    assert html == '<p>2</p>'
+    assert _summary_queries(statements) == []
+
+
+def test_values_load_once_per_request(app, app_ctx):
+    user = make_user()
+    product = make_product()
+    db.session.add_all([
+        CartItem(user_id=user.id, product_id=product.id, quantity=3),
+        FavoriteProduct(user_id=user.id, product_id=product.id),
+    ])
+    db.session.commit()
+    with app.test_request_context('/'):
+        login_user(user)
+        with capture_sql() as statements:
+            html = render_template_string(
+                '{{ cart_count }} {{ cart_count }} '
+                '{% for i in range(5) %}{{ 1 if pid in favorite_product_ids else 0 }}{% endfor %}',
+                pid=product.id,
+            )
+    assert html == '3 3 11111'
+    queries = _summary_queries(statements)
+    assert len([s for s in queries if 'cart_item' in s]) == 1
+    favorites = [s for s in queries if 'favorite_product' in s]
+    assert len(favorites) == 1
+    # Only the product_id column, never whole FavoriteProduct rows
+    assert 'favorite_product.id' not in favorites[0]
+
+
+def test_logged_in_page_renders_cart_badge(client, app_ctx):
+    user = make_user()
+    product = make_product()
+    db.session.add(CartItem(user_id=user.id, product_id=product.id, quantity=2))
+    db.session.commit()
+    login(client, user.id)
+    resp = client.get('/')
+    assert resp.status_code == 200
+    assert b'2 items in cart' in resp.data
+
+
+def test_cart_badge_alone_does_not_load_favorites(app, app_ctx):
+    user = make_user()
+    product = make_product()
+    db.session.add(FavoriteProduct(user_id=user.id, product_id=product.id))
+    db.session.commit()
+    with app.test_request_context('/'):
+        login_user(user)
+        with capture_sql() as statements:
+            html = render_template_string('{{ cart_count }}')
+    assert html == '0'
+    queries = _summary_queries(statements)
+    assert len(queries) == 1
+    assert 'favorite_product' not in queries[0]
+
+
+def test_favorites_set_is_memoized(app, app_ctx):
+    user = make_user()
+    with app.test_request_context('/'):
+        login_user(user)
+        assert _load_favorite_product_ids() is _load_favorite_product_ids()
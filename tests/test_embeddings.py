@@ -0,0 +1,43 @@
+import math
+
+import pytest
+
+from embeddings import EMBEDDING_DIMENSIONS, EmbeddingProvider, HashingEmbeddingProvider
+
+
+def _cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))  # vectors are already unit length
+
+
+def test_base_provider_is_abstract():
+    with pytest.raises(TypeError):
+        EmbeddingProvider()
+
+
+def test_hashing_vectors_are_deterministic():
+    text = 'BPC-157 reconstitution with bacteriostatic water'
+    assert HashingEmbeddingProvider().embed_one(text) == HashingEmbeddingProvider().embed_one(text)
+
+
+@pytest.mark.parametrize('dimensions', [EMBEDDING_DIMENSIONS, 64])
+def test_hashing_vector_length_matches_dimensions(dimensions):
+    provider = HashingEmbeddingProvider(dimensions=dimensions)
+    vectors = provider.embed(['storage temperature', 'shipping times'])
+    assert [len(v) for v in vectors] == [dimensions, dimensions]
+
+
+def test_hashing_vectors_are_l2_normalised():
+    vec = HashingEmbeddingProvider().embed_one('How should peptides be stored after opening?')
+    assert math.isclose(math.sqrt(sum(v * v for v in vec)), 1.0, rel_tol=1e-9)
+
+
+def test_empty_text_gives_zero_vector():
+    assert not any(HashingEmbeddingProvider(dimensions=16).embed_one(''))
+
+
+def test_similar_texts_are_closer_than_unrelated_ones():
+    provider = HashingEmbeddingProvider()
+    query = provider.embed_one('how do I store peptides in the fridge')
+    similar = provider.embed_one('store peptides in the fridge after reconstitution')
+    unrelated = provider.embed_one('international shipping and customs fees')
+    assert _cosine(query, similar) > _cosine(query, unrelated)
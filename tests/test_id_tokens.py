@@ -0,0 +1,115 @@
+import base64
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from auth import GoogleAuth, IdTokenError, google_jwks, verify_id_token
+
+CLIENT_ID = 'client-123.apps.googleusercontent.com'
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _int_b64(n: int) -> str:
+    return _b64(n.to_bytes((n.bit_length() + 7) // 8, 'big'))
+
+
+@pytest.fixture(scope='module')
+def signing_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture(autouse=True)
+def stand_in_jwks(signing_key):
+    numbers = signing_key.public_key().public_numbers()
+    google_jwks.set_keys({'keys': [{'kty': 'RSA', 'kid': 'test-kid', 'alg': 'RS256',
+                                    'n': _int_b64(numbers.n), 'e': _int_b64(numbers.e)}]})
+    yield
+    google_jwks.set_keys(None)
+
+
+def _token(key, kid='test-kid', omit=(), **overrides):
+    now = int(time.time())
+    claims = {'iss': 'https://accounts.google.com', 'aud': CLIENT_ID, 'sub': '1234', 'email': 'a@example.com',
+              'email_verified': True, 'name': 'Ada', 'iat': now, 'exp': now + 3600, **overrides}
+    for name in omit:
+        del claims[name]
+    signing_input = f"{_b64(json.dumps({'alg': 'RS256', 'kid': kid}).encode())}.{_b64(json.dumps(claims).encode())}"
+    signature = key.sign(signing_input.encode(), padding.PKCS1v15(), hashes.SHA256())
+    return f'{signing_input}.{_b64(signature)}'
+
+
+def test_good_token(signing_key):
+    claims = verify_id_token(_token(signing_key), CLIENT_ID)
+    assert claims['sub'] == '1234' and claims['email'] == 'a@example.com'
+
+
+def test_audience_list_containing_client(signing_key):
+    assert verify_id_token(_token(signing_key, aud=['other', CLIENT_ID]), CLIENT_ID)['sub'] == '1234'
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'aud': 'someone-else'}, 'another client'),
+    ({'exp': int(time.time()) - 3600}, 'expired'),
+    ({'iss': 'https://evil.example.com'}, 'unexpected issuer'),
+    ({'iat': int(time.time()) + 3600}, 'in the future'),
+])
+def test_rejected_claims(signing_key, overrides, message):
+    with pytest.raises(IdTokenError, match=message):
+        verify_id_token(_token(signing_key, **overrides), CLIENT_ID)
+
+
+def test_tampered_payload(signing_key):
+    header, _, signature = _token(signing_key).split('.')
+    forged = _b64(json.dumps({'iss': 'accounts.google.com', 'aud': CLIENT_ID, 'sub': 'admin',
+                              'exp': time.time() + 3600}).encode())
+    with pytest.raises(IdTokenError, match='signature'):
+        verify_id_token(f'{header}.{forged}.{signature}', CLIENT_ID)
+
+
+def test_signed_by_another_key():
+    other = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with pytest.raises(IdTokenError, match='signature'):
+        verify_id_token(_token(other), CLIENT_ID)
+    with pytest.raises(IdTokenError, match='unknown key'):
+        verify_id_token(_token(other, kid='rotated'), CLIENT_ID)
+
+
+def test_malformed_and_wrong_algorithm(signing_key):
+    with pytest.raises(IdTokenError, match='Malformed'):
+        verify_id_token('not-a-jwt', CLIENT_ID)
+    header, payload, signature = _token(signing_key).split('.')
+    none_header = _b64(json.dumps({'alg': 'none', 'kid': 'test-kid'}).encode())
+    with pytest.raises(IdTokenError, match='algorithm'):
+        verify_id_token(f'{none_header}.{payload}.{signature}', CLIENT_ID)
+
+
+def _google_auth(monkeypatch):
+    monkeypatch.setenv('GOOGLE_CLIENT_ID', CLIENT_ID)
+    auth = GoogleAuth()
+    monkeypatch.setattr(auth, 'get_user_info', lambda access_token: {'id': 'from-userinfo'})
+    return auth
+
+
+def test_verified_token_skips_userinfo(signing_key, monkeypatch):
+    auth = _google_auth(monkeypatch)
+    info = auth.user_info_from_token({'id_token': _token(signing_key), 'access_token': 'at'})
+    assert info == {'id': '1234', 'email': 'a@example.com', 'name': 'Ada', 'picture': None}
+
+
+@pytest.mark.parametrize('claims', [{'email_verified': False}, {'email_verified': None}, {'aud': 'someone-else'}])
+def test_unverified_email_or_bad_token_falls_back_to_userinfo(signing_key, monkeypatch, claims):
+    auth = _google_auth(monkeypatch)
+    info = auth.user_info_from_token({'id_token': _token(signing_key, **claims), 'access_token': 'at'})
+    assert info == {'id': 'from-userinfo'}
+
+
+def test_missing_email_verified_is_not_trusted(signing_key, monkeypatch):
+    auth = _google_auth(monkeypatch)
+    token = _token(signing_key, omit=('email_verified',))
+    assert auth.user_info_from_token({'id_token': token, 'access_token': 'at'}) == {'id': 'from-userinfo'}
@@ -0,0 +1,51 @@
+import pytest
+
+# Metrics are a no-op without the optional dependency
+prometheus_client = pytest.importorskip('prometheus_client')
+
+TOKEN = 'scrape-secret'
+
+
+@pytest.fixture
+def metrics_token(monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', TOKEN)
+    monkeypatch.delenv('PROMETHEUS_MULTIPROC_DIR', raising=False)
+
+
+def _requests_seen(endpoint, method='GET'):
+    value = prometheus_client.REGISTRY.get_sample_value(
+        'http_request_duration_seconds_count', {'endpoint': endpoint, 'method': method})
+    return value or 0.0
+
+
+def test_not_served_without_token(client, monkeypatch):
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    assert client.get('/metrics').status_code == 404
+    assert client.get('/metrics', headers={'Authorization': 'Bearer anything'}).status_code == 404
+
+
+@pytest.mark.parametrize('authorization', [None, '', 'Bearer wrong', f'Basic {TOKEN}', f'Bearer {TOKEN}x', TOKEN])
+def test_bad_credentials_expose_nothing(client, metrics_token, authorization):
+    headers = {'Authorization': authorization} if authorization is not None else {}
+    resp = client.get('/metrics', headers=headers)
+    assert resp.status_code == 401
+    assert resp.headers['WWW-Authenticate'] == 'Bearer'
+    assert b'http_request' not in resp.data
+
+
+def test_scrape_with_token_includes_request_latency(client, metrics_token):
+    before = _requests_seen('posts')
+    assert client.get('/posts').status_code == 200
+    assert _requests_seen('posts') == before + 1
+
+    resp = client.get('/metrics', headers={'Authorization': f'Bearer {TOKEN}'})
+    assert resp.status_code == 200
+    assert resp.headers['Cache-Control'] == 'no-store'
+    assert b'http_request_duration_seconds_bucket{endpoint="posts"' in resp.data
+
+
+def test_unmatched_urls_share_one_label(client):
+    before = _requests_seen('<unmatched>')
+    client.get('/no-such-page-1')
+    client.get('/no-such-page-2')
+    assert _requests_seen('<unmatched>') == before + 2
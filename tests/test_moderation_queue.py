@@ -0,0 +1,145 @@
+import pytest
+
+import app as app_module
+from ai_client import AIUnavailable
+from app import moderate_pending
+from models import db, CommunityComment, CommunityPost
+from tests.conftest import login, make_user
+
+
+def test_published_posts_are_indexed(app_ctx, monkeypatch):
+    user = make_user()
+    clean = CommunityPost(title='Clean', slug='clean', content='hello', user_id=user.id, status='pending')
+    spam = CommunityPost(title='Spam', slug='spam', content='buy now', user_id=user.id, status='pending')
+    db.session.add_all([clean, spam])
+    db.session.flush()
+    db.session.add(CommunityComment(post_id=clean.id, user_id=user.id, content='nice', status='pending'))
+    db.session.commit()
+    clean_id = clean.id
+
+    indexed = []
+    monkeypatch.setattr(app_module, 'moderation_enabled', lambda: True)
+    monkeypatch.setattr(app_module, '_moderation_flags', lambda texts: [False, True, False])
+    monkeypatch.setattr(app_module, 'upsert_single_document', lambda kind, ref_id: indexed.append((kind, ref_id)))
+
+    assert moderate_pending() == {'published': 2, 'hidden': 1}
+    assert indexed == [('community', clean_id)]
+    assert db.session.get(CommunityPost, clean_id).comment_count == 1
+
+
+def _flag_spam(texts):
+    return ['spam' in t for t in texts]
+
+
+def _post(user_id, slug, status='pending', content='hello'):
+    post = CommunityPost(title=slug.title(), slug=slug, content=content, user_id=user_id, status=status)
+    db.session.add(post)
+    db.session.flush()
+    return post
+
+
+def _comment(post_id, user_id, content, status='pending'):
+    comment = CommunityComment(post_id=post_id, user_id=user_id, content=content, status=status)
+    db.session.add(comment)
+    db.session.flush()
+    return comment
+
+
+def test_pending_content_is_visible_to_its_author_only(app, client):
+    with app.app_context():
+        author_id = make_user('author@example.com').id
+        other_id = make_user('other@example.com').id
+        _post(author_id, 'queued-post')
+        live_id = _post(author_id, 'live-post', status='published').id
+        _comment(live_id, author_id, 'my queued comment')
+        db.session.commit()
+
+    assert client.get('/community/queued-post').status_code == 404
+    assert b'my queued comment' not in client.get('/community/live-post').data
+
+    login(client, other_id)
+    assert client.get('/community/queued-post').status_code == 404
+    assert b'my queued comment' not in client.get('/community/live-post').data
+
+    login(client, author_id)
+    assert client.get('/community/queued-post').status_code == 200
+    assert b'my queued comment' in client.get('/community/live-post').data
+
+
+def test_batch_publishes_or_hides_each_item(app_ctx, monkeypatch):
+    user_id = make_user().id
+    clean_id = _post(user_id, 'clean').id
+    spam_id = _post(user_id, 'spam', content='spam spam').id
+    live_id = _post(user_id, 'live', status='published').id
+    ok_id = _comment(live_id, user_id, 'thanks').id
+    bad_id = _comment(live_id, user_id, 'spam link').id
+    db.session.commit()
+    monkeypatch.setattr(app_module, 'moderation_enabled', lambda: True)
+    monkeypatch.setattr(app_module, '_moderation_flags', _flag_spam)
+    monkeypatch.setattr(app_module, 'AUTO_EMBED', True)
+
+    assert moderate_pending() == {'published': 2, 'hidden': 2}
+
+    db.session.expire_all()
+    statuses = {
+        'clean': db.session.get(CommunityPost, clean_id).status,
+        'spam': db.session.get(CommunityPost, spam_id).status,
+        'ok': db.session.get(CommunityComment, ok_id).status,
+        'bad': db.session.get(CommunityComment, bad_id).status,
+    }
+    assert statuses == {'clean': 'published', 'spam': 'hidden', 'ok': 'published', 'bad': 'hidden'}
+    assert db.session.get(CommunityComment, bad_id).moderated_at is not None
+    # Only the published comment counts
+    assert db.session.get(CommunityPost, live_id).comment_count == 1
+
+
+def test_provider_error_leaves_items_pending(app_ctx, monkeypatch):
+    user_id = make_user().id
+    post_id = _post(user_id, 'queued').id
+    live_id = _post(user_id, 'live', status='published').id
+    comment_id = _comment(live_id, user_id, 'hello').id
+    db.session.commit()
+
+    def unavailable(texts):
+        raise AIUnavailable('OpenAI circuit breaker is open')
+
+    monkeypatch.setattr(app_module, 'moderation_enabled', lambda: True)
+    monkeypatch.setattr(app_module, '_moderation_flags', unavailable)
+
+    with pytest.raises(AIUnavailable):
+        moderate_pending()
+
+    db.session.expire_all()
+    post, comment = db.session.get(CommunityPost, post_id), db.session.get(CommunityComment, comment_id)
+    assert (post.status, post.moderated_at) == ('pending', None)
+    assert (comment.status, comment.moderated_at) == ('pending', None)
+    assert db.session.get(CommunityPost, live_id).comment_count == 0
+
+
+def test_comments_wait_for_their_post(app_ctx, monkeypatch):
+    user_id = make_user().id
+    hidden_id = _post(user_id, 'spam-post', content='spam').id
+    later_id = _post(user_id, 'later').id
+    on_hidden = _comment(hidden_id, user_id, 'reply to hidden').id
+    on_later = _comment(later_id, user_id, 'reply to later').id
+    db.session.commit()
+    seen = []
+    monkeypatch.setattr(app_module, 'moderation_enabled', lambda: True)
+    monkeypatch.setattr(app_module, '_moderation_flags', lambda texts: seen.extend(texts) or _flag_spam(texts))
+    monkeypatch.setattr(app_module, 'AUTO_EMBED', True)
+
+    # Only the first post is claimed; the comment on the unclaimed pending post is not
+    assert moderate_pending(batch_size=1) == {'published': 0, 'hidden': 1}
+    assert 'reply to later' not in seen
+
+    db.session.expire_all()
+    # Its post was hidden in the same batch, so the comment is left pending and uncounted
+    assert db.session.get(CommunityComment, on_hidden).status == 'pending'
+    assert db.session.get(CommunityPost, hidden_id).comment_count == 0
+
+    # Once its post is published the waiting comment goes through
+    assert moderate_pending() == {'published': 2, 'hidden': 0}
+    db.session.expire_all()
+    assert db.session.get(CommunityComment, on_later).status == 'published'
+    assert db.session.get(CommunityPost, later_id).comment_count == 1
+    assert db.session.get(CommunityComment, on_hidden).status == 'pending'
@@ -0,0 +1,158 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import outbox
+from models import db, NewsletterSubscriber, OutboxMessage
+from outbox import BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS, HANDLERS, MAX_ATTEMPTS, drain_outbox, enqueue, purge_sent
+
+
+@pytest.fixture
+def delivered(monkeypatch):
+    """A 'test.ok' handler that records payloads and a 'test.down' handler that always fails."""
+    payloads = []
+
+    def down(batch):
+        raise ConnectionError('provider down')
+
+    monkeypatch.setitem(HANDLERS, 'test.ok', payloads.extend)
+    monkeypatch.setitem(HANDLERS, 'test.down', down)
+    return payloads
+
+
+def _queue(kind, payload=None, **fields):
+    msg = enqueue(kind, payload or {})
+    for name, value in fields.items():
+        setattr(msg, name, value)
+    db.session.commit()
+    return msg.id
+
+
+def test_backoff_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(outbox.random, 'uniform', lambda a, b: 1.0)
+    assert outbox._backoff(1) == BACKOFF_BASE_SECONDS
+    assert outbox._backoff(2) == BACKOFF_BASE_SECONDS * 2
+    assert outbox._backoff(3) == BACKOFF_BASE_SECONDS * 4
+    assert outbox._backoff(50) == BACKOFF_MAX_SECONDS
+
+
+def test_backoff_has_jitter():
+    delays = {outbox._backoff(1) for _ in range(20)}
+    assert len(delays) > 1
+    assert all(BACKOFF_BASE_SECONDS * 0.8 <= d <= BACKOFF_BASE_SECONDS * 1.2 for d in delays)
+
+
+def test_delivered_groups_are_marked_sent(app_ctx, delivered):
+    ids = [_queue('test.ok', {'n': n}) for n in range(3)]
+    assert drain_outbox() == {'sent': 3, 'retried': 0, 'failed': 0}
+    assert delivered == [{'n': 0}, {'n': 1}, {'n': 2}]
+    for msg_id in ids:
+        msg = db.session.get(OutboxMessage, msg_id)
+        assert (msg.status, msg.attempts, msg.last_error) == ('sent', 1, None)
+        assert msg.sent_at is not None
+
+
+def test_failure_is_retried_with_backoff(app_ctx, delivered, monkeypatch):
+    monkeypatch.setattr(outbox.random, 'uniform', lambda a, b: 1.0)
+    msg_id = _queue('test.down')
+    before = datetime.utcnow()
+
+    assert drain_outbox() == {'sent': 0, 'retried': 1, 'failed': 0}
+    msg = db.session.get(OutboxMessage, msg_id)
+    assert (msg.status, msg.attempts) == ('pending', 1)
+    assert msg.last_error == 'ConnectionError: provider down'
+    delay = (msg.available_at - before).total_seconds()
+    assert BACKOFF_BASE_SECONDS <= delay < BACKOFF_BASE_SECONDS + 5
+
+    # Not due yet
+    assert drain_outbox() == {'sent': 0, 'retried': 0, 'failed': 0}
+    assert db.session.get(OutboxMessage, msg_id).attempts == 1
+
+
+def test_max_attempts_marks_failed(app_ctx, delivered):
+    msg_id = _queue('test.down', attempts=MAX_ATTEMPTS - 1)
+    assert drain_outbox() == {'sent': 0, 'retried': 0, 'failed': 1}
+    msg = db.session.get(OutboxMessage, msg_id)
+    assert (msg.status, msg.attempts) == ('failed', MAX_ATTEMPTS)
+    assert drain_outbox() == {'sent': 0, 'retried': 0, 'failed': 0}
+
+
+def test_unknown_kind_fails_immediately(app_ctx, delivered):
+    msg_id = _queue('test.unregistered')
+    ok_id = _queue('test.ok')
+    assert drain_outbox() == {'sent': 1, 'retried': 0, 'failed': 1}
+    msg = db.session.get(OutboxMessage, msg_id)
+    assert (msg.status, msg.attempts) == ('failed', 1)
+    assert msg.last_error.startswith('LookupError')
+    assert db.session.get(OutboxMessage, ok_id).status == 'sent'
+
+
+def test_purge_sent_removes_only_old_sent_messages(app_ctx):
+    old = datetime.utcnow() - timedelta(days=30)
+    old_sent = _queue('test.ok', status='sent', sent_at=old)
+    recent_sent = _queue('test.ok', status='sent', sent_at=datetime.utcnow())
+    old_failed = _queue('test.ok', status='failed', available_at=old)
+    pending = _queue('test.ok')
+
+    assert purge_sent(days=7) == 1
+    assert db.session.get(OutboxMessage, old_sent) is None
+    assert all(db.session.get(OutboxMessage, i) for i in (recent_sent, old_failed, pending))
+
+
+class FakeHttp:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, **kwargs):
+        self.posts.append((url, kwargs))
+        return type('Resp', (), {'raise_for_status': lambda self: None})()
+
+
+def test_mailgun_members_are_upserted_in_one_request(app_ctx, monkeypatch):
+    monkeypatch.setenv('MAILGUN_API_KEY', 'key')
+    monkeypatch.setenv('MAILGUN_LIST_ADDRESS', 'news@example.com')
+    http = FakeHttp()
+    monkeypatch.setattr(outbox, 'outbox_http', lambda: http)
+    _queue('mailgun.list_member', {'address': 'a@example.com', 'name': ''})
+    _queue('mailgun.list_member', {'address': 'b@example.com', 'name': 'B'})
+    _queue('mailgun.list_member', {'address': 'a@example.com', 'name': 'A'})
+
+    assert drain_outbox()['sent'] == 3
+    [(url, kwargs)] = http.posts
+    assert url.endswith('/lists/news@example.com/members.json')
+    assert kwargs['timeout'] == outbox.HTTP_TIMEOUT
+    members = json.loads(kwargs['data']['members'])
+    assert [(m['address'], m['name']) for m in members] == [('a@example.com', 'A'), ('b@example.com', 'B')]
+
+
+def test_newsletter_subscribe_enqueues_with_the_subscriber(app, client, monkeypatch):
+    monkeypatch.setenv('MAILGUN_API_KEY', 'key')
+    monkeypatch.setenv('MAILGUN_LIST_ADDRESS', 'news@example.com')
+    monkeypatch.setattr(outbox, 'outbox_http', lambda: pytest.fail('subscribe must not call Mailgun inline'))
+
+    resp = client.post('/newsletter/subscribe', data={'email': 'New@Example.com', 'name': 'New'},
+                       headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert resp.get_json() == {'success': True}
+    with app.app_context():
+        assert NewsletterSubscriber.query.filter_by(email='new@example.com').count() == 1
+        [msg] = OutboxMessage.query.all()
+        assert (msg.kind, msg.status) == ('mailgun.list_member', 'pending')
+        assert json.loads(msg.payload) == {'address': 'new@example.com', 'name': 'New'}
+
+
+def test_failed_subscribe_commit_enqueues_nothing(app, client, monkeypatch):
+    monkeypatch.setenv('MAILGUN_API_KEY', 'key')
+    monkeypatch.setenv('MAILGUN_LIST_ADDRESS', 'news@example.com')
+
+    def broken_commit():
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(db.session, 'commit', broken_commit)
+    resp = client.post('/newsletter/subscribe', data={'email': 'new@example.com'},
+                       headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert resp.status_code == 500
+    monkeypatch.undo()
+    with app.app_context():
+        assert NewsletterSubscriber.query.count() == 0
+        assert OutboxMessage.query.count() == 0
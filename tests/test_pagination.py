@@ -0,0 +1,34 @@
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from models import Product
+from pagination import SortKey, _Explain, estimate_count, keyset_paginate
+from tests.conftest import make_product
+
+
+def test_estimate_count_is_none_off_postgres(app_ctx):
+    assert estimate_count(Product.query) is None
+
+
+def test_explain_keeps_user_input_in_bound_parameters():
+    term = "it's :word %(x)s"
+    stmt = select(Product.id).where(Product.name.ilike(f'%{term}%'))
+    compiled = _Explain(stmt).compile(dialect=postgresql.dialect())
+    assert str(compiled).startswith('EXPLAIN (FORMAT JSON) SELECT')
+    assert term not in str(compiled)
+    assert f'%{term}%' in compiled.params.values()
+
+
+def test_keyset_pages_cover_every_row_once(app_ctx):
+    for i in range(7):
+        make_product(slug=f'p{i}')
+    keys = [SortKey(Product.id, desc=True)]
+    seen, after = [], None
+    while True:
+        page = keyset_paginate(Product.query, keys, after=after, per_page=3, count='estimate', cursor_tag='t')
+        seen += [p.id for p in page]
+        assert page.total == 7 and not page.total_is_estimate
+        if not page.has_next:
+            break
+        after = page.next_cursor
+    assert seen == sorted(seen, reverse=True) and len(set(seen)) == 7
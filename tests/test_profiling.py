@@ -0,0 +1,79 @@
+from collections import Counter
+import json
+import os
+import time
+
+import pytest
+
+from profiling import SamplingProfiler
+from tests.conftest import login, make_user
+
+
+def _profiled_request(app, profiler, path='/posts', busy_s=0.05):
+    with app.test_request_context(path):
+        profiler.start_request()
+        deadline = time.perf_counter() + busy_s
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        return profiler.finish_request(200)
+
+
+def _files(directory):
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def test_slow_request_writes_a_profile(app, tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), sample_rate=0.0, slow_ms=10, interval_ms=1)
+    profile_id = _profiled_request(app, profiler)
+    assert profile_id is not None
+    assert _files(tmp_path) == [f'{profile_id}.collapsed', f'{profile_id}.json']
+
+    meta = json.loads((tmp_path / f'{profile_id}.json').read_text())
+    assert (meta['reason'], meta['path'], meta['status']) == ('slow', '/posts', 200)
+    assert meta['samples'] > 0
+    stacks = (tmp_path / f'{profile_id}.collapsed').read_text().splitlines()
+    assert any('_profiled_request (test_profiling.py' in line for line in stacks)
+    assert profiler.profile_path(profile_id) == str(tmp_path / f'{profile_id}.collapsed')
+
+
+def test_sampled_request_writes_a_profile(app, tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), sample_rate=1.0, slow_ms=60_000, interval_ms=1)
+    profile_id = _profiled_request(app, profiler)
+    assert profiler.list_profiles()[0]['id'] == profile_id
+    assert profiler.list_profiles()[0]['reason'] == 'sampled'
+
+
+def test_fast_unsampled_request_is_discarded(app, tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), sample_rate=0.0, slow_ms=60_000, interval_ms=1)
+    assert _profiled_request(app, profiler) is None
+    assert _files(tmp_path) == []
+
+
+def test_trim_keeps_newest_max_files(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), max_files=2)
+    ids = []
+    for i in range(4):
+        ids.append(profiler._write(Counter({'main;work': 1}), {'duration_ms': i}))
+        time.sleep(0.002)  # ids start with a millisecond timestamp
+    assert sorted(p['id'] for p in profiler.list_profiles()) == ids[2:]
+    assert len(_files(tmp_path)) == 4
+
+
+@pytest.mark.parametrize('profile_id', ['../../etc/passwd', 'nope', '0000000000000-zzzzzzzz'])
+def test_invalid_ids_have_no_path(tmp_path, profile_id):
+    assert SamplingProfiler(str(tmp_path)).profile_path(profile_id) is None
+
+
+def test_admin_can_download_a_profile(app, client, tmp_path, monkeypatch):
+    profiler = SamplingProfiler(str(tmp_path))
+    profile_id = profiler._write(Counter({'main;work': 3}), {'duration_ms': 1})
+    monkeypatch.setitem(app.extensions, 'profiler', profiler)
+    with app.app_context():
+        admin_id = make_user(role='admin').id
+    login(client, admin_id)
+
+    resp = client.get(f'/admin/profiles/{profile_id}')
+    assert resp.status_code == 200
+    assert resp.data == b'main;work 3\n'
+    assert f'{profile_id}.collapsed' in resp.headers['Content-Disposition']
+    assert client.get('/admin/profiles/0000000000000-00000000').status_code == 404
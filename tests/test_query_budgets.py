@@ -0,0 +1,80 @@
+"""
+Budgeted routes against seeded data. Under TESTING a view that goes over its
+@query_budget raises QueryBudgetExceeded, so an N+1 in a page or template
+fails these tests; there are enough rows that one would show.
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models import (db, CartItem, CommunityComment, CommunityPost, CommunityTag, DosageLog, FavoriteProduct,
+                    Order, OrderItem, Payment, PeptideCycle, Post, ProgressEntry)
+from query_stats import QueryBudgetExceeded
+from tests.conftest import login, make_product, make_user
+
+
+@pytest.fixture
+def seeded(app):
+    # The app context is popped again so each request gets a fresh one (and a fresh `g`)
+    with app.app_context():
+        return _seed()
+
+
+def _seed():
+    user = make_user(role='admin')
+    other = make_user(email='other@example.com')
+    products = [make_product(slug=f'peptide-{i}', name=f'Peptide {i}', description='semaglutide peptide')
+                for i in range(12)]
+    tags = [CommunityTag(name=f'tag{i}', slug=f'tag{i}') for i in range(3)]
+    now = datetime.utcnow()
+    for i in range(12):
+        db.session.add(Post(title=f'Post {i}', slug=f'post-{i}', content='peptide weight #md', author_id=user.id,
+                            status='published', created_at=now - timedelta(hours=i)))
+        post = CommunityPost(title=f'Thread {i}', slug=f'thread-{i}', content='hello peptide',
+                             user_id=(user if i % 2 else other).id, tags=tags[:1 + i % 3])
+        db.session.add(post)
+        db.session.flush()
+        for j in range(3):
+            db.session.add(CommunityComment(post_id=post.id, user_id=other.id, content=f'comment {j}'))
+    for product in products[:4]:
+        db.session.add(CartItem(user_id=user.id, product_id=product.id, quantity=2))
+        db.session.add(FavoriteProduct(user_id=user.id, product_id=product.id))
+    for i in range(4):
+        order = Order(order_number=f'ORD-{i}', user_id=user.id, total_amount=20, status='pending')
+        db.session.add(order)
+        db.session.flush()
+        for product in products[:3]:
+            db.session.add(OrderItem(order_id=order.id, product_id=product.id, quantity=1, price=10, total=10))
+        db.session.add(Payment(order_id=order.id, amount=20, payment_method='stripe', status='completed'))
+    for i in range(3):
+        cycle = PeptideCycle(user_id=user.id, product_id=products[i].id, name=f'Cycle {i}',
+                             start_date=date.today() - timedelta(days=30))
+        db.session.add(cycle)
+        db.session.flush()
+        for d in range(4):
+            db.session.add(DosageLog(cycle_id=cycle.id, dosage_amount=1, injection_time=now - timedelta(days=d)))
+            db.session.add(ProgressEntry(cycle_id=cycle.id, entry_date=date.today() - timedelta(days=d), weight=80))
+    db.session.commit()
+    return {'user_id': user.id, 'order_number': 'ORD-0', 'payment_id': Payment.query.first().id}
+
+
+BUDGETED_PAGES = [
+    '/', '/posts', '/posts/post-1', '/search?q=peptide', '/community', '/community?sort=top',
+    '/community?sort=hot', '/community?tag=tag0', '/community/thread-1', '/peptides', '/peptides/peptide-1',
+    '/favorites', '/cart', '/orders', '/orders/{order_number}', '/payments', '/payments/{payment_id}', '/tracker',
+]
+
+
+@pytest.mark.parametrize('path', BUDGETED_PAGES)
+def test_budgeted_page_stays_within_budget(client, seeded, path):
+    login(client, seeded['user_id'])
+    resp = client.get(path.format(**seeded))
+    assert resp.status_code == 200
+
+
+def test_going_over_budget_fails_under_testing(app, client, seeded, monkeypatch):
+    monkeypatch.setattr(app.view_functions['cart'], 'query_budget', 1)
+    login(client, seeded['user_id'])
+    with pytest.raises(QueryBudgetExceeded, match='cart ran'):
+        client.get('/cart')
@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask_login import user_logged_in
+
+import app as app_module
+import server_sessions
+from server_sessions import (
+    DatabaseSessionBackend, MemorySessionBackend, ServerSessionInterface, _rotate_session_id,
+    init_server_sessions,
+)
+
+
+class RecordingBackend:
+    """Counts writes to the wrapped backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.saves = []
+
+    def save(self, sid, payload, expires_at):
+        self.saves.append(sid)
+        self.backend.save(sid, payload, expires_at)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+@pytest.fixture(params=['memory', 'database'])
+def store(request, app, monkeypatch):
+    backend = RecordingBackend(MemorySessionBackend() if request.param == 'memory' else DatabaseSessionBackend())
+    monkeypatch.setenv('SESSION_BACKEND', request.param)
+    monkeypatch.setenv('SESSION_TTL', '3600')
+    monkeypatch.setattr(server_sessions, '_make_backend', lambda name: backend)
+    monkeypatch.setattr(app, 'session_interface', app.session_interface)
+    interface = init_server_sessions(app)
+    assert isinstance(interface, ServerSessionInterface)
+    yield backend
+    user_logged_in.disconnect(_rotate_session_id, app)
+    app.cli.commands.pop('cleanup-sessions', None)
+
+
+def _sid(app, client):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    if cookie is None:
+        return None
+    return app.session_interface._signer(app).unsign(cookie.value).decode()
+
+
+def _stored(app, store, sid):
+    with app.app_context():
+        record = store.load(sid)
+    return app.session_interface.serializer.loads(record[0]) if record else None
+
+
+def test_cookie_holds_only_the_session_id(app, client, store):
+    client.get('/?utm_source=newsletter&utm_campaign=spring', headers={'Referer': 'https://example.org/'})
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+    assert 'newsletter' not in cookie and len(cookie) < 100
+
+    sid = _sid(app, client)
+    assert store.saves == [sid]
+    data = _stored(app, store, sid)
+    assert data['utm'] == {'utm_source': 'newsletter', 'utm_campaign': 'spring'}
+    assert data['referrer'] == 'https://example.org/'
+    assert data['utm_captured'] is True
+
+
+def test_views_that_store_nothing_set_no_cookie(client, store):
+    resp = client.get('/robots.txt')
+    assert 'Set-Cookie' not in resp.headers
+    assert store.saves == []
+
+
+def test_first_touch_is_kept(app, client, store):
+    # A direct visit saves the session (CSRF token) and marks first touch with it
+    client.get('/')
+    sid = _sid(app, client)
+    assert _stored(app, store, sid)['utm_captured'] is True
+
+    client.get('/?utm_source=later', headers={'Referer': 'https://example.org/'})
+    data = _stored(app, store, sid)
+    assert 'utm' not in data and 'referrer' not in data
+    writes = len(store.saves)
+    client.get('/?utm_source=later')
+    assert len(store.saves) == writes
+
+
+def test_store_written_only_when_modified_or_stale(app, client, store):
+    client.get('/?utm_source=newsletter')
+    sid = _sid(app, client)
+
+    # Read-only views neither write nor re-set the cookie
+    for path in ('/', '/?utm_source=later', '/products'):
+        assert 'Set-Cookie' not in client.get(path).headers
+    assert store.saves == [sid]
+    # First touch wins
+    assert _stored(app, store, sid)['utm'] == {'utm_source': 'newsletter'}
+
+    # Less than half the TTL left: the expiry slides forward under the same id
+    with app.app_context():
+        store.backend.save(sid, store.load(sid)[0], datetime.utcnow() + timedelta(minutes=10))
+    client.get('/')
+    assert store.saves == [sid, sid]
+    with app.app_context():
+        assert store.load(sid)[1] > datetime.utcnow() + timedelta(minutes=50)
+    assert _sid(app, client) == sid
+
+
+@pytest.mark.parametrize('path', ['/static/style.css?utm_source=x', '/assets/missing.css?utm_source=x'])
+def test_static_responses_set_no_cookie(app, client, store, path):
+    resp = client.get(path)
+    assert 'Set-Cookie' not in resp.headers
+    assert store.saves == []
+
+    client.get('/?utm_source=newsletter')
+    resp = client.get(path)
+    assert 'Set-Cookie' not in resp.headers
+    assert 'Cookie' not in resp.vary
+    assert len(store.saves) == 1
+
+
+def test_session_id_rotates_on_login(app, client, store, monkeypatch):
+    monkeypatch.setattr(app_module.google_auth, 'get_token', lambda code: {'id_token': 'token'})
+    monkeypatch.setattr(app_module.google_auth, 'user_info_from_token', lambda token_response: {
+        'id': 'google-1', 'name': 'New User', 'email': 'new@example.com',
+    })
+    client.get('/?utm_source=newsletter')
+    before = _sid(app, client)
+
+    assert client.get('/authorize?code=abc').status_code == 302
+    after = _sid(app, client)
+    assert after != before
+    assert _stored(app, store, before) is None
+    data = _stored(app, store, after)
+    assert data['_user_id'] and data['utm'] == {'utm_source': 'newsletter'}
+
+
+def test_expired_sessions_are_ignored_and_cleaned_up(app, client, store):
+    interface = app.session_interface
+    now = datetime.utcnow()
+    with app.app_context():
+        store.save('expired', interface.serializer.dumps({'utm_captured': True}), now - timedelta(seconds=1))
+        store.save('live', interface.serializer.dumps({'utm_captured': True}), now + timedelta(hours=1))
+
+    client.set_cookie(app.config['SESSION_COOKIE_NAME'], interface._signer(app).sign('expired').decode())
+    client.get('/?utm_source=newsletter')
+    assert _sid(app, client) not in ('expired', None)
+
+    # Purged once the cleanup interval has elapsed, and not again before the next one
+    interface._next_cleanup = 0
+    with app.app_context():
+        interface._maybe_cleanup(datetime.utcnow())
+        assert store.load('expired') is None
+        assert store.load('live') is not None
+        store.save('expired-2', interface.serializer.dumps({}), now - timedelta(seconds=1))
+        interface._maybe_cleanup(datetime.utcnow())
+        assert store.load('expired-2') is not None
+
+
+def test_cleanup_sessions_command(app, store):
+    interface = app.session_interface
+    now = datetime.utcnow()
+    with app.app_context():
+        for sid in ('old-1', 'old-2'):
+            store.save(sid, interface.serializer.dumps({}), now - timedelta(seconds=1))
+        store.save('live', interface.serializer.dumps({}), now + timedelta(hours=1))
+
+    result = app.test_cli_runner().invoke(args=['cleanup-sessions'])
+    assert result.output.strip() == 'Removed 2 expired sessions'
+    with app.app_context():
+        assert store.load('live') is not None
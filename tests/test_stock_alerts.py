@@ -0,0 +1,148 @@
+import pytest
+
+from models import db, OutboxMessage, Product, StockAlert
+from outbox import HANDLERS, drain_outbox, enqueue
+from stock_alerts import FakeTransport, dispatch_stock_alerts, set_mail_transport
+from tests.conftest import make_product
+
+
+@pytest.fixture
+def transport():
+    transport = FakeTransport()
+    set_mail_transport(transport)
+    yield transport
+    set_mail_transport(None)
+
+
+class FlakyTransport(FakeTransport):
+    """Fails the `fail_on`-th send (1-based)."""
+
+    def __init__(self, fail_on):
+        super().__init__()
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def send_batch(self, recipients, subject, text):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise ConnectionError('provider down')
+        super().send_batch(recipients, subject, text)
+
+
+def _sold_out_product_with_alerts(count, slug='bpc-157'):
+    product = make_product(slug=slug, stock_quantity=0)
+    db.session.add_all([StockAlert(product_id=product.id, email=f'buyer{i}@example.com', active=True)
+                        for i in range(count)])
+    db.session.commit()
+    return product
+
+
+def _dispatches():
+    return OutboxMessage.query.filter_by(kind='stock_alert.dispatch').all()
+
+
+def _recipients(transport):
+    return [r for message in transport.sent for r in message['to']]
+
+
+def test_restock_enqueues_one_dispatch(app_ctx):
+    product = _sold_out_product_with_alerts(2)
+    product.stock_quantity = 5
+    db.session.commit()
+    # Positive -> positive is not a restock; the expired attribute is compared with the stored value
+    product.stock_quantity = 8
+    db.session.commit()
+    messages = _dispatches()
+    assert len(messages) == 1
+    assert messages[0].payload == f'{{"product_id": {product.id}}}'
+
+
+def test_rolled_back_restock_enqueues_nothing(app_ctx):
+    product = _sold_out_product_with_alerts(2)
+    product.stock_quantity = 5
+    db.session.flush()
+    db.session.rollback()
+    assert _dispatches() == []
+
+
+def test_dispatch_sends_in_batches_and_deactivates(app_ctx, transport):
+    product = _sold_out_product_with_alerts(5)
+    product.stock_quantity = 5
+    db.session.commit()
+    stats = dispatch_stock_alerts(product.id, batch_size=2)
+    assert (stats['batches'], stats['alerts'], stats['sent']) == (3, 5, 5)
+    assert [len(m['to']) for m in transport.sent] == [2, 2, 1]
+    assert StockAlert.query.filter_by(active=True).count() == 0
+    assert StockAlert.query.filter(StockAlert.notified_at.is_(None)).count() == 0
+
+
+def test_failed_batch_stays_active_and_sent_batches_are_not_resent(app_ctx):
+    product = _sold_out_product_with_alerts(5)
+    product.stock_quantity = 5
+    db.session.commit()
+
+    flaky = FlakyTransport(fail_on=2)
+    set_mail_transport(flaky)
+    try:
+        with pytest.raises(ConnectionError):
+            dispatch_stock_alerts(product.id, batch_size=2)
+        db.session.expire_all()
+        assert StockAlert.query.filter_by(active=True).count() == 3
+
+        # The outbox retry picks up where the failure left off
+        dispatch_stock_alerts(product.id, batch_size=2)
+    finally:
+        set_mail_transport(None)
+    recipients = _recipients(flaky)
+    assert sorted(recipients) == sorted(f'buyer{i}@example.com' for i in range(5))
+    assert len(recipients) == len(set(recipients))
+
+
+def test_walk_stops_when_product_sells_out(app_ctx):
+    product = _sold_out_product_with_alerts(5)
+    product.stock_quantity = 1
+    db.session.commit()
+    product_id = product.id
+
+    class SellOutTransport(FakeTransport):
+        def send_batch(self, recipients, subject, text):
+            super().send_batch(recipients, subject, text)
+            with db.engine.begin() as conn:
+                conn.execute(Product.__table__.update().where(Product.__table__.c.id == product_id)
+                             .values(stock_quantity=0))
+
+    set_mail_transport(SellOutTransport())
+    try:
+        stats = dispatch_stock_alerts(product_id, batch_size=2)
+    finally:
+        set_mail_transport(None)
+    assert stats['batches'] == 1
+    db.session.expire_all()
+    assert StockAlert.query.filter_by(active=True).count() == 3
+
+
+def test_drain_with_mixed_kinds_keeps_every_outcome(app_ctx, transport, monkeypatch):
+    delivered = []
+    monkeypatch.setitem(HANDLERS, 'test.noop', delivered.extend)
+    without_alerts = make_product(slug='tb-500', stock_quantity=0)
+    with_alerts = _sold_out_product_with_alerts(3)
+    enqueue('test.noop', {'n': 1})
+    db.session.commit()
+    # The restock with nothing to notify is dispatched first: its walk ends straight away
+    without_alerts.stock_quantity = 4
+    db.session.commit()
+    with_alerts.stock_quantity = 4
+    enqueue('unknown.kind', {})
+    db.session.commit()
+
+    assert drain_outbox() == {'sent': 3, 'retried': 0, 'failed': 1}
+    db.session.expire_all()
+    statuses = [(m.kind, m.status, m.attempts) for m in OutboxMessage.query.all()]
+    assert sorted(statuses) == [('stock_alert.dispatch', 'sent', 1), ('stock_alert.dispatch', 'sent', 1),
+                                ('test.noop', 'sent', 1), ('unknown.kind', 'failed', 1)]
+    assert len(_recipients(transport)) == 3
+
+    # Nothing is claimed, delivered or sent again
+    assert drain_outbox() == {'sent': 0, 'retried': 0, 'failed': 0}
+    assert delivered == [{'n': 1}]
+    assert len(_recipients(transport)) == 3
@@ -0,0 +1,114 @@
+import pytest
+
+import summary_cache as summary_module
+from models import db, CartItem, FavoriteProduct, Order
+from summary_cache import KEY_PREFIX, MemorySummaryBackend, compute_user_summary, get_user_summary, summary_cache
+from tests.conftest import login, make_product, make_user
+
+
+@pytest.fixture
+def memory_backend(monkeypatch):
+    backend = MemorySummaryBackend()
+    monkeypatch.setattr(summary_cache, 'backend', backend)
+    return backend
+
+
+@pytest.fixture
+def shopper(app_ctx, client):
+    user = make_user()
+    products = [make_product(slug='bpc-157', price=10), make_product(slug='tb-500', price=25, sale_price=20)]
+    db.session.add(CartItem(user_id=user.id, product_id=products[0].id, quantity=1))
+    db.session.commit()
+    login(client, user.id)
+    # Prime the cache, so each test checks the write-through rather than a first computation
+    summary_cache.refresh(user.id)
+    return user.id, [p.id for p in products]
+
+
+def _assert_cached_matches_db(backend, user_id):
+    db.session.expire_all()
+    cached = backend.get(f'{KEY_PREFIX}{user_id}')
+    assert cached == compute_user_summary(user_id)
+    return cached
+
+
+def test_add_to_cart_writes_through(client, memory_backend, shopper):
+    user_id, (bpc, tb) = shopper
+    client.post('/cart/add', data={'product_id': tb, 'quantity': 2})
+    cached = _assert_cached_matches_db(memory_backend, user_id)
+    assert (cached['cart_count'], cached['cart_total']) == (3, '50.00')
+
+
+def test_update_cart_writes_through(client, memory_backend, shopper):
+    user_id, _ = shopper
+    item_id = CartItem.query.filter_by(user_id=user_id).one().id
+    resp = client.post('/cart/update', data={'item_id': item_id, 'quantity': 4})
+    assert resp.get_json()['cart_count'] == 4
+    assert _assert_cached_matches_db(memory_backend, user_id)['cart_total'] == '40.00'
+
+
+def test_update_to_zero_removes_and_writes_through(client, memory_backend, shopper):
+    user_id, _ = shopper
+    item_id = CartItem.query.filter_by(user_id=user_id).one().id
+    assert client.post('/cart/update', data={'item_id': item_id, 'quantity': 0}).get_json()['removed']
+    assert _assert_cached_matches_db(memory_backend, user_id)['cart_count'] == 0
+
+
+def test_remove_from_cart_writes_through(client, memory_backend, shopper):
+    user_id, _ = shopper
+    item_id = CartItem.query.filter_by(user_id=user_id).one().id
+    client.post(f'/cart/remove/{item_id}')
+    assert _assert_cached_matches_db(memory_backend, user_id)['cart_total'] == '0.00'
+
+
+def test_checkout_empties_cached_cart(client, memory_backend, shopper):
+    user_id, _ = shopper
+    resp = client.post('/checkout', data={'shipping_name': 'Ada', 'shipping_address': '1 Main St'})
+    assert resp.status_code == 302 and '/orders/' in resp.headers['Location']
+    assert Order.query.filter_by(user_id=user_id).count() == 1
+    assert CartItem.query.filter_by(user_id=user_id).count() == 0
+    assert _assert_cached_matches_db(memory_backend, user_id)['cart_count'] == 0
+
+
+def test_toggle_favorite_writes_through(client, memory_backend, shopper):
+    user_id, (bpc, tb) = shopper
+    client.post('/favorites/toggle', data={'product_id': tb})
+    assert _assert_cached_matches_db(memory_backend, user_id)['favorite_product_ids'] == [tb]
+    client.post('/favorites/toggle', data={'product_id': tb})
+    assert _assert_cached_matches_db(memory_backend, user_id)['favorite_product_ids'] == []
+
+
+def test_pages_read_the_cached_summary(client, memory_backend, shopper):
+    user_id, _ = shopper
+    # A stale entry is what the badge shows until it expires or is refreshed
+    memory_backend.set(f'{KEY_PREFIX}{user_id}', {**compute_user_summary(user_id), 'cart_count': 7}, 60)
+    assert b'7 items in cart' in client.get('/').data
+
+
+class BrokenBackend:
+    def get(self, key):
+        raise ConnectionError('redis down')
+
+    set = delete = get
+
+
+def test_backend_errors_fall_back_to_the_database(app_ctx, monkeypatch):
+    monkeypatch.setattr(summary_cache, 'backend', BrokenBackend())
+    user = make_user()
+    product = make_product()
+    db.session.add_all([CartItem(user_id=user.id, product_id=product.id, quantity=2),
+                        FavoriteProduct(user_id=user.id, product_id=product.id)])
+    db.session.commit()
+    expected = {'cart_count': 2, 'cart_total': '20.00', 'favorite_product_ids': [product.id]}
+    assert get_user_summary(user.id) == expected
+    assert summary_module.refresh_user_summary(user.id) == expected
+    assert summary_module.get_cart_count(user.id) == 2
+    summary_cache.invalidate(user.id)
+
+
+def test_memory_backend_expires_entries(monkeypatch):
+    backend = MemorySummaryBackend()
+    backend.set('k', {'v': 1}, ttl=10)
+    now = summary_module.time.monotonic()
+    monkeypatch.setattr(summary_module.time, 'monotonic', lambda: now + 11)
+    assert backend.get('k') is None
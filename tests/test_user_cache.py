@@ -0,0 +1,104 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import auth
+from auth import CachedUser, USER_SNAPSHOT_FIELDS, create_or_update_user, load_user, user_cache
+from models import db, Order, User
+from tests.conftest import capture_sql, login, make_user
+
+USER_SELECT = re.compile(r'FROM "?user"?\s+WHERE "?user"?\.id', re.IGNORECASE)
+
+
+def _user_selects(statements):
+    return [s for s in statements if USER_SELECT.search(s)]
+
+
+def test_no_user_select_within_ttl(app, client):
+    with app.app_context():
+        user_id = make_user().id
+    login(client, user_id)
+
+    with capture_sql() as first:
+        assert client.get('/').status_code == 200
+    with capture_sql() as later:
+        for _ in range(3):
+            assert client.get('/').status_code == 200
+    assert len(_user_selects(first)) == 1
+    assert _user_selects(later) == []
+
+
+def test_entry_expires_after_ttl(app_ctx, monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(auth, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    user_id = make_user().id
+    user_cache.get(user_id)
+
+    clock.now += user_cache.ttl - 1
+    with capture_sql() as statements:
+        user_cache.get(user_id)
+    assert _user_selects(statements) == []
+
+    clock.now += 2
+    with capture_sql() as statements:
+        user_cache.get(user_id)
+    assert len(_user_selects(statements)) == 1
+
+
+def test_role_commit_invalidates(app_ctx):
+    user = make_user()
+    assert user_cache.get(user.id)['role'] == 'student'
+
+    user.role = 'admin'
+    db.session.commit()
+    assert user.id not in user_cache._data
+    assert user_cache.get(user.id)['role'] == 'admin'
+
+
+def test_create_or_update_user_invalidates(app_ctx):
+    user_id = make_user(google_id='google-1', name='Old Name').id
+    assert user_cache.get(user_id)['name'] == 'Old Name'
+
+    create_or_update_user({'id': 'google-1', 'name': 'New Name', 'email': 'user@example.com'})
+    assert user_cache.get(user_id)['name'] == 'New Name'
+
+
+def test_rollback_keeps_entry(app_ctx):
+    user = make_user()
+    user_id = user.id
+    cached = user_cache.get(user_id)
+
+    user.role = 'admin'
+    db.session.flush()
+    db.session.rollback()
+    assert user_cache._data[user_id][1] is cached
+    assert 'changed_user_ids' not in db.session().info
+
+    # A later, unrelated commit doesn't drop it either
+    db.session.add(Order(user_id=user_id, order_number='ORD-1', total_amount=10))
+    db.session.commit()
+    assert user_cache._data[user_id][1] is cached
+    assert user_cache.get(user_id)['role'] == 'student'
+
+
+def test_other_attributes_load_through_db_user(app, client):
+    with app.app_context():
+        user_id = make_user().id
+        db.session.add(Order(user_id=user_id, order_number='ORD-1', total_amount=10))
+        db.session.commit()
+
+    with app.test_request_context('/'):
+        cached = load_user(str(user_id))
+        assert isinstance(cached, CachedUser)
+        assert 'updated_at' not in USER_SNAPSHOT_FIELDS
+        assert cached._db_user is None
+
+        expected = db.session.get(User, user_id)
+        assert cached.updated_at == expected.updated_at
+        assert [o.order_number for o in cached.orders] == ['ORD-1']
+        assert cached.db_user is expected
+        assert cached == expected
+
+        with pytest.raises(AttributeError):
+            cached._missing
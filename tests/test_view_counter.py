@@ -0,0 +1,88 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import view_counter as view_counter_module
+from models import db, CommunityPost, Post
+from tests.conftest import capture_sql, make_user
+from view_counter import ViewCounter, view_counter
+
+EDITED_AT = datetime(2026, 1, 2, 3, 4, 5)
+
+
+def _posts():
+    user = make_user()
+    post = Post(title='Post', slug='post-1', content='peptide', author_id=user.id, status='published',
+                view_count=10, updated_at=EDITED_AT)
+    thread = CommunityPost(title='Thread', slug='thread-1', content='hello', user_id=user.id, view_count=None,
+                           updated_at=EDITED_AT)
+    db.session.add_all([post, thread])
+    db.session.commit()
+    return post.id, thread.id
+
+
+def test_detail_pages_write_nothing(app, client):
+    # Seeded in its own app context so each request gets a fresh one (and a fresh `g`)
+    with app.app_context():
+        post_id, thread_id = _posts()
+    with capture_sql() as statements:
+        for _ in range(3):
+            assert client.get('/posts/post-1').status_code == 200
+        assert client.get('/community/thread-1').status_code == 200
+    writes = [s for s in statements if s.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))]
+    assert writes == []
+    assert view_counter.pending('post', post_id) == 3
+    assert view_counter.pending('community', thread_id) == 1
+
+
+def test_flush_applies_batched_counts_and_keeps_updated_at(app_ctx):
+    post_id, thread_id = _posts()
+    counter = ViewCounter(interval=3600)
+    for _ in range(3):
+        counter.incr('post', post_id)
+    counter.incr('community', thread_id, n=2)
+    counter.incr('unknown', 1)
+
+    with capture_sql() as statements:
+        assert counter.flush() == 5
+    assert len([s for s in statements if s.lstrip().upper().startswith('UPDATE')]) == 2
+
+    db.session.expire_all()
+    post, thread = db.session.get(Post, post_id), db.session.get(CommunityPost, thread_id)
+    assert (post.view_count, thread.view_count) == (13, 2)
+    assert post.updated_at == thread.updated_at == EDITED_AT
+
+
+def test_pending_is_cleared_after_flush(app_ctx):
+    post_id, _ = _posts()
+    counter = ViewCounter(interval=3600)
+    counter.incr('post', post_id, n=4)
+    assert counter.pending('post', post_id) == 4
+    counter.flush()
+    assert counter.pending('post', post_id) == 0
+    assert counter.flush() == 0
+
+
+class _BrokenEngine:
+    def begin(self):
+        raise ConnectionError('database is down')
+
+
+def test_failed_flush_requeues_within_max_pending(app_ctx, monkeypatch):
+    counter = ViewCounter(interval=3600, max_pending=5)
+    for ref_id in range(1, 5):
+        counter.incr('post', ref_id, n=ref_id)
+    monkeypatch.setattr(view_counter_module, 'db', SimpleNamespace(engine=_BrokenEngine()))
+
+    assert counter.flush() == 0
+    assert [counter.pending('post', i) for i in range(1, 5)] == [1, 2, 3, 4]
+
+    # Views keep arriving while the database is down: existing keys accumulate,
+    # re-queued counts never push the buffer past max_pending keys
+    counter.incr('post', 1)
+    for ref_id in range(10, 20):
+        with counter._lock:
+            counter._pending[('post', ref_id)] += 1
+    assert len(counter._pending) == 14
+    assert counter.flush() == 0
+    assert counter.pending('post', 1) == 2
+    assert len(counter._pending) == counter.max_pending
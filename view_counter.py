@@ -0,0 +1,145 @@
+"""
+Buffered view-count aggregation.
+
+Detail pages call `view_counter.incr('post', post.id)` instead of bumping
+``view_count`` and committing on every GET. Increments are kept in memory per
+worker and a background thread flushes them every VIEW_COUNT_FLUSH_INTERVAL
+seconds with one ``UPDATE ... SET view_count = view_count + CASE id ... END``
+per table. Pending counts are also flushed at interpreter exit (graceful
+gunicorn restarts), so a hard kill loses at most one interval of views.
+
+The flush goes through a Core connection rather than the ORM session, so it
+does not touch ``updated_at`` or trigger the auto-embed session hooks.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+
+from sqlalchemy import case, func
+
+from models import db, Post, CommunityPost
+
+logger = logging.getLogger(__name__)
+
+MODELS = {
+    'post': Post,
+    'community': CommunityPost,
+}
+# Keep each UPDATE's IN list / CASE reasonably sized
+FLUSH_CHUNK_SIZE = 500
+
+
+class ViewCounter:
+    def __init__(self, app=None, interval: float = 10.0, max_pending: int = 5000):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = float(os.getenv('VIEW_COUNT_FLUSH_INTERVAL', self.interval))
+        self.max_pending = int(os.getenv('VIEW_COUNT_MAX_PENDING', self.max_pending))
+        app.extensions['view_counter'] = self
+        atexit.register(self._flush_at_exit)
+
+    def incr(self, kind: str, ref_id: int, n: int = 1):
+        """Record n views for (kind, ref_id); never touches the database."""
+        if kind not in MODELS or not ref_id:
+            return
+        with self._lock:
+            self._pending[(kind, ref_id)] += n
+            too_many = len(self._pending) >= self.max_pending
+        self._ensure_thread()
+        if too_many:
+            self._wake.set()
+
+    def pending(self, kind: str, ref_id: int) -> int:
+        """Views recorded for (kind, ref_id) that have not been flushed yet."""
+        with self._lock:
+            return self._pending.get((kind, ref_id), 0)
+
+    def flush(self) -> int:
+        """Write pending increments to the database; returns the number of views flushed."""
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+        if not batch:
+            return 0
+
+        by_kind = {}
+        for (kind, ref_id), n in batch.items():
+            by_kind.setdefault(kind, {})[ref_id] = n
+
+        flushed = 0
+        try:
+            with db.engine.begin() as conn:
+                for kind, counts in by_kind.items():
+                    table = MODELS[kind].__table__
+                    ids = sorted(counts)
+                    for start in range(0, len(ids), FLUSH_CHUNK_SIZE):
+                        chunk = {i: counts[i] for i in ids[start:start + FLUSH_CHUNK_SIZE]}
+                        conn.execute(
+                            table.update()
+                            .where(table.c.id.in_(list(chunk)))
+                            .values(
+                                view_count=func.coalesce(table.c.view_count, 0) + case(chunk, value=table.c.id, else_=0),
+                                # Views are not content changes; keep updated_at as-is
+                                updated_at=table.c.updated_at,
+                            )
+                        )
+                        flushed += sum(chunk.values())
+        except Exception:
+            logger.exception('View count flush failed; re-queueing %d keys', len(batch))
+            with self._lock:
+                # Put counts back, but stay bounded (max_pending keys) if the DB is down for a while
+                room = self.max_pending - len(self._pending)
+                for key, n in batch.items():
+                    if key in self._pending:
+                        self._pending[key] += n
+                    elif room > 0:
+                        self._pending[key] = n
+                        room -= 1
+            return 0
+        return flushed
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, so track the owning pid
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='view-counter-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception('View count flush loop error')
+
+    def _flush_at_exit(self):
+        if self.app is None or self._pid != os.getpid():
+            return
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception:
+            pass
+
+
+view_counter = ViewCounter()